@@ -2,6 +2,7 @@ from dotenv import load_dotenv
 from flask import Flask
 from flask_cors import CORS
 import os
+import tempfile
 
 
 load_dotenv()
@@ -13,13 +14,115 @@ def create_app():
     
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-key-for-hackathon')
     app.config['UPLOAD_FOLDER'] = os.path.join(app.static_folder, 'uploads')
-    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
-    
+    app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # Per request
+
+    # Processed documents: where their JSON is saved and how many parsed
+    # documents each process keeps in memory
+    app.config['DOCUMENT_DIR'] = os.getenv(
+        'DOCUMENT_DIR', os.path.join(tempfile.gettempdir(), 'studyflow'))
+    app.config['DOCUMENT_CACHE_SIZE'] = int(os.getenv('DOCUMENT_CACHE_SIZE', 64))
+    # Per-document lock files shared by all workers
+    app.config['DOCUMENT_LOCK_DIR'] = os.getenv(
+        'DOCUMENT_LOCK_DIR', os.path.join(tempfile.gettempdir(), 'studyflow', 'locks'))
+    # 'json' keeps one file per document; 'sqlite' keeps a row per page in
+    # DOCUMENT_DB_PATH (import existing files with
+    # python -m app.utils.sqlite_document_store)
+    app.config['DOCUMENT_STORE_BACKEND'] = os.getenv('DOCUMENT_STORE_BACKEND', 'json').lower()
+    app.config['DOCUMENT_DB_PATH'] = os.getenv(
+        'DOCUMENT_DB_PATH', os.path.join(app.config['DOCUMENT_DIR'], 'documents.sqlite3'))
+
+    # Index of the local file of each document, kept in UPLOAD_FOLDER/<first
+    # two characters of the ID>/
+    app.config['LOCAL_FILE_INDEX_PATH'] = os.getenv(
+        'LOCAL_FILE_INDEX_PATH', os.path.join(app.config['DOCUMENT_DIR'], 'local_files.sqlite3'))
+
+    # Resumable uploads: files up to MAX_UPLOAD_SIZE are sent in chunks of
+    # UPLOAD_CHUNK_SIZE (which must fit in MAX_CONTENT_LENGTH) and written
+    # straight to UPLOAD_SESSION_DIR
+    app.config['MAX_UPLOAD_SIZE'] = int(os.getenv('MAX_UPLOAD_SIZE', 200 * 1024 * 1024))
+    app.config['UPLOAD_CHUNK_SIZE'] = int(os.getenv('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+    app.config['UPLOAD_SESSION_DIR'] = os.getenv(
+        'UPLOAD_SESSION_DIR', os.path.join(tempfile.gettempdir(), 'studyflow', 'upload_sessions'))
+
+    # PDF extraction: number of worker processes and the page count at which
+    # extraction switches from serial to the process pool
+    app.config['PDF_EXTRACTION_WORKERS'] = int(os.getenv('PDF_EXTRACTION_WORKERS', os.cpu_count() or 1))
+    app.config['PDF_PARALLEL_MIN_PAGES'] = int(os.getenv('PDF_PARALLEL_MIN_PAGES', 16))
+
+    # Extracted page text cache, keyed by page content hash (0 disables it)
+    app.config['PAGE_CACHE_DIR'] = os.getenv(
+        'PAGE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'studyflow', 'page_cache'))
+    app.config['PAGE_CACHE_MAX_BYTES'] = int(os.getenv('PAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+
+    # Lazy extraction: PDFs with at least this many pages (0 disables it) only
+    # record their page count at upload; pages are extracted as they are read,
+    # along with this many pages of read-ahead
+    app.config['LAZY_EXTRACTION_MIN_PAGES'] = int(os.getenv('LAZY_EXTRACTION_MIN_PAGES', 100))
+    app.config['LAZY_READAHEAD_PAGES'] = int(os.getenv('LAZY_READAHEAD_PAGES', 3))
+
+    # OCR: size of the shared OCR process pool and the longest image side
+    # (in pixels) images are downscaled to before Tesseract runs
+    app.config['OCR_WORKERS'] = int(os.getenv('OCR_WORKERS', os.cpu_count() or 1))
+    app.config['OCR_MAX_SIDE'] = int(os.getenv('OCR_MAX_SIDE', 2000))
+    # OCR the scans of PDF pages that have no text layer
+    app.config['PDF_OCR_FALLBACK'] = os.getenv('PDF_OCR_FALLBACK', 'true').lower() == 'true'
+
+    # Where uploads are stored: 'gcs' (the default when GOOGLE_CLOUD_BUCKET is
+    # set) or 'local', a directory standing in for the bucket that needs no
+    # credentials and serves signed URLs from /api/storage
+    app.config['STORAGE_BACKEND'] = os.getenv('STORAGE_BACKEND', '').lower() or None
+    app.config['LOCAL_STORAGE_DIR'] = os.getenv(
+        'LOCAL_STORAGE_DIR', os.path.join(tempfile.gettempdir(), 'studyflow-storage'))
+
     # Google Cloud Storage Configuration
     app.config['GOOGLE_CLOUD_PROJECT'] = os.getenv('GOOGLE_CLOUD_PROJECT')
     app.config['GOOGLE_CLOUD_BUCKET'] = os.getenv('GOOGLE_CLOUD_BUCKET')
     app.config['GOOGLE_APPLICATION_CREDENTIALS'] = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
+    # Connections each worker keeps open to Cloud Storage for reuse
+    app.config['GCS_HTTP_POOL_SIZE'] = int(os.getenv('GCS_HTTP_POOL_SIZE', 32))
+    # Index of the uploads in the bucket, keyed by file ID, and the seconds
+    # between background listings that bring it up to date (0 disables them)
+    app.config['BUCKET_MANIFEST_PATH'] = os.getenv(
+        'BUCKET_MANIFEST_PATH', os.path.join(app.config['DOCUMENT_DIR'], 'gcs', 'bucket_manifest.json'))
+    app.config['BUCKET_MANIFEST_REFRESH_INTERVAL'] = float(os.getenv('BUCKET_MANIFEST_REFRESH_INTERVAL', 300))
+    # Signed download URLs shared by all workers and reused until close to expiry
+    app.config['SIGNED_URL_CACHE_PATH'] = os.getenv(
+        'SIGNED_URL_CACHE_PATH', os.path.join(app.config['DOCUMENT_DIR'], 'gcs', 'signed_urls.sqlite3'))
+    # Background uploads to storage: the durable queue, uploads running at
+    # once per worker, and attempts per upload, waiting GCS_UPLOAD_RETRY_DELAY
+    # seconds after the first failure and twice as long after each next one.
+    # An upload that used up its attempts is reported as failed and retried
+    # every 5 minutes until it succeeds
+    app.config['UPLOAD_QUEUE_DIR'] = os.getenv(
+        'UPLOAD_QUEUE_DIR', os.path.join(tempfile.gettempdir(), 'studyflow', 'upload_queue'))
+    app.config['GCS_UPLOAD_WORKERS'] = int(os.getenv('GCS_UPLOAD_WORKERS', 4))
+    app.config['GCS_UPLOAD_MAX_ATTEMPTS'] = int(os.getenv('GCS_UPLOAD_MAX_ATTEMPTS', 8))
+    app.config['GCS_UPLOAD_RETRY_DELAY'] = float(os.getenv('GCS_UPLOAD_RETRY_DELAY', 5))
+    # Processed documents are also kept in storage as compressed sidecars
+    # (processed/<file id>.json.gz), written SIDECAR_SYNC_DELAY seconds after
+    # a change, so other nodes load them instead of processing uploads again
+    app.config['DOCUMENT_SIDECARS'] = os.getenv('DOCUMENT_SIDECARS', 'true').lower() == 'true'
+    app.config['SIDECAR_QUEUE_DIR'] = os.getenv(
+        'SIDECAR_QUEUE_DIR', os.path.join(tempfile.gettempdir(), 'studyflow', 'sidecars'))
+    app.config['SIDECAR_SYNC_DELAY'] = float(os.getenv('SIDECAR_SYNC_DELAY', 10))
     app.config['SESSION_TYPE'] = 'filesystem'
+
+    # Background ingestion jobs: worker pool size and on-disk journal location
+    app.config['INGEST_WORKERS'] = int(os.getenv('INGEST_WORKERS', 2))
+    app.config['INGEST_JOURNAL_DIR'] = os.getenv(
+        'INGEST_JOURNAL_DIR', os.path.join(tempfile.gettempdir(), 'studyflow', 'jobs'))
+    # Seconds between batched writes of buffered page notes
+    app.config['NOTES_FLUSH_INTERVAL'] = float(os.getenv('NOTES_FLUSH_INTERVAL', 2))
+    # Local storage collector: seconds between runs (0 disables it), the disk
+    # budget for UPLOAD_FOLDER and DOCUMENT_DIR, and the seconds after which
+    # unused local copies, finished jobs and abandoned uploads are removed
+    app.config['STORAGE_GC_INTERVAL'] = float(os.getenv('STORAGE_GC_INTERVAL', 600))
+    app.config['STORAGE_MAX_BYTES'] = int(os.getenv('STORAGE_MAX_BYTES', 5 * 1024 * 1024 * 1024))
+    app.config['STORAGE_TTL'] = float(os.getenv('STORAGE_TTL', 7 * 24 * 60 * 60))
+    # Most files accepted by one /api/upload/batch request, and the seconds its
+    # response waits for them before leaving the rest to be polled
+    app.config['BATCH_UPLOAD_MAX_FILES'] = int(os.getenv('BATCH_UPLOAD_MAX_FILES', 20))
+    app.config['BATCH_STREAM_TIMEOUT'] = float(os.getenv('BATCH_STREAM_TIMEOUT', 30))
     
     # Ensure upload directory exists
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -34,5 +137,30 @@ def create_app():
     # Register main routes
     from app.routes import main
     app.register_blueprint(main)
+
+    # Upload files to storage in the background, resuming queued uploads
+    from app.utils.upload_queue import init_upload_queue
+    init_upload_queue(app)
+
+    # Start the ingestion workers and resume any jobs left by a restart
+    from app.utils.ingestion_jobs import init_ingestion
+    init_ingestion(app)
+
+    # Write sidecars of changed documents in the background (set up before
+    # the notes buffer, so notes flushed on shutdown make it into them)
+    from app.utils.document_sidecars import init_document_sidecars
+    init_document_sidecars(app)
+
+    # Write buffered page notes in batches, and on shutdown
+    from app.utils.notes_buffer import init_notes_buffer
+    init_notes_buffer(app)
+
+    # Clean up local copies and scratch files in the background
+    from app.utils.storage_gc import init_storage_gc
+    init_storage_gc(app)
+
+    # Keep the bucket manifest up to date in the background
+    from app.utils.bucket_manifest import init_bucket_manifest
+    init_bucket_manifest(app)
     
     return app 
\ No newline at end of file
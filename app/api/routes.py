@@ -1,22 +1,89 @@
-from flask import Blueprint, request, jsonify, current_app, session
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context, send_file
 import os
 import uuid
 from werkzeug.utils import secure_filename
-from app.utils.file_processor import process_file, process_pdf, process_image, save_processed_data
-from app.utils.document_analyzer import generate_summary, get_answer, get_available_models, validate_model_name, DEFAULT_QA_MODEL
-from app.utils.gcs_utils import upload_file_to_gcs, list_files_in_bucket
-import glob
+from app.utils.file_processor import process_pdf, process_image
+from app.utils.document_analyzer import generate_summary, get_answer, get_available_models, validate_model_name, DEFAULT_QA_MODEL, DEFAULT_SUMMARY_MODEL
+from app.utils.gcs_utils import delete_file_from_gcs, generate_download_url
+from app.utils.bucket_manifest import lookup_file, query_manifest
+from app.utils.storage_backends import get_storage_backend, LocalBackend
+from app.utils.ingestion_jobs import submit_ingestion_job, get_job, iter_finished_jobs
+from app.utils.lazy_extraction import ensure_pages_extracted
+from app.utils.chunked_uploads import (create_upload_session, get_upload_session, append_chunk,
+                                      finish_upload, UploadOffsetMismatch)
+from app.utils.upload_dedup import save_upload_hashed, find_duplicate, register_content, forget_document
+from app.utils.document_store import get_document_store
+from app.utils.document_locks import document_lock
+from app.utils.notes_buffer import buffer_notes, get_pending_notes, discard_notes
+from app.utils.document_sidecars import (mark_sidecar_stale, restore_document_from_sidecar, delete_document_sidecar,
+                                         get_sidecar_status)
+from app.utils.storage_gc import get_last_report
+from app.utils.upload_queue import enqueue_upload, enqueue_append, cancel_upload, get_upload_status
+from app.utils.pdf_append import write_incremental_append, append_update
+from app.utils.local_files import (local_upload_path, register_local_file, forget_local_file,
+                                   find_local_file, find_local_files)
 import json
-import tempfile
 import traceback
 
 api = Blueprint('api', __name__)
 
 ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg'}
 
+# Files returned per /api/files page by default, and at most
+DEFAULT_FILES_PAGE_SIZE = 50
+MAX_FILES_PAGE_SIZE = 200
+
+# Times add-page builds a document's PDF before doing it under the document's lock
+ADD_PAGE_ATTEMPTS = 3
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _static_url(path):
+    """Return the URL a file under the static folder is served from"""
+    return f"/static/{os.path.relpath(path, os.path.join(current_app.root_path, 'static'))}"
+
+
+def ingest_saved_upload(file_id, file_path, filename, content_hash):
+    """Start ingesting an upload that has been saved locally
+    
+    Args:
+        file_id (str): ID for the new document
+        file_path (str): Path of the saved upload
+        filename (str): Sanitized original filename
+        content_hash (str): Hex SHA-256 digest of the upload
+    
+    Returns:
+        tuple: Response data and status code
+    """
+    # Identical contents were uploaded before: the new document gets its own
+    # ID and file, but copies the extracted pages and summaries of the
+    # existing one instead of extracting and summarizing them again
+    duplicate = find_duplicate(content_hash)
+    
+    # Upload to GCS, extraction and saving run as a background job
+    register_local_file(file_id, file_path)
+    if duplicate:
+        print(f"Upload {filename} duplicates file {duplicate['file_id']}, copying its processed pages")
+        job = submit_ingestion_job(file_id, file_path, filename,
+                                   copy_from=duplicate['file_id'], content_hash=content_hash)
+    else:
+        job = submit_ingestion_job(file_id, file_path, filename)
+        register_content(content_hash, file_id, job['job_id'], filename)
+    
+    # Return the file ID and the job to poll for progress
+    response = {
+        'file_id': file_id,
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'status_url': f"/api/jobs/{job['job_id']}",
+        'message': 'File uploaded, processing started',
+        'filename': filename
+    }
+    if duplicate:
+        response.update({'deduplicated': True, 'duplicate_of': duplicate['file_id']})
+    return response, 202
+
 
 @api.route('/add-page', methods=['POST'])
 def add_page():
@@ -60,90 +127,48 @@ def add_page():
             # Generate a unique filename for the new page
             original_filename = secure_filename(file.filename)
             file_ext = original_filename.rsplit('.', 1)[1].lower()
-            unique_filename = f"{str(uuid.uuid4())}.{file_ext}"
 
             # Save the file in the upload directory
-            upload_folder = current_app.config['UPLOAD_FOLDER']
-            os.makedirs(upload_folder, exist_ok=True)  # Ensure upload folder exists
-            
-            file_path = os.path.join(upload_folder, unique_filename)
+            file_path = local_upload_path(str(uuid.uuid4()), file_ext)
             print(f"Saving new page file to: {file_path}")
             file.save(file_path)
 
-            # Try to find the document data in different possible locations
-            document_file = None
-            document_data = None
-            
-            # Expanded list of possible locations to check
-            locations = [
-                # Check in upload folder
-                os.path.join(upload_folder, f"{document_id}.json"),
-                os.path.join(upload_folder, 'studyflow', f"{document_id}.json"),
-                
-                # Check in temp directory
-                os.path.join(tempfile.gettempdir(), f"{document_id}.json"),
-                os.path.join(tempfile.gettempdir(), 'studyflow', f"{document_id}.json"),
-            ]
-            
-            print(f"Looking for document JSON in these locations: {locations}")
+            store = get_document_store()
+            document_data = store.load(document_id)
+            if document_data:
+                print(f"Found document JSON for {document_id}")
             
-            for loc in locations:
-                directory = os.path.dirname(loc)
-                os.makedirs(directory, exist_ok=True)
-                
-                if os.path.exists(loc):
-                    document_file = loc
-                    print(f"Found document JSON at: {document_file}")
-                    try:
-                        with open(document_file, 'r') as f:
-                            document_data = json.load(f)
-                        break
-                    except Exception as e:
-                        print(f"Error loading document from {loc}: {str(e)}")
-            
-            # If document not found locally, try to fetch from GCS via debug endpoint
+            # If document not found locally, restore it from its sidecar
+            if not document_data:
+                try:
+                    if restore_document_from_sidecar(document_id):
+                        document_data = store.load(document_id)
+                except Exception as e:
+                    print(f"Error restoring document {document_id} from its sidecar: {str(e)}")
+
+            # Otherwise check GCS
             if not document_data:
                 print("Document JSON not found locally, checking GCS...")
                 try:
-                    from app.utils.gcs_utils import list_files_in_bucket, get_file_from_gcs
+                    # Try to find the file in the bucket manifest
+                    matching_file = lookup_file(document_id)
                     
-                    # Use the file debug endpoint to get document data
-                    debug_url = f"/api/debug/document/{document_id}"
-                    debug_response = current_app.test_client().get(debug_url)
-                    debug_data = debug_response.get_json()
-                    
-                    if debug_data and debug_data.get('document_found'):
-                        document_data = debug_data.get('document_data')
-                        print(f"Found document data via debug endpoint: {document_id}")
+                    if matching_file:
+                        print(f"Found file in GCS bucket: {matching_file}")
+                        file_url = generate_download_url(matching_file['blob_name'])
+                        # This could be a new document - create minimal data
+                        document_data = {
+                            'file_id': document_id,
+                            'document_id': document_id,
+                            'file_type': matching_file.get('extension'),
+                            'file_url': file_url,
+                            'download_url': file_url,
+                            'original_name': matching_file.get('name'),
+                            'pages': []
+                        }
                         
                         # Create a local copy of the document JSON
-                        document_file = os.path.join(tempfile.gettempdir(), 'studyflow', f"{document_id}.json")
-                        os.makedirs(os.path.dirname(document_file), exist_ok=True)
-                        with open(document_file, 'w') as f:
-                            json.dump(document_data, f)
-                    else:
-                        # Try to find the file in GCS directly
-                        files = list_files_in_bucket()
-                        matching_file = next((f for f in files if f['id'] == document_id), None)
-                        
-                        if matching_file:
-                            print(f"Found file in GCS bucket: {matching_file}")
-                            # This could be a new document - create minimal data
-                            document_data = {
-                                'file_id': document_id,
-                                'document_id': document_id,
-                                'file_type': matching_file.get('extension'),
-                                'file_url': matching_file.get('url'),
-                                'download_url': matching_file.get('url'),
-                                'original_name': matching_file.get('name'),
-                                'pages': []
-                            }
-                            
-                            # Create a local copy of the document JSON
-                            document_file = os.path.join(tempfile.gettempdir(), 'studyflow', f"{document_id}.json")
-                            os.makedirs(os.path.dirname(document_file), exist_ok=True)
-                            with open(document_file, 'w') as f:
-                                json.dump(document_data, f)
+                        store.save(document_id, document_data)
                 except Exception as fetch_error:
                     print(f"Error fetching document from GCS: {str(fetch_error)}")
             
@@ -156,11 +181,6 @@ def add_page():
                     'document_id': document_id,
                     'pages': []
                 }
-                
-                # Use upload folder as the save location
-                document_file = os.path.join(upload_folder, 'studyflow', f"{document_id}.json")
-                directory = os.path.dirname(document_file)
-                os.makedirs(directory, exist_ok=True)
 
             # Process the uploaded file to extract text and page count
             if file_ext == 'pdf':
@@ -181,133 +201,6 @@ def add_page():
             # Calculate the starting page number for the new pages
             start_page_num = len(document_data.get('pages', [])) + 1
             
-            # For PDFs, handle merging with cloud storage support
-            if file_ext.lower() == 'pdf':
-                try:
-                    import PyPDF2
-                    from app.utils.gcs_utils import get_file_from_gcs, upload_file_to_gcs
-                    
-                    original_pdf_path = None
-                    has_cloud_original = False
-                    
-                    # Step 1: First check for a local PDF file
-                    original_files = []
-                    for filename in os.listdir(upload_folder):
-                        if filename.startswith(document_id) and filename.lower().endswith('.pdf'):
-                            original_files.append(os.path.join(upload_folder, filename))
-                    
-                    if original_files:
-                        original_pdf_path = original_files[0]
-                        print(f"Found original PDF locally: {original_pdf_path}")
-                    
-                    # Step 2: If not found locally, check GCS
-                    if not original_pdf_path and document_data.get('file_type', '').lower() == 'pdf':
-                        try:
-                            print("Original PDF not found locally, checking GCS...")
-                            
-                            # Try to get file extension and original name
-                            file_extension = 'pdf'
-                            original_name = document_data.get('original_name')
-                            
-                            # Download from GCS
-                            file_content = get_file_from_gcs(document_id, file_extension, original_name)
-                            
-                            # Save to a temporary file
-                            temp_original_pdf = os.path.join(upload_folder, f"{document_id}_original.pdf")
-                            with open(temp_original_pdf, 'wb') as f:
-                                f.write(file_content)
-                            
-                            original_pdf_path = temp_original_pdf
-                            has_cloud_original = True
-                            print(f"Downloaded original PDF from GCS: {original_pdf_path}")
-                            
-                        except Exception as cloud_error:
-                            print(f"Error fetching original PDF from GCS: {str(cloud_error)}")
-                    
-                    # Step 3: If we have original PDF, merge with the new file
-                    if original_pdf_path:
-                        merged_pdf_path = os.path.join(upload_folder, f"{document_id}.pdf")
-                        
-                        print(f"Merging PDFs: {original_pdf_path} + {file_path} -> {merged_pdf_path}")
-                        
-                        merger = PyPDF2.PdfMerger()
-                        merger.append(original_pdf_path)
-                        merger.append(file_path)
-                        merger.write(merged_pdf_path)
-                        merger.close()
-                        
-                        print(f"Successfully merged PDFs to: {merged_pdf_path}")
-                        
-                        # Step 4: Update document data to reference the merged file
-                        document_data['merged_pdf'] = True
-                        document_data['original_file'] = original_pdf_path
-                        document_data['merged_file'] = merged_pdf_path
-                        
-                        # Step 5: ALWAYS upload to GCS, not just if original was from cloud
-                        try:
-                            print("Uploading merged PDF to GCS...")
-                            with open(merged_pdf_path, 'rb') as merged_file:
-                                # Create a file object from the merged PDF
-                                from io import BytesIO
-                                file_obj = BytesIO(merged_file.read())
-                                file_obj.seek(0)  # Reset file pointer
-                                
-                                # Upload to GCS with original name as prefix
-                                original_name = document_data.get('original_name') or f"{document_id}"
-                                gcs_url = upload_file_to_gcs(file_obj, document_id, 'pdf', original_name)
-                                
-                                # Update document data with new URL
-                                document_data['file_url'] = gcs_url
-                                document_data['download_url'] = gcs_url
-                                print(f"✅ Successfully uploaded merged PDF to GCS: {gcs_url}")
-                                
-                        except Exception as upload_error:
-                            print(f"❌ Error uploading merged PDF to GCS: {str(upload_error)}")
-                            print(f"DEBUG: upload_error type: {type(upload_error)}")
-                            print(f"DEBUG: upload_error args: {upload_error.args}")
-                            print(traceback.format_exc())
-                        
-                        # Step 6: Set local file URL for viewer
-                        # This ensures the viewer can access the file even if cloud upload fails
-                        try:
-                            relative_path = os.path.relpath(
-                                merged_pdf_path, 
-                                os.path.join(current_app.root_path, 'static')
-                            )
-                            local_file_url = f"/static/{relative_path}"
-                            document_data['local_file_url'] = local_file_url
-                            
-                            # If we don't have a cloud URL, use the local URL
-                            if not document_data.get('file_url'):
-                                document_data['file_url'] = local_file_url
-                                document_data['download_url'] = local_file_url
-                        except Exception as url_error:
-                            print(f"Error creating local file URL: {str(url_error)}")
-                    else:
-                        # If no original PDF to merge with, upload this new PDF to GCS
-                        try:
-                            print("No original PDF found, uploading new PDF to GCS...")
-                            with open(file_path, 'rb') as new_pdf_file:
-                                from io import BytesIO
-                                file_obj = BytesIO(new_pdf_file.read())
-                                file_obj.seek(0)
-                                
-                                original_name = original_filename or f"document_{document_id}"
-                                gcs_url = upload_file_to_gcs(file_obj, document_id, 'pdf', original_name)
-                                
-                                document_data['file_url'] = gcs_url
-                                document_data['download_url'] = gcs_url
-                                document_data['file_type'] = 'pdf'
-                                print(f"✅ Successfully uploaded new PDF to GCS: {gcs_url}")
-                        except Exception as upload_error:
-                            print(f"❌ Error uploading new PDF to GCS: {str(upload_error)}")
-                            print(traceback.format_exc())
-                
-                except Exception as merge_error:
-                    print(f"Error during PDF merge process: {str(merge_error)}")
-                    print(traceback.format_exc())
-                    # Continue even if merge fails - we'll still have the individual files
-            
             # Generate summaries for new pages
             print("Generating summaries for new pages...")
             from app.utils.document_analyzer import generate_summary, get_available_models
@@ -329,21 +222,75 @@ def add_page():
                     else:
                         page['summary'] = "No text content available to summarize."
                         print(f"⚠️ No text found for page {page_number}, skipping summary generation")
-                        
-                    document_data['pages'].append(page)
                 except Exception as summary_error:
+                    # The page is still added even if summary generation fails
                     print(f"❌ Error generating summary for page {page_number}: {str(summary_error)}")
-                    # Still add the page even if summary generation fails
-                    document_data['pages'].append(page)
             
-            # Save updated document JSON
-            print(f"Saving updated document JSON to: {document_file}")
-            directory = os.path.dirname(document_file)
-            os.makedirs(directory, exist_ok=True)
+            # Build the document's PDF with the new pages without holding its
+            # lock, then swap it in and save the pages under the lock, so
+            # concurrent edits of the same document are applied one after
+            # another. If the PDF changed meanwhile it is built again, and
+            # the last attempt builds it under the lock.
+            is_pdf = file_ext.lower() == 'pdf'
+            for attempt in range(ADD_PAGE_ATTEMPTS):
+                last_attempt = attempt == ADD_PAGE_ATTEMPTS - 1
+                plan = None
+                if is_pdf and not last_attempt:
+                    plan = _prepare_pdf_add(document_id, document_data, file_path)
+
+                with document_lock(document_id):
+                    if is_pdf and last_attempt:
+                        plan = _prepare_pdf_add(document_id, document_data, file_path)
+                    if plan and not _apply_pdf_add(document_id, document_data, plan):
+                        print(f"PDF of document {document_id} changed while adding pages, trying again")
+                        _discard_pdf_add(plan)
+                        continue
+
+                    # Re-read the document in case it changed while the pages were summarized
+                    stored_data = store.load(document_id)
+                    if stored_data:
+                        document_data = stored_data
+
+                    # Document-level fields as stored, so only the ones this request changes are saved
+                    stored_fields = {key: value for key, value in document_data.items()
+                                     if key != 'pages'} if stored_data else {}
+
+                    if plan:
+                        # Point the viewer at the local file until the upload
+                        # finishes and sets the cloud URL
+                        merged_pdf_path = plan['merged_pdf_path']
+                        local_file_url = _static_url(merged_pdf_path)
+                        document_data.update({
+                            'merged_pdf': True,
+                            'original_file': plan['original_path'],
+                            'merged_file': merged_pdf_path,
+                            'local_file_url': local_file_url,
+                            'file_url': local_file_url,
+                            'download_url': local_file_url
+                        })
+                    elif is_pdf:
+                        # If no original PDF to merge with, queue this new PDF for upload to GCS
+                        print("No original PDF found, queueing new PDF for upload to GCS...")
+                        original_name = original_filename or f"document_{document_id}"
+                        enqueue_upload(document_id, file_path, 'pdf', original_name)
+                        register_local_file(document_id, file_path)
+
+                        local_file_url = _static_url(file_path)
+                        document_data['file_url'] = local_file_url
+                        document_data['download_url'] = local_file_url
+                        document_data['file_type'] = 'pdf'
+
+                    # Append the new pages, saving only the document fields that changed
+                    changed_fields = {key: value for key, value in document_data.items()
+                                      if key != 'pages' and (key not in stored_fields or stored_fields[key] != value)}
+                    print(f"Saving {len(new_pages_data)} new pages to: {store.path_for(document_id)}")
+                    if not store.append_pages(document_id, new_pages_data, changed_fields):
+                        return jsonify({'error': 'Could not save document', 'success': False}), 500
+                break
+
+            forget_document(document_id)
+            mark_sidecar_stale(document_id)
             
-            with open(document_file, 'w') as f:
-                json.dump(document_data, f)
-
             print(f"✅ Successfully added {len(new_pages_data)} pages to document {document_id}")
             return jsonify({
                 'message': f'New page(s) added successfully - {len(new_pages_data)} pages',
@@ -357,7 +304,6 @@ def add_page():
         return jsonify({'error': 'Invalid file type', 'success': False}), 400
 
     except Exception as e:
-        import traceback
         print(f"SERVER ERROR in add_page: {str(e)}")
         print(traceback.format_exc())
         return jsonify({
@@ -366,6 +312,136 @@ def add_page():
         }), 500
 
 
+def _prepare_pdf_add(document_id, document_data, new_pdf_path):
+    """Build a document's PDF with the pages of another PDF added, without its lock
+
+    The pages are added to the document's local PDF, or to a copy streamed
+    from GCS if it has none. Where possible they are written as an
+    incremental update, so only the new bytes are appended locally and
+    sent to GCS; otherwise the PDFs are merged into a new file. Nothing
+    the document uses is changed: _apply_pdf_add does that under the
+    document's lock, or _discard_pdf_add drops the result.
+
+    Args:
+        document_id (str): The ID of the document
+        document_data (dict): The document's data
+        new_pdf_path (str): PDF with the pages to add
+
+    Returns:
+        dict: What to apply, or None if the document has no PDF to add to
+    """
+    import PyPDF2
+    from app.utils.gcs_utils import download_blob_to_file, get_blob_name
+
+    merged_pdf_path = local_upload_path(document_id, 'pdf')
+    plan = {'merged_pdf_path': merged_pdf_path, 'base': None, 'downloaded_path': None,
+            'update_path': None, 'merged_temp_path': None}
+
+    try:
+        # Step 1: First check for a local PDF file
+        local_file = find_local_file(document_id)
+        if local_file and local_file.lower().endswith('.pdf'):
+            # Applied only if the file is still the one the pages were added to
+            stat = os.stat(local_file)
+            plan['base'] = (local_file, stat.st_size, stat.st_mtime_ns)
+            source_path = local_file
+            print(f"Found original PDF locally: {local_file}")
+
+        # Step 2: If not found locally, stream it from GCS to a private copy
+        elif document_data.get('file_type', '').lower() == 'pdf':
+            print("Original PDF not found locally, checking GCS...")
+            matching_file = lookup_file(document_id)
+            blob_name = (matching_file['blob_name'] if matching_file
+                         else get_blob_name(document_id, 'pdf', document_data.get('original_name')))
+            source_path = plan['downloaded_path'] = f"{merged_pdf_path}.{uuid.uuid4().hex}.tmp"
+            download_blob_to_file(blob_name, source_path)
+            print(f"Downloaded original PDF from GCS: {source_path}")
+        else:
+            return None
+        plan['original_path'] = merged_pdf_path if plan['downloaded_path'] else source_path
+
+        # Step 3: Append the new pages as an incremental update, so neither the
+        # local copy nor the one in GCS is rewritten
+        if source_path in (merged_pdf_path, plan['downloaded_path']):
+            update_path = f"{merged_pdf_path}.{uuid.uuid4().hex}.tmp"
+            try:
+                plan['base_size'] = os.path.getsize(source_path)
+                write_incremental_append(source_path, new_pdf_path, update_path)
+                if plan['downloaded_path']:
+                    append_update(source_path, update_path)
+                plan['update_path'] = update_path
+                print(f"Wrote update adding {new_pdf_path} to {merged_pdf_path} "
+                      f"({os.path.getsize(update_path)} bytes)")
+                return plan
+            except Exception as append_error:
+                print(f"Could not append to {source_path}, merging instead: {str(append_error)}")
+                # A failed append_update has truncated the copy back to its old size
+                if os.path.exists(update_path):
+                    os.remove(update_path)
+
+        # Otherwise merge both PDFs into a new file
+        plan['merged_temp_path'] = f"{merged_pdf_path}.{uuid.uuid4().hex}.tmp"
+        print(f"Merging PDFs: {source_path} + {new_pdf_path} -> {plan['merged_temp_path']}")
+        merger = PyPDF2.PdfMerger()
+        merger.append(source_path)
+        merger.append(new_pdf_path)
+        merger.write(plan['merged_temp_path'])
+        merger.close()
+        return plan
+
+    except Exception as e:
+        print(f"Error adding pages to the PDF of document {document_id}: {str(e)}")
+        print(traceback.format_exc())
+        _discard_pdf_add(plan)
+        return None
+
+def _apply_pdf_add(document_id, document_data, plan):
+    """Make the PDF built by _prepare_pdf_add the document's file; call under the document's lock
+
+    Returns:
+        bool: True if applied, False if the document's PDF changed since it
+            was built, and it has to be built again
+    """
+    merged_pdf_path = plan['merged_pdf_path']
+    original_name = document_data.get('original_name') or f"{document_id}"
+
+    local_file = find_local_file(document_id)
+    if plan['base']:
+        path, size, mtime_ns = plan['base']
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return False
+        if local_file != path or (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+            return False
+    elif local_file and local_file.lower().endswith('.pdf'):
+        # Another request made a local copy meanwhile, which may have pages this one lacks
+        return False
+
+    # Step 4: Swap the new PDF in and queue it (or just the appended bytes) for GCS
+    if plan['update_path']:
+        if plan['downloaded_path']:
+            os.replace(plan['downloaded_path'], merged_pdf_path)
+        else:
+            append_update(merged_pdf_path, plan['update_path'])
+        enqueue_append(document_id, plan['update_path'], plan['base_size'], merged_pdf_path, 'pdf', original_name)
+    else:
+        os.replace(plan['merged_temp_path'], merged_pdf_path)
+        print(f"Successfully merged PDFs to: {merged_pdf_path}")
+        enqueue_upload(document_id, merged_pdf_path, 'pdf', original_name)
+    register_local_file(document_id, merged_pdf_path)
+    return True
+
+def _discard_pdf_add(plan):
+    """Remove the files of a PDF built by _prepare_pdf_add that was not applied"""
+    for key in ('downloaded_path', 'update_path', 'merged_temp_path'):
+        if plan.get(key):
+            try:
+                os.remove(plan[key])
+            except FileNotFoundError:
+                pass
+
+
 @api.route('/remove-page', methods=['POST'])
 def remove_page():
     """Handles removing a page from an existing document"""
@@ -377,26 +453,15 @@ def remove_page():
         if not document_id or page_id <= 0:
             return jsonify({'error': 'Invalid document ID or page number'}), 400
 
-        # Load document data
-        temp_dir = os.path.join(os.path.join(current_app.config['UPLOAD_FOLDER'], 'studyflow'))
-        document_file = os.path.join(temp_dir, f"{document_id}.json")
-
-        if not os.path.exists(document_file):
+        # Remove the page and renumber the pages after it
+        store = get_document_store()
+        if not store.exists(document_id):
             return jsonify({'error': 'Document not found'}), 404
 
-        with open(document_file, 'r') as f:
-            document_data = json.load(f)
-
-        # Filter out the page to be removed
-        document_data['pages'] = [p for p in document_data['pages'] if p['page_number'] != page_id]
-
-        # Reorder remaining pages
-        for index, page in enumerate(document_data['pages']):
-            page['page_number'] = index + 1
-
-        # Save the updated document
-        with open(document_file, 'w') as f:
-            json.dump(document_data, f)
+        if not store.remove_page(document_id, page_id):
+            return jsonify({'error': 'Could not save document'}), 500
+        forget_document(document_id)
+        mark_sidecar_stale(document_id)
 
         return jsonify({
             'message': 'Page removed successfully',
@@ -427,32 +492,13 @@ def upload_file():
             file_id = str(uuid.uuid4())
             filename = secure_filename(file.filename)
             ext = os.path.splitext(filename)[1].lower()
-            new_filename = f"{file_id}{ext}"
             
             # Save the file locally
-            upload_folder = current_app.config['UPLOAD_FOLDER']
-            file_path = os.path.join(upload_folder, new_filename)
-            file.save(file_path)
-            
-            # Reset file stream to beginning before uploading to GCS
-            file.seek(0)
-            
-            # Upload to GCS with the same filename
-            gcs_url = upload_file_to_gcs(file, file_id, ext[1:], original_filename=filename)
+            file_path = local_upload_path(file_id, ext)
+            content_hash = save_upload_hashed(file, file_path)
             
-            # Process the file based on its type
-            processed_data = process_file(file_path)
-            
-            # Save processed data
-            save_processed_data(file_id, processed_data)
-            
-            # Return success response with the file ID and GCS URL
-            return jsonify({
-                'file_id': file_id,
-                'message': 'File uploaded and processed successfully',
-                'filename': filename,
-                'file_url': gcs_url # added
-            }), 200
+            response, status = ingest_saved_upload(file_id, file_path, filename, content_hash)
+            return jsonify(response), status
         else:
             print(f"File type not allowed: {file.filename}")
             return jsonify({'error': 'File type not allowed'}), 400
@@ -460,6 +506,181 @@ def upload_file():
         print(f"Error uploading file: {str(e)}")
         return jsonify({'error': f'Server error: {str(e)}'}), 500
 
+@api.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    """Upload several files in one request
+    
+    Every file is saved and handed to the ingestion pool, which processes
+    them in parallel. The response is streamed as newline-delimited JSON
+    with one line per file, written as that file finishes processing. After
+    BATCH_STREAM_TIMEOUT seconds the stream ends with a line for each file
+    still processing, with the job to poll at /api/jobs/<id>, so a large
+    batch doesn't keep the request worker busy.
+    """
+    files = [f for f in request.files.getlist('files') if f.filename]
+    
+    if not files:
+        return jsonify({'error': 'No files selected'}), 400
+    
+    max_files = current_app.config['BATCH_UPLOAD_MAX_FILES']
+    if len(files) > max_files:
+        return jsonify({'error': f'At most {max_files} files can be uploaded at once'}), 400
+    
+    finished = []
+    pending = {}
+    
+    for file in files:
+        filename = secure_filename(file.filename)
+        
+        if not allowed_file(file.filename):
+            finished.append({'filename': filename, 'status': 'rejected', 'error': 'File type not allowed'})
+            continue
+        
+        try:
+            file_id = str(uuid.uuid4())
+            ext = os.path.splitext(filename)[1].lower()
+            file_path = local_upload_path(file_id, ext)
+            content_hash = save_upload_hashed(file, file_path)
+            
+            response, _ = ingest_saved_upload(file_id, file_path, filename, content_hash)
+            pending[response['job_id']] = response
+        except Exception as e:
+            print(f"Error uploading {filename} in batch: {str(e)}")
+            finished.append({'filename': filename, 'status': 'failed', 'error': str(e)})
+    
+    print(f"Batch upload: {len(files)} files, {len(pending)} ingestion jobs started")
+    stream_timeout = current_app.config['BATCH_STREAM_TIMEOUT']
+    
+    def generate():
+        for result in finished:
+            yield json.dumps(result) + '\n'
+        
+        def result_line(job, response):
+            return json.dumps({
+                'file_id': response['file_id'],
+                'filename': response['filename'],
+                'job_id': job['job_id'],
+                'deduplicated': response.get('deduplicated', False),
+                'summaries_copied': job.get('summaries_copied', False),
+                'status': job['status'],
+                'status_url': f"/api/jobs/{job['job_id']}",
+                'error': job.get('error')
+            }) + '\n'
+        
+        unfinished = dict(pending)
+        for job in iter_finished_jobs(list(pending), timeout=stream_timeout):
+            yield result_line(job, unfinished.pop(job['job_id']))
+        
+        # Still processing: the client polls these jobs
+        for job_id, response in unfinished.items():
+            yield result_line(get_job(job_id) or {'job_id': job_id, 'status': response['status']}, response)
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson'), 200
+
+@api.route('/uploads', methods=['POST'])
+def create_upload():
+    """Start a resumable, chunked upload for files too large for /upload"""
+    data = request.get_json() or {}
+    filename = secure_filename(data.get('filename', ''))
+    size = data.get('size')
+    
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'File type not allowed'}), 400
+    
+    if not isinstance(size, int) or size <= 0:
+        return jsonify({'error': 'A positive file size is required'}), 400
+    
+    max_size = current_app.config['MAX_UPLOAD_SIZE']
+    if size > max_size:
+        return jsonify({'error': f'File is larger than the {max_size} byte limit'}), 413
+    
+    try:
+        session = create_upload_session(filename, size)
+        return jsonify({
+            'upload_id': session['upload_id'],
+            'offset': 0,
+            'size': size,
+            'chunk_size': current_app.config['UPLOAD_CHUNK_SIZE']
+        }), 201
+    except Exception as e:
+        print(f"Error creating upload session: {str(e)}")
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@api.route('/uploads/<upload_id>', methods=['GET', 'HEAD'])
+def get_upload(upload_id):
+    """Report how much of a resumable upload has been received"""
+    session = get_upload_session(upload_id)
+    
+    if not session:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    response = jsonify({
+        'upload_id': upload_id,
+        'offset': session['offset'],
+        'size': session['size']
+    })
+    response.headers['Upload-Offset'] = str(session['offset'])
+    response.headers['Upload-Length'] = str(session['size'])
+    return response, 200
+
+@api.route('/uploads/<upload_id>', methods=['PATCH'])
+def upload_chunk(upload_id):
+    """Append a chunk to a resumable upload
+    
+    The Upload-Offset header says where the chunk starts. The body is
+    streamed to disk; when the last chunk arrives the file is ingested the
+    same way as a /upload request.
+    """
+    session = get_upload_session(upload_id)
+    
+    if not session:
+        return jsonify({'error': 'Upload not found'}), 404
+    
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'Upload-Offset header is required'}), 400
+    
+    try:
+        new_offset = append_chunk(session, offset, request.stream)
+    except UploadOffsetMismatch as e:
+        response = jsonify({'error': str(e), 'offset': e.expected})
+        response.headers['Upload-Offset'] = str(e.expected)
+        return response, 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        print(f"Error writing upload chunk: {str(e)}")
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+    
+    if new_offset < session['size']:
+        response = jsonify({'upload_id': upload_id, 'offset': new_offset, 'size': session['size']})
+        response.headers['Upload-Offset'] = str(new_offset)
+        return response, 200
+    
+    try:
+        # All bytes received: move the file into place and ingest it
+        ext = os.path.splitext(session['filename'])[1].lower()
+        file_path = local_upload_path(session['file_id'], ext)
+        content_hash = finish_upload(session, file_path)
+        
+        response, status = ingest_saved_upload(session['file_id'], file_path, session['filename'], content_hash)
+        return jsonify(response), status
+    except Exception as e:
+        print(f"Error completing upload: {str(e)}")
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+@api.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Report the progress of an ingestion job"""
+    job = get_job(job_id)
+    
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    # The local path is an implementation detail
+    job.pop('file_path', None)
+    return jsonify(job), 200
+
 @api.route('/analyze/<file_id>', methods=['POST'])
 def analyze_file(file_id):
     """Analyze a file and generate summaries for its pages"""
@@ -469,27 +690,41 @@ def analyze_file(file_id):
         data = request.get_json() or {}
         model = data.get('model', None)  # Use default if not specified
         
-        temp_dir = os.path.join(tempfile.gettempdir(), 'studyflow')
-        file_path = os.path.join(temp_dir, f"{file_id}.json")
+        store = get_document_store()
+        file_data = store.load(file_id)
         
-        if not os.path.exists(file_path):
+        if not file_data:
             return jsonify({'error': 'File not found'}), 404
             
-        with open(file_path, 'r') as f:
-            file_data = json.load(f)
-            
-        # Generate summaries for each page
+        # Pages of lazy documents are summarized as they are extracted
+        if file_data.get('lazy'):
+            summary_model = validate_model_name(model) if model else DEFAULT_SUMMARY_MODEL
+            if not store.update_document(file_id, {'summarize_on_extract': summary_model}):
+                return jsonify({'error': 'Could not save analysis'}), 500
+        
+        # Generate summaries for each page, without holding the document lock
+        summaries = {}
         for page in file_data.get('pages', []):
+            if page.get('extracted') is False:
+                continue
+            
             page_text = page.get('text', '')
             if page_text:
                 # Generate summary using specified or default model
-                page['summary'] = generate_summary(page_text, model=model)
+                summaries[page['page_number']] = (page_text, generate_summary(page_text, model=model))
             else:
-                page['summary'] = "No text content available to summarize."
+                summaries[page['page_number']] = (page_text, "No text content available to summarize.")
                 
-        # Save updated data
-        with open(file_path, 'w') as f:
-            json.dump(file_data, f)
+        # Save only the summaries, skipping pages removed or moved by an edit made meanwhile
+        with document_lock(file_id):
+            current_text = {page['page_number']: page.get('text', '')
+                            for page in (store.load(file_id) or {}).get('pages', [])}
+            updates = {page_number: {'summary': summary}
+                       for page_number, (page_text, summary) in summaries.items()
+                       if current_text.get(page_number) == page_text}
+            if not store.update_pages(file_id, updates):
+                return jsonify({'error': 'Could not save analysis'}), 500
+        mark_sidecar_stale(file_id)
             
         return jsonify({'status': 'success', 'message': 'Analysis complete'}), 200
     except Exception as e:
@@ -500,38 +735,32 @@ def analyze_file(file_id):
 def get_summaries(file_id):
     """Get summaries for a file"""
     import os
-    import json
-    import tempfile
     from flask import current_app, url_for
-    from app.utils.gcs_utils import get_file_from_gcs, list_files_in_bucket
+    from app.utils.gcs_utils import download_blob_to_file
 
     # First try local storage (for newly uploaded files)
-    temp_dir = os.path.join(tempfile.gettempdir(), 'studyflow')
-    upload_folder = current_app.config['UPLOAD_FOLDER']
-    
-    print(f"Checking for JSON files in:")
-    print(f"Temp directory: {temp_dir}")
-    print(f"Upload folder: {upload_folder}")
+    store = get_document_store()
 
     # Check for local files first (for newly uploaded files)
-    merged_pdf_path = os.path.join(upload_folder, f"merged_{file_id}.pdf")
-    original_files = glob.glob(os.path.join(upload_folder, f"{file_id}.*"))
-    json_path = os.path.join(temp_dir, f"{file_id}.json")
-    
-    print(f"Looking for JSON file at: {json_path}")
-    print(f"File exists: {os.path.exists(json_path)}")
+    original_file_path = find_local_file(file_id)
+    # Page text is left out; the viewer fetches it from /api/page-text per page
+    data = store.load(file_id, include_text=False)
+
+    # Processed elsewhere: restore the document from its sidecar instead of processing it again
+    if not original_file_path and not data:
+        try:
+            if restore_document_from_sidecar(file_id):
+                original_file_path = find_local_file(file_id)
+                data = store.load(file_id, include_text=False)
+        except Exception as e:
+            print(f"Error restoring document {file_id} from its sidecar: {str(e)}")
 
     # If we have local files, use the existing flow
-    if os.path.exists(merged_pdf_path) or original_files or os.path.exists(json_path):
-        if os.path.exists(merged_pdf_path):
-            original_file_path = merged_pdf_path
-            file_type = 'pdf'
-        elif original_files:
-            original_file_path = original_files[0]
+    if original_file_path or data:
+        if original_file_path:
             file_type = os.path.splitext(original_file_path)[1].lower()[1:]
         else:
-            original_file_path = None
-            file_type = "unknown"
+            file_type = (data or {}).get('file_type', "unknown")
 
         # Set up URLs for local files
         if original_file_path:
@@ -540,62 +769,72 @@ def get_summaries(file_id):
             file_url = f"/static/{relative_path}"
             download_url = f"/static/{relative_path}"
         else:
-            file_url = None
-            download_url = None
+            # The local copy was removed by the storage collector; use the cloud copy,
+            # with a current URL since the stored one may have expired
+            matching_file = lookup_file(file_id)
+            if matching_file:
+                file_url = download_url = generate_download_url(matching_file['blob_name'])
+            else:
+                file_url = (data or {}).get('file_url')
+                download_url = (data or {}).get('download_url', file_url)
 
-        # Try to load processed data
-        if os.path.exists(json_path):
+        # Use the processed data
+        if data:
             try:
-                with open(json_path, 'r') as f:
-                    data = json.load(f)
-                    data.update({
-                        'file_type': file_type,
-                        'file_url': file_url,
-                        'download_url': download_url,
-                        'is_merged': os.path.exists(merged_pdf_path),
-                        'is_pdf': file_type.lower() == 'pdf'
-                    })
-                    return jsonify(data), 200
+                # Lazy documents extract (or summarize) the requested page and read-ahead now
+                if data.get('lazy') or data.get('summarize_on_extract'):
+                    page = request.args.get('page', 1, type=int)
+                    data = ensure_pages_extracted(file_id, data, [page])
+                
+                data.setdefault('file_id', file_id)
+
+                # Include notes saved since the last flush
+                pending_notes = get_pending_notes(file_id, data.get('removed_pages', []))
+                for page in data.get('pages', []):
+                    if page['page_number'] in pending_notes:
+                        page['notes'] = pending_notes[page['page_number']]
+
+                data.update({
+                    'file_type': file_type,
+                    'file_url': file_url,
+                    'download_url': download_url,
+                    'is_merged': bool(data.get('merged_pdf')),
+                    'is_pdf': file_type.lower() == 'pdf'
+                })
+                return jsonify(data), 200
             except Exception as e:
                 print(f"Error loading local file data: {str(e)}")
 
     # If not found locally, try GCS
     try:
-        # Find the file in GCS
-        files = list_files_in_bucket()
-        matching_file = next((f for f in files if f['id'] == file_id), None)
+        # Find the file in the bucket manifest
+        matching_file = lookup_file(file_id)
 
         if not matching_file:
             return jsonify({'error': 'File not found in local storage or GCS'}), 404
 
-        # Download and process the file
-        file_content = get_file_from_gcs(
-            file_id, matching_file['extension'], matching_file['name'])
-
-        # Save to temporary file for processing
-        temp_file = os.path.join(
-            temp_dir, f"temp_{file_id}.{matching_file['extension']}")
-        os.makedirs(os.path.dirname(temp_file), exist_ok=True)
-
-        with open(temp_file, 'wb') as f:
-            f.write(file_content)
+        # Stream the file into the local cache and process it from there
+        file_type = matching_file['extension'].lower()
+        local_path = local_upload_path(file_id, file_type)
+        download_blob_to_file(matching_file['blob_name'], local_path)
+        register_local_file(file_id, local_path)
 
         try:
             # Process based on file type
-            file_type = matching_file['extension'].lower()
             if file_type == 'pdf':
-                pages_data = process_pdf(temp_file)
+                pages_data = process_pdf(local_path)
             elif file_type in ['jpg', 'jpeg', 'png']:
-                pages_data = process_image(temp_file)
+                pages_data = process_image(local_path)
             else:
                 raise ValueError(f"Unsupported file type: {file_type}")
 
             # Create document data with proper PDF flags
+            file_url = generate_download_url(matching_file['blob_name'])
             document_data = {
                 'file_id': file_id,
                 'file_type': file_type,
-                'file_url': matching_file['url'],
-                'download_url': matching_file['url'],
+                'file_url': file_url,
+                'download_url': file_url,
                 'pages': pages_data,
                 'is_merged': False,
                 'is_pdf': file_type == 'pdf',
@@ -604,38 +843,74 @@ def get_summaries(file_id):
                 'total_pages': len(pages_data) if pages_data else 0
             }
 
-            # Save the processed data to a JSON file
-            json_path = os.path.join(temp_dir, f"{file_id}.json")
-            os.makedirs(os.path.dirname(json_path), exist_ok=True)
-            with open(json_path, 'w') as f:
-                json.dump(document_data, f)
+            # Save the processed data to the document store, and to storage for other nodes
+            store.save(file_id, document_data)
+            mark_sidecar_stale(file_id)
 
-            # For PDFs, also save the file locally for viewing
-            if file_type == 'pdf':
-                pdf_path = os.path.join(upload_folder, f"{file_id}.pdf")
-                with open(pdf_path, 'wb') as f:
-                    f.write(file_content)
-                
-                # Update the URLs to point to the local file
-                relative_path = os.path.relpath(pdf_path, os.path.join(current_app.root_path, 'static'))
-                document_data['file_url'] = f"/static/{relative_path}"
-                document_data['download_url'] = f"/static/{relative_path}"
+            # Point the URLs at the local copy for viewing
+            relative_path = os.path.relpath(local_path, os.path.join(current_app.root_path, 'static'))
+            document_data['file_url'] = f"/static/{relative_path}"
+            document_data['download_url'] = f"/static/{relative_path}"
 
             return jsonify(document_data), 200
 
-        finally:
-            # Clean up temp file
+        except Exception:
+            # Don't leave a copy behind that looks like a processed upload
             try:
-                os.remove(temp_file)
-            except Exception as e:
-                print(
-                    f"Warning: Could not remove temp file {temp_file}: {str(e)}")
+                os.remove(local_path)
+            except OSError:
+                pass
+            forget_local_file(file_id)
+            raise
 
     except Exception as e:
         print(f"Error processing GCS file: {str(e)}")
         return jsonify({'error': f'Error processing file: {str(e)}'}), 500
 
 
+@api.route('/storage/<path:blob_name>', methods=['GET'])
+def serve_stored_file(blob_name):
+    """Serve a file of the local storage backend through a URL it signed"""
+    backend = get_storage_backend()
+    if not isinstance(backend, LocalBackend):
+        return jsonify({'error': 'Not found'}), 404
+
+    if not backend.verify_url(blob_name, request.args.get('expires'), request.args.get('signature')):
+        return jsonify({'error': 'Invalid or expired link'}), 403
+
+    try:
+        path = backend.path_for(blob_name)
+    except ValueError:
+        return jsonify({'error': 'Not found'}), 404
+    if not os.path.isfile(path):
+        return jsonify({'error': 'Not found'}), 404
+
+    # conditional=True answers Range requests, which the PDF viewer uses
+    return send_file(path, conditional=True)
+
+@api.route('/page-text/<file_id>/<int:page_number>', methods=['GET'])
+def get_page_text(file_id, page_number):
+    """Get the extracted text of one page"""
+    store = get_document_store()
+    text = store.load_page_text(file_id, page_number)
+
+    if text is None:
+        # Pages of lazy documents are extracted on first read
+        data = store.load(file_id, include_text=False)
+        if not data or not data.get('lazy'):
+            return jsonify({'error': 'Page not found'}), 404
+        data = ensure_pages_extracted(file_id, data, [page_number])
+        text = store.load_page_text(file_id, page_number)
+        if text is None:
+            # Extraction failed; the placeholder is not saved, so the next read tries again
+            page = next((p for p in data.get('pages', []) if p['page_number'] == page_number), None)
+            if not page or not page.get('text'):
+                return jsonify({'error': 'Page not found'}), 404
+            return jsonify({'page_number': page_number, 'text': page['text'], 'extracted': False}), 200
+
+    return jsonify({'page_number': page_number, 'text': text}), 200
+
+
 @api.route('/ask', methods=['POST'])
 def ask_question():
     """Ask a question about the document content"""
@@ -697,8 +972,23 @@ def update_notes(page_id):
         return jsonify({'error': 'Missing required fields'}), 400
 
     user_notes = data['userNotes']
+    file_id = data.get('fileId') or data.get('file_id')
+    if not file_id:
+        return jsonify({'error': 'fileId is required'}), 400
+
+    try:
+        page_number = int(page_id)
+    except ValueError:
+        return jsonify({'error': 'Invalid page number'}), 400
 
-    # TODO: Save notes to database
+    document = get_document_store().load(file_id, include_text=False)
+    if not document:
+        return jsonify({'error': 'Document not found'}), 404
+    if not any(page['page_number'] == page_number for page in document.get('pages', [])):
+        return jsonify({'error': 'Page not found'}), 404
+
+    # Saved in the background, merged with other saves of the same page
+    buffer_notes(file_id, page_number, user_notes, len(document.get('removed_pages', [])))
 
     return jsonify({
         'status': 'success',
@@ -708,43 +998,28 @@ def update_notes(page_id):
 @api.route('/debug/document/<file_id>', methods=['GET'])
 def debug_document(file_id):
     """Debug endpoint to check document data"""
-    import json
-    import os
-    import tempfile
+    store = get_document_store()
     response_data = {
         'file_id': file_id,
         'locations_checked': [],
         'document_found': False,
         'document_data': None
     }
-    # Check uploads/studyflow location
-    upload_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'studyflow')
-    file_path1 = os.path.join(upload_dir, f"{file_id}.json")
-    response_data['locations_checked'].append({
-        'path': file_path1,
-        'exists': os.path.exists(file_path1)
-    })
-    # Check temp/studyflow location
-    temp_dir = os.path.join(tempfile.gettempdir(), 'studyflow')
-    file_path2 = os.path.join(temp_dir, f"{file_id}.json")
-    response_data['locations_checked'].append({
-        'path': file_path2,
-        'exists': os.path.exists(file_path2)
-    })
+    response_data['locations_checked'] = store.locations(file_id)
+
     # Load file if found
-    for location in response_data['locations_checked']:
-        if location['exists']:
-            try:
-                with open(location['path'], 'r') as f:
-                    response_data['document_data'] = json.load(f)
-                    response_data['document_found'] = True
-                    break
-            except Exception as e:
-                location['error'] = str(e)
+    response_data['document_data'] = store.load(file_id)
+    response_data['document_found'] = response_data['document_data'] is not None
 
     return jsonify(response_data)
 
 
+@api.route('/debug/storage', methods=['GET'])
+def debug_storage():
+    """Debug endpoint showing what the last storage collection reclaimed, the upload queue and sidecar writes"""
+    return jsonify({'last_collection': get_last_report(), 'uploads': get_upload_status(),
+                    'sidecars': get_sidecar_status()})
+
 @api.route('/debug/document/health-check', methods=['GET'])
 def health_check():
     """Simple health check endpoint"""
@@ -767,11 +1042,31 @@ def get_models():
 
 @api.route('/files', methods=['GET'])
 def list_files():
-    """Get list of files from GCS bucket"""
+    """Get a page of files from GCS bucket, newest first
+
+    Query parameters: limit, cursor (next_cursor of the previous page),
+    prefix and name (case-insensitive match on the original name), and
+    created_after / created_before (ISO dates or times).
+    """
+    limit = min(max(request.args.get('limit', DEFAULT_FILES_PAGE_SIZE, type=int), 1), MAX_FILES_PAGE_SIZE)
+    try:
+        files, next_cursor = query_manifest(
+            limit,
+            cursor=request.args.get('cursor') or None,
+            prefix=request.args.get('prefix') or None,
+            name=request.args.get('name') or None,
+            created_after=request.args.get('created_after') or None,
+            created_before=request.args.get('created_before') or None)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'success': False}), 400
+
     try:
-        files = list_files_in_bucket()
+        # Only the files on this page need a URL
+        for file_info in files:
+            file_info['url'] = generate_download_url(file_info['blob_name'])
         return jsonify({
             'files': files,
+            'next_cursor': next_cursor,
             'success': True
         }), 200
     except Exception as e:
@@ -780,3 +1075,59 @@ def list_files():
             'error': f'Error listing files: {str(e)}',
             'success': False
         }), 500
+
+@api.route('/files/<file_id>', methods=['DELETE'])
+def delete_file(file_id):
+    """Delete a document: its file in GCS, its local copies and its processed data"""
+    if not file_id or os.path.basename(file_id) != file_id or file_id in ('.', '..'):
+        return jsonify({'error': 'Invalid file ID', 'success': False}), 400
+
+    store = get_document_store()
+    document_data = store.load(file_id, include_text=False) or {}
+    file_type = document_data.get('file_type')
+    original_name = document_data.get('original_name')
+
+    # Older documents don't record their file type; find the upload in the bucket
+    if not file_type:
+        try:
+            matching_file = lookup_file(file_id)
+            if matching_file:
+                file_type = matching_file['extension']
+                original_name = f"{matching_file['name']}.{file_type}"
+        except Exception as e:
+            print(f"Error looking up file {file_id} in GCS: {str(e)}")
+
+    # An upload still queued would store the file again
+    cancel_upload(file_id)
+
+    deleted_from_gcs = False
+    if file_type:
+        try:
+            delete_file_from_gcs(file_id, file_type, original_name)
+            deleted_from_gcs = True
+        except Exception as e:
+            print(f"Could not delete file {file_id} from GCS: {str(e)}")
+
+    local_files = find_local_files(file_id)
+    with document_lock(file_id):
+        for path in local_files:
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Could not remove local copy {path}: {str(e)}")
+        forget_local_file(file_id)
+        discard_notes(file_id)
+        store.delete(file_id)
+    forget_document(file_id)
+    delete_document_sidecar(file_id)
+
+    if not document_data and not deleted_from_gcs and not local_files:
+        return jsonify({'error': 'File not found', 'success': False}), 404
+
+    print(f"Deleted file {file_id} (GCS: {deleted_from_gcs}, local copies: {len(local_files)})")
+    return jsonify({
+        'success': True,
+        'file_id': file_id,
+        'deleted_from_gcs': deleted_from_gcs,
+        'local_files_removed': len(local_files)
+    }), 200
@@ -8,7 +8,7 @@ def index():
     """Serve the main application page"""
     return render_template('index.html')
 
-@main.route('/uploads/<filename>')
+@main.route('/uploads/<path:filename>')
 def uploaded_file(filename):
     """Serve uploaded files"""
     return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
@@ -10,6 +10,7 @@ document.addEventListener('DOMContentLoaded', function () {
         fileInput: document.getElementById('file-input'),
         uploadSection: document.getElementById('upload-section'),
         fileList: document.getElementById('file-list'),
+        fileSearch: document.getElementById('file-search'),
         loadingOverlay: document.getElementById('loading-overlay'),
         loadingMessage: document.getElementById('loading-message'),
 
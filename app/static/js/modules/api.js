@@ -7,6 +7,136 @@ export const api = {
         return response.json();
     },
 
+    // Upload a large file in resumable chunks; resumes from the server's
+    // offset after a failed or rejected chunk
+    async uploadFileChunked(file, onProgress = null, maxRetries = 5) {
+        const createResponse = await fetch('/api/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size })
+        });
+        const upload = await createResponse.json();
+        if (!createResponse.ok) {
+            return upload;
+        }
+
+        const uploadUrl = `/api/uploads/${encodeURIComponent(upload.upload_id)}`;
+        let offset = upload.offset;
+        let retries = 0;
+
+        while (true) {
+            const chunk = file.slice(offset, offset + upload.chunk_size);
+            try {
+                const response = await fetch(uploadUrl, {
+                    method: 'PATCH',
+                    headers: {
+                        'Content-Type': 'application/offset+octet-stream',
+                        'Upload-Offset': String(offset)
+                    },
+                    body: chunk
+                });
+                const result = await response.json();
+
+                if (response.status === 409) {
+                    offset = result.offset;
+                    continue;
+                }
+                if (!response.ok) {
+                    throw new Error(result.error || `Server returned ${response.status}`);
+                }
+                if (result.file_id) {
+                    return result;
+                }
+
+                offset = result.offset;
+                retries = 0;
+                if (onProgress) {
+                    onProgress(offset, file.size);
+                }
+            } catch (error) {
+                if (++retries > maxRetries) {
+                    throw error;
+                }
+                console.warn(`API uploadFileChunked: chunk at ${offset} failed, resuming`, error);
+                await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+                const status = await (await fetch(uploadUrl)).json();
+                offset = status.offset;
+            }
+        }
+    },
+
+    // Upload several files at once; onResult is called with each file's
+    // result as the server finishes processing it. Files still processing
+    // when the server ends the stream are polled until they finish
+    async uploadBatch(files, onResult) {
+        const formData = new FormData();
+        files.forEach(file => formData.append('files', file));
+
+        const response = await fetch('/api/upload/batch', {
+            method: 'POST',
+            body: formData
+        });
+        if (!response.ok) {
+            const error = await response.json();
+            throw new Error(error.error || `Server returned ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        const results = [];
+        const unfinished = [];
+        let buffer = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            for (const line of lines.filter(line => line.trim())) {
+                const result = JSON.parse(line);
+                if (result.status === 'queued' || result.status === 'running') {
+                    unfinished.push(result);
+                } else {
+                    results.push(result);
+                    onResult(result);
+                }
+            }
+
+            if (done) {
+                break;
+            }
+        }
+
+        await Promise.all(unfinished.map(async result => {
+            const final = await this.waitForBatchJob(result);
+            results.push(final);
+            onResult(final);
+        }));
+        return results;
+    },
+
+    // Poll a batch file's job until it completes or fails
+    async waitForBatchJob(result) {
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            const job = await this.getJob(result.job_id);
+            if (job.status !== 'queued' && job.status !== 'running') {
+                return {
+                    ...result,
+                    status: job.status || 'failed',
+                    summaries_copied: job.summaries_copied || false,
+                    error: job.error || null
+                };
+            }
+        }
+    },
+
+    async getJob(jobId) {
+        const response = await fetch(`/api/jobs/${encodeURIComponent(jobId)}`);
+        return response.json();
+    },
+
     async analyzeDocument(fileId, model = null) {
         const data = model ? { model } : {};
 
@@ -18,7 +148,7 @@ export const api = {
         return response.json();
     },
 
-    async fetchDocumentData(fileId) {
+    async fetchDocumentData(fileId, page = null) {
         // Sanitize the fileId to ensure it's URL-safe
         if (fileId && (fileId.includes('\\') || fileId.includes('/'))) {
             console.warn('API fetchDocumentData: File ID contains path separators:', fileId);
@@ -26,7 +156,16 @@ export const api = {
             console.log('API fetchDocumentData: Using sanitized ID:', fileId);
         }
 
-        const response = await fetch(`/api/summaries/${encodeURIComponent(fileId)}`);
+        const query = page ? `?page=${encodeURIComponent(page)}` : '';
+        const response = await fetch(`/api/summaries/${encodeURIComponent(fileId)}${query}`);
+        return response.json();
+    },
+
+    async fetchPageText(fileId, pageNumber) {
+        const response = await fetch(`/api/page-text/${encodeURIComponent(fileId)}/${encodeURIComponent(pageNumber)}`);
+        if (!response.ok) {
+            throw new Error(`Failed to load text of page ${pageNumber}: ${response.status}`);
+        }
         return response.json();
     },
 
@@ -56,12 +195,15 @@ export const api = {
         return result;
     },
 
-    async saveNotes(pageId, notes) {
+    async saveNotes(fileId, pageId, notes) {
         const response = await fetch(`/api/notes/${pageId}`, {
             method: 'PUT',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ userNotes: notes })
+            body: JSON.stringify({ fileId, userNotes: notes })
         });
+        if (!response.ok) {
+            throw new Error(`Failed to save notes: ${response.status}`);
+        }
         return response.json();
     },
 
@@ -152,8 +294,16 @@ export const api = {
         }
     },
 
-    async listFiles() {
-        const response = await fetch('/api/files');
+    async listFiles(params = {}) {
+        // Page through the files with params.cursor; filters: name, prefix, created_after, created_before
+        const query = new URLSearchParams();
+        Object.entries(params).forEach(([key, value]) => {
+            if (value !== undefined && value !== null && value !== '') {
+                query.set(key, value);
+            }
+        });
+        const queryString = query.toString();
+        const response = await fetch(`/api/files${queryString ? `?${queryString}` : ''}`);
         return response.json();
     }
 };
\ No newline at end of file
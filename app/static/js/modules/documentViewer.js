@@ -85,7 +85,8 @@ export class DocumentViewer {
         }
 
         // Calculate preview text
-        const previewText = page.text ? page.text.substring(0, 10) + '...' : 'No text';
+        const text = page.text || page.text_preview;
+        const previewText = text ? text.substring(0, 10) + '...' : 'No text';
 
         pageElement.innerHTML = `
             <div class="flex items-center justify-between">
@@ -169,6 +170,7 @@ export class DocumentViewer {
         this.setupTextActionButtons();
 
         this.updateRightPanel();
+        this.loadPageText(page);
 
         console.log(`DocumentViewer rendered page ${this.currentPageId}`);
 
@@ -181,6 +183,29 @@ export class DocumentViewer {
         return page;
     }
 
+    async loadPageText(page) {
+        // Summaries don't include page text, so fetch it for the page being shown
+        if (page.text !== undefined) {
+            return;
+        }
+
+        try {
+            const result = await api.fetchPageText(this.getDocumentId(), page.page_number);
+            page.text = result.text || '';
+        } catch (error) {
+            console.error(`DocumentViewer: Error loading text for page ${page.page_number}:`, error);
+            return;
+        }
+
+        // Only fill in the text if the page is still being shown
+        if (String(page.page_number) !== String(this.currentPageId)) {
+            return;
+        }
+        document.querySelectorAll('#extracted-text-container, #page-text-content').forEach(el => {
+            el.textContent = page.text;
+        });
+    }
+
     getPageContentHTML(page) {
         if (!this.documentData.file_type || !this.documentData.file_url) {
             return this.getDefaultContentHTML(page);
@@ -199,7 +224,7 @@ export class DocumentViewer {
     getDefaultContentHTML(page) {
         return `
             <div class="overflow-auto h-full">
-                <div class="text-sm whitespace-pre-wrap">${page.text}</div>
+                <div id="page-text-content" class="text-sm whitespace-pre-wrap">${page.text !== undefined ? page.text : 'Loading text...'}</div>
             </div>
             ${this.getPageIndicatorHTML()}
         `;
@@ -308,7 +333,7 @@ export class DocumentViewer {
             </div>
             
             <div id="extracted-text-container" class="mt-1 p-2 border rounded text-xs whitespace-pre-wrap bg-gray-50 hidden max-h-[20vh] overflow-auto">
-                ${page.text}
+                ${page.text !== undefined ? page.text : 'Loading text...'}
             </div>
         `;
     }
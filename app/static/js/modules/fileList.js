@@ -1,46 +1,72 @@
 import { api } from './api.js';
 
+// Files fetched per page, and the pause after typing before searching
+const FILES_PAGE_SIZE = 50;
+const SEARCH_DELAY = 300;
+
 export class FileListHandler {
     constructor(elements, onFileSelected) {
         this.elements = elements;
         this.onFileSelected = onFileSelected;
         this.files = [];
+        this.nextCursor = null;
+        this.searchTerm = '';
+        this.searchTimer = null;
+        this.loading = false;
         this.initializeEventListeners();
         this.loadFiles();
     }
 
     initializeEventListeners() {
-        // Add any event listeners for the file list UI
+        const fileSearch = this.elements.fileSearch;
+        if (fileSearch) {
+            fileSearch.addEventListener('input', () => {
+                clearTimeout(this.searchTimer);
+                this.searchTimer = setTimeout(() => {
+                    this.searchTerm = fileSearch.value.trim();
+                    this.loadFiles();
+                }, SEARCH_DELAY);
+            });
+        }
     }
 
-    async loadFiles() {
+    async loadFiles(append = false) {
+        if (this.loading) return;
+        this.loading = true;
+
         try {
-            const response = await api.listFiles();
+            const response = await api.listFiles({
+                limit: FILES_PAGE_SIZE,
+                cursor: append ? this.nextCursor : null,
+                name: this.searchTerm
+            });
             if (response.success) {
-                this.files = response.files;
-                this.renderFiles();
+                this.files = append ? this.files.concat(response.files) : response.files;
+                this.nextCursor = response.next_cursor;
+                this.renderFiles(append ? response.files : this.files, append);
             } else {
                 console.error('Failed to load files:', response.error);
             }
         } catch (error) {
             console.error('Error loading files:', error);
+        } finally {
+            this.loading = false;
         }
     }
 
-    renderFiles() {
+    renderFiles(files, append = false) {
         const fileList = this.elements.fileList;
         if (!fileList) return;
 
-        // Clear existing content
-        fileList.innerHTML = '';
-
-        // Sort files by creation date (newest first)
-        const sortedFiles = [...this.files].sort((a, b) => {
-            return new Date(b.created) - new Date(a.created);
-        });
+        // Clear existing content, or just the old "Load more" button when adding a page
+        if (append) {
+            fileList.querySelector('.load-more-files')?.remove();
+        } else {
+            fileList.innerHTML = '';
+        }
 
-        // Create file list items
-        sortedFiles.forEach(file => {
+        // Files come newest first from the server
+        files.forEach(file => {
             const fileItem = document.createElement('div');
             fileItem.className = 'file-item p-4 border-b hover:bg-gray-50 cursor-pointer';
             fileItem.innerHTML = `
@@ -65,5 +91,13 @@ export class FileListHandler {
 
             fileList.appendChild(fileItem);
         });
+
+        if (this.nextCursor) {
+            const loadMore = document.createElement('button');
+            loadMore.className = 'load-more-files w-full p-3 text-sm text-indigo-600 hover:bg-gray-50';
+            loadMore.textContent = 'Load more';
+            loadMore.addEventListener('click', () => this.loadFiles(true));
+            fileList.appendChild(loadMore);
+        }
     }
-} 
\ No newline at end of file
+}
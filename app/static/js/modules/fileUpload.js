@@ -1,5 +1,13 @@
 import { api } from './api.js';
 
+// Files larger than this are sent with the resumable chunked upload API
+const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+
+// Batch requests are split to stay under the server's MAX_CONTENT_LENGTH
+// (16 MB, less room for the multipart encoding) and BATCH_UPLOAD_MAX_FILES
+const MAX_BATCH_BYTES = 15 * 1024 * 1024;
+const MAX_BATCH_FILES = 20;
+
 export class FileUploadHandler {
     constructor(elements, onFileProcessed) {
         this.elements = elements;
@@ -13,7 +21,9 @@ export class FileUploadHandler {
 
         dropArea.addEventListener('click', () => fileInput.click());
         fileInput.addEventListener('change', () => {
-            if (fileInput.files.length) {
+            if (fileInput.files.length > 1) {
+                this.handleFiles(Array.from(fileInput.files));
+            } else if (fileInput.files.length) {
                 this.handleFile(fileInput.files[0]);
             }
         });
@@ -36,7 +46,9 @@ export class FileUploadHandler {
         dropArea.addEventListener('drop', (e) => {
             e.preventDefault();
             dropArea.classList.remove('active');
-            if (e.dataTransfer.files.length) {
+            if (e.dataTransfer.files.length > 1) {
+                this.handleFiles(Array.from(e.dataTransfer.files));
+            } else if (e.dataTransfer.files.length) {
                 this.handleFile(e.dataTransfer.files[0]);
             }
         });
@@ -52,22 +64,38 @@ export class FileUploadHandler {
         window.showLoading('Uploading file...');
 
         try {
-            const formData = new FormData();
-            formData.append('file', file);
-
-            const uploadData = await api.uploadFile(formData);
+            let uploadData;
+            if (file.size > CHUNKED_UPLOAD_THRESHOLD) {
+                // Large files go up in resumable chunks
+                uploadData = await api.uploadFileChunked(file, (sent, total) => {
+                    window.updateLoadingMessage(`Uploading file... ${Math.round(sent / total * 100)}%`);
+                });
+            } else {
+                const formData = new FormData();
+                formData.append('file', file);
+                uploadData = await api.uploadFile(formData);
+            }
             if (!uploadData.file_id) {
                 throw new Error('File upload failed');
             }
 
             this.currentFileId = uploadData.file_id;
 
+            // Processing runs as a background job; wait for it to finish
+            let job = null;
+            if (uploadData.job_id) {
+                job = await this.waitForJob(uploadData.job_id);
+            }
+
             // Fetch and display document immediately without waiting for analysis
             window.updateLoadingMessage('Loading document...');
             await this.fetchDocumentData();
 
-            // Trigger analysis in background after document is shown
-            this.triggerBackgroundAnalysis();
+            // Trigger analysis in background after document is shown; a
+            // duplicate upload may have copied the summaries of the other document
+            if (!(job && job.summaries_copied)) {
+                this.triggerBackgroundAnalysis();
+            }
         } catch (error) {
             console.error('Error:', error);
             window.hideLoading();
@@ -75,6 +103,135 @@ export class FileUploadHandler {
         }
     }
 
+    // Upload several files in batch requests and open the first one processed.
+    // Large files go up in resumable chunks instead, one at a time
+    async handleFiles(files) {
+        const allowedTypes = ['application/pdf', 'image/jpeg', 'image/png', 'image/jpg'];
+        const accepted = files.filter(file => allowedTypes.includes(file.type));
+        if (!accepted.length) {
+            alert('Please upload PDF or image files (JPEG, PNG).');
+            return;
+        }
+
+        window.showLoading(`Uploading ${accepted.length} files...`);
+
+        try {
+            let processed = 0;
+            const onResult = (result) => {
+                processed++;
+                window.updateLoadingMessage(`Processed ${processed} of ${accepted.length} files...`);
+                if (result.status !== 'completed') {
+                    console.warn(`Batch upload: ${result.filename} ${result.status}`, result.error);
+                }
+            };
+
+            const results = [];
+            const small = accepted.filter(file => file.size <= CHUNKED_UPLOAD_THRESHOLD);
+            for (const batch of this.splitIntoBatches(small)) {
+                results.push(...await this.uploadBatch(batch, onResult));
+            }
+            for (const file of accepted.filter(file => file.size > CHUNKED_UPLOAD_THRESHOLD)) {
+                results.push(await this.uploadChunkedBatchFile(file, onResult));
+            }
+
+            const first = results.find(result => result.status === 'completed');
+            if (!first) {
+                throw new Error('No files were processed');
+            }
+
+            this.currentFileId = first.file_id;
+            window.updateLoadingMessage('Loading document...');
+            await this.fetchDocumentData();
+
+            // Analyze every new document in the background
+            results
+                .filter(result => result.status === 'completed' && !result.summaries_copied)
+                .forEach(result => api.analyzeDocument(result.file_id).catch(error => {
+                    console.error(`Error analyzing ${result.filename}:`, error);
+                }));
+        } catch (error) {
+            console.error('Error:', error);
+            window.hideLoading();
+            alert('An error occurred while uploading the files.');
+        }
+    }
+
+    // Group files into batches that each fit in one request
+    splitIntoBatches(files) {
+        const batches = [];
+        let batch = [];
+        let batchBytes = 0;
+        for (const file of files) {
+            if (batch.length && (batchBytes + file.size > MAX_BATCH_BYTES || batch.length === MAX_BATCH_FILES)) {
+                batches.push(batch);
+                batch = [];
+                batchBytes = 0;
+            }
+            batch.push(file);
+            batchBytes += file.size;
+        }
+        if (batch.length) {
+            batches.push(batch);
+        }
+        return batches;
+    }
+
+    // Upload one batch; a rejected request fails only the files in it
+    async uploadBatch(files, onResult) {
+        try {
+            return await api.uploadBatch(files, onResult);
+        } catch (error) {
+            console.error('Error uploading batch:', error);
+            return files.map(file => {
+                const result = { filename: file.name, status: 'failed', error: error.message };
+                onResult(result);
+                return result;
+            });
+        }
+    }
+
+    // Upload a file of a batch in chunks and wait for its job, reporting it like a batch result
+    async uploadChunkedBatchFile(file, onResult) {
+        let result;
+        try {
+            const upload = await api.uploadFileChunked(file);
+            if (!upload.job_id) {
+                throw new Error(upload.error || 'File upload failed');
+            }
+            result = await api.waitForBatchJob({ ...upload, filename: upload.filename || file.name });
+        } catch (error) {
+            console.error(`Error uploading ${file.name}:`, error);
+            result = { filename: file.name, status: 'failed', error: error.message };
+        }
+        onResult(result);
+        return result;
+    }
+
+    // Poll the ingestion job until it completes, showing stage and page progress
+    async waitForJob(jobId) {
+        while (true) {
+            const job = await api.getJob(jobId);
+
+            if (job.status === 'completed') {
+                return job;
+            }
+            if (job.status === 'failed' || job.error) {
+                throw new Error(job.error || 'Processing failed');
+            }
+
+            const stage = (job.stages || []).find(s => s.status === 'running');
+            if (stage && stage.name === 'extract' && job.pages_total) {
+                window.updateLoadingMessage(`Extracting text... page ${job.pages_done} of ${job.pages_total}`);
+            } else if (stage && stage.name === 'upload') {
+                window.updateLoadingMessage('Uploading to cloud storage...');
+            } else {
+                window.updateLoadingMessage('Processing file...');
+            }
+
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    }
+
     async fetchDocumentData() {
         try {
             const data = await api.fetchDocumentData(this.currentFileId);
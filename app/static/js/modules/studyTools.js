@@ -1,5 +1,8 @@
 import { api } from './api.js';
 
+// Milliseconds after the last keystroke before notes are autosaved
+const NOTES_AUTOSAVE_DELAY = 1000;
+
 export class StudyTools {
     constructor(elements) {
         this.elements = elements;
@@ -8,6 +11,7 @@ export class StudyTools {
         this.models = null;
         this.selectedSummaryModel = null;
         this.pageData = {};  // Store page data including summaries
+        this.notesAutosaveTimer = null;
         this.initializeEventListeners();
         this.loadAvailableModels();
     }
@@ -235,6 +239,7 @@ export class StudyTools {
 
         // Notes functionality
         saveNotesButton.addEventListener('click', () => this.saveNotes());
+        this.elements.notesTextarea.addEventListener('input', () => this.scheduleNotesAutosave());
 
         // Listen for page changes
         document.addEventListener('pageChanged', (e) => {
@@ -249,6 +254,11 @@ export class StudyTools {
 
             // Update content with the new page data
             this.updateContent(e.detail.page);
+
+            // Pages of very large documents are extracted on first view
+            if (e.detail.page && e.detail.page.extracted === false) {
+                this.loadPendingPage(e.detail.page.page_number);
+            }
         });
 
         // Listen for summary updates from background processing
@@ -550,15 +560,33 @@ export class StudyTools {
         `;
     }
 
-    async saveNotes() {
+    scheduleNotesAutosave() {
+        // Capture the page now, in case the user moves to another page before the save runs
+        const pageId = this.currentPageId;
         const notes = this.elements.notesTextarea.value.trim();
 
+        clearTimeout(this.notesAutosaveTimer);
+        this.notesAutosaveTimer = setTimeout(() => this.saveNotes(pageId, notes, true), NOTES_AUTOSAVE_DELAY);
+    }
+
+    async saveNotes(pageId = this.currentPageId, notes = this.elements.notesTextarea.value.trim(), silent = false) {
+        if (!silent) {
+            clearTimeout(this.notesAutosaveTimer);
+        }
+
         try {
-            await api.saveNotes(this.currentPageId, notes);
-            this.showSaveSuccess();
+            await api.saveNotes(this.currentFileId, pageId, notes);
+            if (this.pageData[pageId]) {
+                this.pageData[pageId].notes = notes;
+            }
+            if (!silent) {
+                this.showSaveSuccess();
+            }
         } catch (error) {
             console.error('Error:', error);
-            alert('An error occurred while saving your notes.');
+            if (!silent) {
+                alert('An error occurred while saving your notes.');
+            }
         }
     }
 
@@ -575,6 +603,16 @@ export class StudyTools {
         }, 2000);
     }
 
+    // Ask the server to extract a page that has not been extracted yet
+    async loadPendingPage(pageNumber) {
+        try {
+            const documentData = await api.fetchDocumentData(this.currentFileId, pageNumber);
+            this.handleSummariesUpdated(documentData);
+        } catch (error) {
+            console.error(`StudyTools: Error loading page ${pageNumber}:`, error);
+        }
+    }
+
     // New method to handle updated summaries
     handleSummariesUpdated(documentData) {
         if (!documentData || !documentData.pages) {
@@ -0,0 +1,392 @@
+import os
+import json
+import time
+import base64
+import bisect
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: manifest writes are only serialized within a process
+    fcntl = None
+
+from flask import current_app
+from app.utils.document_locks import get_lock_dir
+from app.utils.gcs_utils import parse_blob_name
+from app.utils.storage_backends import get_storage_backend
+
+_app = None
+_interval = 0
+_refresher_pid = None
+_refresher_lock = threading.Lock()
+
+# Parsed manifest of this process and the (path, mtime, size) it was read at
+_entries = {}
+_version = None
+_cache_lock = threading.Lock()
+_write_lock = threading.Lock()
+_bootstrapped = False
+
+# Entry fields only the manifest itself uses, not returned to callers
+INTERNAL_FIELDS = ('recorded',)
+
+# (created, file_id) of every entry in ascending order, for the version it was built at
+_index = []
+_index_version = None
+
+def init_bucket_manifest(app):
+    """Set up background refreshes of the bucket manifest
+
+    The refresher starts with the first request of each worker process and
+    lists the bucket every BUCKET_MANIFEST_REFRESH_INTERVAL seconds (0
+    disables it). Only one worker lists at a time.
+
+    Args:
+        app (Flask): The application the refresher runs under
+    """
+    global _app, _interval
+
+    _app = app
+    _interval = app.config['BUCKET_MANIFEST_REFRESH_INTERVAL']
+    if _interval > 0:
+        app.before_request(_ensure_refresher)
+
+def lookup_file(file_id):
+    """Find an uploaded file by ID, without calling GCS
+
+    Args:
+        file_id (str): The ID of the file
+
+    Returns:
+        dict: The file's id, name (original name without extension),
+            extension, blob_name, size and created time, or None if the
+            bucket has no such file
+    """
+    entry = _load().get(file_id)
+    return _public(entry) if entry else None
+
+def query_manifest(limit, cursor=None, prefix=None, name=None, created_after=None, created_before=None):
+    """Return one page of files, newest first, with optional filters
+
+    The page is found by binary search in an index sorted by creation time,
+    so its cost depends on the page size rather than on the number of
+    files in the bucket (name filters scan until the page is full).
+
+    Args:
+        limit (int): Most files to return
+        cursor (str, optional): next_cursor of the previous page
+        prefix (str, optional): Only names starting with this (case-insensitive)
+        name (str, optional): Only names containing this (case-insensitive)
+        created_after (str, optional): Only files created at or after this ISO date/time
+        created_before (str, optional): Only files created before this ISO date/time
+            (both taken as UTC unless they have an offset)
+
+    Returns:
+        tuple: List of file dicts and the cursor of the next page (None on the last page)
+
+    Raises:
+        ValueError: If the cursor is not one returned by this function, or a
+            date/time is not in ISO format
+    """
+    created_after = _parse_time(created_after, 'created_after') if created_after else None
+    created_before = _parse_time(created_before, 'created_before') if created_before else None
+    entries, index = _sorted_index()
+
+    # Walk the ascending index backwards from the newest candidate
+    position = len(index)
+    if created_before:
+        position = bisect.bisect_left(index, (created_before, ''))
+    if cursor:
+        position = min(position, bisect.bisect_left(index, _decode_cursor(cursor)))
+
+    prefix = prefix.lower() if prefix else None
+    name = name.lower() if name else None
+    files = []
+    while position > 0 and len(files) < limit:
+        position -= 1
+        created, file_id = index[position]
+        if created_after and created < created_after:
+            position = 0
+            break
+        entry = entries.get(file_id)
+        if entry is None:
+            continue
+        entry_name = entry['name'].lower()
+        if (prefix and not entry_name.startswith(prefix)) or (name and name not in entry_name):
+            continue
+        files.append(_public(entry))
+
+    next_cursor = None
+    if position > 0 and len(files) == limit:
+        next_cursor = _encode_cursor(index[position])
+    return files, next_cursor
+
+def record_upload(blob_name, size=None, created=None):
+    """Add a blob this process just uploaded
+
+    Args:
+        blob_name (str): Name of the blob in the bucket
+        size (int, optional): Size in bytes
+        created (datetime, optional): When GCS created the blob
+    """
+    entry = _make_entry(blob_name, size, created)
+    if entry is None:
+        return
+
+    entry['recorded'] = time.time()
+
+    def add(entries, deleted):
+        entries[entry['id']] = entry
+        deleted.pop(entry['id'], None)
+
+    _update(add)
+
+def forget_file(file_id):
+    """Remove a file deleted from the bucket
+
+    The deletion is remembered until the next listing that started after
+    it, so a listing that still saw the file doesn't add it back.
+    """
+    def forget(entries, deleted):
+        entries.pop(file_id, None)
+        deleted[file_id] = time.time()
+
+    _update(forget)
+
+def refresh_manifest():
+    """List the bucket and bring the manifest up to date
+
+    Only the names, sizes and creation times of blobs are fetched and no
+    URLs are signed. The manifest file is only rewritten when a file was
+    added or removed. Uploads recorded while the listing ran are kept even
+    if the listing missed them, and files deleted while it ran are not
+    added back even if it saw them.
+
+    Returns:
+        dict: Number of files added and removed, and the total
+    """
+    started = time.time()
+    listed = {}
+    for blob in get_storage_backend().list(prefix='uploads/'):
+        entry = _make_entry(blob['name'], blob['size'], blob['created'])
+        if entry:
+            listed[entry['id']] = entry
+
+    counts = {}
+
+    def apply(entries, deleted):
+        removed = [file_id for file_id, entry in entries.items()
+                   if file_id not in listed and entry.get('recorded', 0) < started]
+        added = [file_id for file_id in listed
+                 if file_id not in entries and deleted.get(file_id, 0) < started]
+        for file_id in removed:
+            del entries[file_id]
+        for file_id in added:
+            entries[file_id] = listed[file_id]
+        # Deletions before the listing started are reflected in it already
+        for file_id in [file_id for file_id, deleted_at in deleted.items() if deleted_at < started]:
+            del deleted[file_id]
+        counts.update({'added': len(added), 'removed': len(removed), 'total': len(entries)})
+
+    _update(apply, refreshed=started)
+    return counts
+
+def _sorted_index():
+    """Return the entries and their index by creation time, rebuilding it when the manifest changed"""
+    global _index, _index_version
+
+    if not _load():
+        return {}, []
+    with _cache_lock:
+        entries, version = _entries, _version
+        if _index_version == version:
+            return entries, _index
+
+    index = sorted((_index_time(entry.get('created')), file_id) for file_id, entry in entries.items())
+    with _cache_lock:
+        _index, _index_version = index, version
+    return entries, index
+
+def _parse_time(value, name):
+    """Parse an ISO date/time into the UTC form the index is sorted by"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {name}: {value} (expected an ISO date or time)")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')
+
+def _index_time(created):
+    """Return an entry's created time in the UTC form the index is sorted by, '' if unknown"""
+    try:
+        return _parse_time(created, 'created')
+    except ValueError:
+        return ''
+
+def _public(entry):
+    """Copy an entry without its internal fields"""
+    return {key: value for key, value in entry.items() if key not in INTERNAL_FIELDS}
+
+def _encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+def _decode_cursor(cursor):
+    try:
+        created, file_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(created), str(file_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+def _make_entry(blob_name, size, created):
+    entry = parse_blob_name(blob_name)
+    if entry is None:
+        return None
+    entry.update({
+        'blob_name': blob_name,
+        'size': int(size) if size is not None else None,
+        'created': created.isoformat() if created else None
+    })
+    return entry
+
+def _manifest_path():
+    return current_app.config['BUCKET_MANIFEST_PATH']
+
+def _read(path):
+    """Read the manifest file, or an empty one if it is missing or for another bucket"""
+    try:
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {'files': {}}
+    except Exception as e:
+        print(f"Error reading bucket manifest {path}: {str(e)}")
+        return {'files': {}}
+
+    if manifest.get('bucket') != get_storage_backend().name:
+        return {'files': {}}
+    return manifest
+
+def _load():
+    """Return the manifest entries, re-reading the file only when it changed"""
+    global _entries, _version, _bootstrapped
+
+    path = _manifest_path()
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        # The first request of a fresh install lists the bucket once, if it can
+        if not _bootstrapped:
+            _bootstrapped = True
+            try:
+                refresh_manifest()
+                stat = os.stat(path)
+            except Exception as e:
+                print(f"Could not build the bucket manifest: {str(e)}")
+                return {}
+        else:
+            return {}
+
+    version = (path, stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        if version == _version:
+            return _entries
+
+    entries = _read(path)['files']
+    with _cache_lock:
+        _entries, _version = entries, version
+    return entries
+
+def _update(change, refreshed=None):
+    """Apply a change to the manifest file under the cross-worker write lock
+
+    Args:
+        change (callable): Called with the entries and the deletion times of
+            recently deleted files, which it modifies in place
+        refreshed (float, optional): When the listing the change comes from started
+    """
+    global _entries, _version
+
+    path = _manifest_path()
+    with _manifest_lock():
+        manifest = _read(path)
+        manifest.setdefault('deleted', {})
+        before = json.dumps([manifest['files'], manifest['deleted']], sort_keys=True)
+        change(manifest['files'], manifest['deleted'])
+        if refreshed is None and json.dumps([manifest['files'], manifest['deleted']], sort_keys=True) == before:
+            return
+
+        manifest['bucket'] = get_storage_backend().name
+        if refreshed is not None:
+            manifest['refreshed'] = refreshed
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, path)
+
+        stat = os.stat(path)
+        with _cache_lock:
+            _entries, _version = manifest['files'], (path, stat.st_mtime_ns, stat.st_size)
+
+@contextmanager
+def _manifest_lock():
+    with _write_lock:
+        if fcntl is None:
+            yield
+            return
+
+        with open(os.path.join(get_lock_dir(), 'bucket_manifest.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _try_refresh_lock():
+    """Take the lock for listing the bucket without waiting, or return None"""
+    if fcntl is None:
+        return True
+
+    lock_file = open(os.path.join(get_lock_dir(), 'bucket_manifest_refresh.lock'), 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+def _ensure_refresher():
+    """Start the refresh thread in this process (again after a fork)"""
+    global _refresher_pid
+
+    with _refresher_lock:
+        if _refresher_pid == os.getpid():
+            return
+        _refresher_pid = os.getpid()
+
+    threading.Thread(target=_refresh_loop, name='bucket-manifest', daemon=True).start()
+
+def _refresh_loop():
+    while True:
+        try:
+            with _app.app_context():
+                # Skip the listing if another worker refreshed recently
+                if time.time() - _read(_manifest_path()).get('refreshed', 0) >= _interval:
+                    lock = _try_refresh_lock()
+                    if lock is not None:
+                        try:
+                            counts = refresh_manifest()
+                            print(f"Refreshed bucket manifest: {counts}")
+                        finally:
+                            if lock is not True:
+                                fcntl.flock(lock, fcntl.LOCK_UN)
+                                lock.close()
+        except Exception as e:
+            print(f"Error refreshing bucket manifest: {str(e)}")
+            print(traceback.format_exc())
+        time.sleep(_interval)
@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: chunks of an upload are only serialized within a process
+    fcntl = None
+
+from flask import current_app
+
+# Size of the reads from the request stream while appending a chunk
+STREAM_READ_SIZE = 64 * 1024
+
+# Running SHA-256 per upload in this process, with the offset it covers.
+# A worker that didn't see the earlier chunks rebuilds it from the part file.
+_hashers = {}
+_hashers_lock = threading.Lock()
+_part_locks = {}  # upload ID -> lock, without fcntl
+
+class UploadOffsetMismatch(Exception):
+    """Raised when a chunk does not start at the upload's current offset"""
+
+    def __init__(self, expected):
+        super().__init__(f"Chunk must start at offset {expected}")
+        self.expected = expected
+
+def get_session_dir():
+    """Return the directory holding upload sessions and their partial files"""
+    session_dir = current_app.config['UPLOAD_SESSION_DIR']
+    os.makedirs(session_dir, exist_ok=True)
+    return session_dir
+
+def create_upload_session(filename, size):
+    """Start a resumable upload
+
+    Args:
+        filename (str): Sanitized original filename
+        size (int): Total size of the file in bytes
+
+    Returns:
+        dict: The session record
+    """
+    upload_id = str(uuid.uuid4())
+    session = {
+        'upload_id': upload_id,
+        'file_id': str(uuid.uuid4()),
+        'filename': filename,
+        'size': size,
+        'created': time.time()
+    }
+
+    session_dir = get_session_dir()
+    open(os.path.join(session_dir, f"{upload_id}.part"), 'wb').close()
+    with open(os.path.join(session_dir, f"{upload_id}.json"), 'w') as f:
+        json.dump(session, f)
+
+    print(f"Created upload session {upload_id} for {filename} ({size} bytes)")
+    return session
+
+def get_upload_session(upload_id):
+    """Load an upload session along with its current offset
+
+    Args:
+        upload_id (str): The ID of the upload
+
+    Returns:
+        dict: The session record with an 'offset' key, or None if unknown
+    """
+    if not upload_id or os.path.basename(upload_id) != upload_id:
+        return None
+
+    session_dir = get_session_dir()
+    try:
+        with open(os.path.join(session_dir, f"{upload_id}.json"), 'r') as f:
+            session = json.load(f)
+        session['offset'] = os.path.getsize(os.path.join(session_dir, f"{upload_id}.part"))
+    except FileNotFoundError:
+        return None
+    return session
+
+def append_chunk(session, offset, stream):
+    """Append a chunk from a request stream to the upload's partial file
+
+    The chunk is copied to disk in small reads and hashed as it goes, so
+    memory use does not depend on the chunk or file size.
+
+    Args:
+        session (dict): Session from get_upload_session
+        offset (int): Offset the client says the chunk starts at
+        stream: Readable binary stream with the chunk data
+
+    Returns:
+        int: The new offset
+
+    Chunks of the same upload are written one at a time, also across
+    workers: a retried chunk sent while the first attempt is still being
+    written waits for it and then gets UploadOffsetMismatch.
+
+    Raises:
+        UploadOffsetMismatch: If offset is not the current end of the file
+        ValueError: If the chunk would make the file larger than declared
+    """
+    upload_id = session['upload_id']
+    part_path = os.path.join(get_session_dir(), f"{upload_id}.part")
+
+    with _locked_part_file(upload_id, part_path) as part_file:
+        if part_file is None:
+            # Finished by another request meanwhile
+            raise UploadOffsetMismatch(session['size'])
+
+        current = part_file.seek(0, os.SEEK_END)
+        if offset != current:
+            raise UploadOffsetMismatch(current)
+
+        digest = _get_hasher(upload_id, part_path, current)
+        written = current
+
+        while True:
+            data = stream.read(STREAM_READ_SIZE)
+            if not data:
+                break
+            if written + len(data) > session['size']:
+                part_file.truncate(current)
+                _drop_hasher(upload_id)
+                raise ValueError(f"Upload exceeds its declared size of {session['size']} bytes")
+            part_file.write(data)
+            digest.update(data)
+            written += len(data)
+
+        with _hashers_lock:
+            _hashers[upload_id] = (written, digest)
+    return written
+
+def finish_upload(session, dest_path):
+    """Move a fully received upload into place
+
+    Args:
+        session (dict): Session from get_upload_session
+        dest_path (str): Final location of the file
+
+    Returns:
+        str: Hex SHA-256 digest of the file contents
+    """
+    upload_id = session['upload_id']
+    session_dir = get_session_dir()
+    part_path = os.path.join(session_dir, f"{upload_id}.part")
+
+    # Under the part file's lock, so no chunk is being written while it is moved
+    with _locked_part_file(upload_id, part_path) as part_file:
+        if part_file is None:
+            raise FileNotFoundError(f"Upload {upload_id} was already finished")
+        content_hash = _get_hasher(upload_id, part_path, part_file.seek(0, os.SEEK_END)).hexdigest()
+        os.replace(part_path, dest_path)
+    os.remove(os.path.join(session_dir, f"{upload_id}.json"))
+    _drop_hasher(upload_id)
+    with _hashers_lock:
+        _part_locks.pop(upload_id, None)
+
+    print(f"Upload session {upload_id} complete: {dest_path}")
+    return content_hash
+
+@contextmanager
+def _locked_part_file(upload_id, part_path):
+    """Open an upload's partial file for writing, holding its exclusive lock
+
+    Yields:
+        The open file, or None if the upload was finished and the file moved
+    """
+    if fcntl is None:
+        with _hashers_lock:
+            lock = _part_locks.setdefault(upload_id, threading.Lock())
+        with lock:
+            try:
+                part_file = open(part_path, 'r+b')
+            except FileNotFoundError:
+                yield None
+                return
+            with part_file:
+                yield part_file
+        return
+
+    try:
+        part_file = open(part_path, 'r+b')
+    except FileNotFoundError:
+        yield None
+        return
+
+    with part_file:
+        fcntl.flock(part_file, fcntl.LOCK_EX)
+        try:
+            # finish_upload moves the file away; don't write to it after that
+            try:
+                moved = os.stat(part_path).st_ino != os.fstat(part_file.fileno()).st_ino
+            except FileNotFoundError:
+                moved = True
+            yield None if moved else part_file
+        finally:
+            part_file.flush()
+            fcntl.flock(part_file, fcntl.LOCK_UN)
+
+def _get_hasher(upload_id, part_path, offset):
+    """Return the running hash for an upload, rebuilding it from disk if needed"""
+    with _hashers_lock:
+        cached = _hashers.get(upload_id)
+    if cached and cached[0] == offset:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    with open(part_path, 'rb') as f:
+        remaining = offset
+        while remaining:
+            data = f.read(min(STREAM_READ_SIZE, remaining))
+            if not data:
+                break
+            digest.update(data)
+            remaining -= len(data)
+    return digest
+
+def _drop_hasher(upload_id):
+    with _hashers_lock:
+        _hashers.pop(upload_id, None)
@@ -1,6 +1,4 @@
 import os
-import json
-import tempfile
 import importlib.util
 import time
 import re
@@ -60,6 +58,9 @@ DEFAULT_QA_MODEL = validate_model_name(env_qa_model)
 
 print(f"Model validation complete - Using summary model: {DEFAULT_SUMMARY_MODEL}, Q&A model: {DEFAULT_QA_MODEL}")
 
+# Pages of a lazy document extracted at a time for a question about the whole document
+LEADING_PAGES_BATCH = 4
+
 def configure_openai():
     """Configure the OpenAI client with API key and base URL"""
     try:
@@ -262,6 +263,43 @@ def generate_mock_summary(text):
     else:
         return "Brief content about " + " ".join(words[0:3]) + ". " + " ".join(words[-3:]) + " are also mentioned."
 
+def _max_context_chars(model):
+    """Return the characters of document text a question to a model may include"""
+    if model == "gpt-4-turbo":
+        # A large part of its 128K window, but limited to ~100K tokens to be safe
+        return 400000
+    # Three quarters of the context window, at about 4 characters per token
+    return int(AI_MODELS.get(model, {}).get("max_tokens", 4000) * 0.75) * 4
+
+def _extract_leading_pages(file_id, doc_data, max_chars):
+    """Extract the first pages of a lazy document until their text fills max_chars
+
+    Pages are extracted a few at a time, in order, and are not summarized.
+    A page whose extraction fails is not tried again by this call.
+    """
+    from app.utils.lazy_extraction import ensure_pages_extracted
+
+    attempted = set()
+    while doc_data.get('lazy'):
+        total = 0
+        batch = []
+        for page in sorted(doc_data.get('pages', []), key=lambda page: page['page_number']):
+            if total >= max_chars:
+                break
+            if page.get('extracted') is False and page['page_number'] not in attempted:
+                batch.append(page['page_number'])
+                if len(batch) == LEADING_PAGES_BATCH:
+                    break
+            elif batch:
+                break
+            else:
+                total += len(page.get('text') or '')
+        if not batch:
+            break
+        attempted.update(batch)
+        doc_data = ensure_pages_extracted(file_id, doc_data, batch, readahead=0, summarize=False)
+    return doc_data
+
 def get_answer(question, file_id, page_id=None, model=None):
     """Get an answer to a question about a document
     
@@ -285,6 +323,16 @@ def get_answer(question, file_id, page_id=None, model=None):
         if not doc_data:
             return "Document not found or not processed yet. Please try uploading again."
         
+        # Lazy documents extract the pages the question needs first, without
+        # summarizing them: the page asked about, or as many leading pages as
+        # fit in the model's context. The rest are left to the read-ahead
+        if doc_data.get('lazy'):
+            from app.utils.lazy_extraction import ensure_pages_extracted
+            if page_id and str(page_id).isdigit():
+                doc_data = ensure_pages_extracted(file_id, doc_data, [int(page_id)], summarize=False)
+            else:
+                doc_data = _extract_leading_pages(file_id, doc_data, _max_context_chars(model))
+        
         # Get relevant content
         pages = doc_data.get('pages', [])
         if not pages:
@@ -319,25 +367,14 @@ def get_answer(question, file_id, page_id=None, model=None):
                 # Log which model is being used
                 print(f"Using model: {model} with max_tokens: {max_context_tokens}")
                 
-                # For GPT-4-Turbo, use special handling for its larger context window
-                if model == "gpt-4-turbo":
-                    # For GPT-4-Turbo, use a larger portion of the context window
-                    # Still limit to ~100K tokens to be safe (128K is the limit)
-                    max_input_chars = 400000  # Approximate 100K tokens
-                    original_length = len(context)
-                    if len(context) > max_input_chars:
-                        context = context[:max_input_chars]
-                        print(f"Context truncated for GPT-4-Turbo from {original_length} chars to ~100K tokens")
+                # Truncate the context to what the model's context window allows
+                original_length = len(context)
+                max_chars = _max_context_chars(model)
+                if len(context) > max_chars:
+                    context = context[:max_chars]
+                    print(f"Context truncated from {original_length} chars to ~{max_chars // 4} tokens for {model}")
                 else:
-                    # Original logic for other models
-                    original_length = len(context)
-                    max_input_tokens = int(max_context_tokens * 0.75)
-                    max_chars = max_input_tokens * 4  # Approximate 4 chars per token
-                    if len(context) > max_chars:
-                        context = context[:max_chars]
-                        print(f"Context truncated from {original_length} chars to ~{max_input_tokens} tokens for {model}")
-                    else:
-                        print(f"Context length OK: {len(context)} chars (~{len(context)/4} tokens) for {model}")
+                    print(f"Context length OK: {len(context)} chars (~{len(context)/4} tokens) for {model}")
                 
                 # Define a reasonable output token limit based on the model
                 if model == "gpt-4-turbo":
@@ -474,7 +511,7 @@ def generate_mock_answer(question, file_id, context):
         return f"Based on the document content about {' and '.join(relevant_words[:3])}, the answer relates to the information presented in the text."
 
 def load_document_data(file_id):
-    """Load document data from the temporary storage
+    """Load document data from the document store
     
     Args:
         file_id (str): The ID of the file
@@ -482,15 +519,5 @@ def load_document_data(file_id):
     Returns:
         dict: Document data
     """
-    temp_dir = os.path.join(tempfile.gettempdir(), 'studyflow')
-    file_path = os.path.join(temp_dir, f"{file_id}.json")
-    
-    if not os.path.exists(file_path):
-        return None
-    
-    try:
-        with open(file_path, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading document data: {str(e)}")
-        return None 
\ No newline at end of file
+    from app.utils.document_store import get_document_store
+    return get_document_store().load(file_id) 
\ No newline at end of file
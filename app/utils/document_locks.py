@@ -0,0 +1,93 @@
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from flask import current_app, has_app_context
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only cover the threads of one process
+    fcntl = None
+
+# Locks held by the current thread: file_id -> [lock file, shared, depth]
+_held = threading.local()
+
+# Fallback for platforms without fcntl: one lock per document, shared or not
+_thread_locks = {}
+_thread_locks_lock = threading.Lock()
+
+def get_lock_dir():
+    """Return the directory holding the per-document lock files"""
+    if has_app_context():
+        lock_dir = current_app.config['DOCUMENT_LOCK_DIR']
+    else:
+        lock_dir = os.path.join(tempfile.gettempdir(), 'studyflow', 'locks')
+    os.makedirs(lock_dir, exist_ok=True)
+    return lock_dir
+
+@contextmanager
+def document_lock(file_id, shared=False):
+    """Hold a reader/writer lock on a document across threads and worker processes
+
+    Writers take the lock exclusively and readers that need a consistent
+    view across several reads take it shared. Locks on different documents
+    never block each other. A thread may nest locks on the same document,
+    except that a shared lock cannot be upgraded to an exclusive one.
+
+    Args:
+        file_id (str): The ID of the document
+        shared (bool): Take a shared (read) lock instead of an exclusive one
+
+    Raises:
+        ValueError: If file_id is not a plain document ID
+        RuntimeError: If the thread holds a shared lock and asks for an exclusive one
+    """
+    if not file_id or os.path.basename(file_id) != file_id or file_id in ('.', '..'):
+        raise ValueError(f"Invalid document ID: {file_id}")
+
+    held = getattr(_held, 'locks', None)
+    if held is None:
+        held = _held.locks = {}
+
+    if file_id in held:
+        entry = held[file_id]
+        if entry[1] and not shared:
+            raise RuntimeError(f"Cannot upgrade shared lock on document {file_id} to exclusive")
+        entry[2] += 1
+        try:
+            yield
+        finally:
+            entry[2] -= 1
+        return
+
+    lock = _acquire(file_id, shared)
+    held[file_id] = [lock, shared, 1]
+    try:
+        yield
+    finally:
+        del held[file_id]
+        _release(file_id, lock)
+
+def _acquire(file_id, shared):
+    if fcntl is None:
+        with _thread_locks_lock:
+            lock = _thread_locks.setdefault(file_id, threading.Lock())
+        lock.acquire()
+        return lock
+
+    # flock locks belong to the open file, so every holder opens its own
+    lock_file = open(os.path.join(get_lock_dir(), f"{file_id}.lock"), 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+    except BaseException:
+        lock_file.close()
+        raise
+    return lock_file
+
+def _release(file_id, lock):
+    if fcntl is None:
+        lock.release()
+        return
+
+    fcntl.flock(lock, fcntl.LOCK_UN)
+    lock.close()
@@ -0,0 +1,349 @@
+import os
+import io
+import gzip
+import json
+import time
+import atexit
+import threading
+import traceback
+
+try:
+    import fcntl
+except ImportError:  # Windows: only one syncer per process is ruled out
+    fcntl = None
+
+from app.utils.document_locks import document_lock, get_lock_dir
+from app.utils.document_store import get_document_store
+from app.utils.storage_backends import get_storage_backend
+
+# Version of the sidecar format, stored in every sidecar
+SIDECAR_FORMAT = 1
+
+# Document fields that only make sense on the node that saved them: signed
+# URLs that expire, URLs of and paths to local files, and flags derived
+# from the local file
+LOCAL_FIELDS = ('file_url', 'download_url', 'local_file_url', 'source_path', 'original_file',
+                'merged_file', 'merged_pdf', 'is_merged', 'is_pdf')
+
+# Longest a failing sidecar waits before it is written again
+MAX_RETRY_DELAY = 300.0
+
+_app = None
+_queue_dir = None
+_delay = 10.0
+_syncer_pid = None
+_syncer_lock = threading.Lock()
+_run_lock = threading.Lock()
+
+def init_document_sidecars(app):
+    """Set up the background writer of document sidecars
+
+    Documents marked with mark_sidecar_stale are recorded in
+    SIDECAR_QUEUE_DIR and written to storage about SIDECAR_SYNC_DELAY
+    seconds after their first change, so a burst of edits is written once.
+    The writer starts with the first request of each worker process, and
+    writes what is left when the process exits.
+
+    Args:
+        app (Flask): The application the writer runs under
+    """
+    global _app, _queue_dir, _delay
+
+    if not app.config['DOCUMENT_SIDECARS']:
+        return
+
+    _app = app
+    _queue_dir = app.config['SIDECAR_QUEUE_DIR']
+    _delay = app.config['SIDECAR_SYNC_DELAY']
+    os.makedirs(_queue_dir, exist_ok=True)
+    app.before_request(_ensure_syncer)
+    atexit.register(_sync_at_exit)
+
+def sidecar_blob_name(file_id):
+    """Return the name a document's sidecar is stored under
+
+    Sidecars live under processed/, next to (but outside of) uploads/, so
+    listings of the uploads don't see them.
+    """
+    return f"processed/{file_id}.json.gz"
+
+def mark_sidecar_stale(file_id):
+    """Record that a document changed and its sidecar has to be written again
+
+    Cheap enough to call after every save: it only writes a small marker
+    file. Does nothing unless sidecars are enabled.
+
+    Args:
+        file_id (str): The ID of the document
+    """
+    if _queue_dir is None or not _is_valid_id(file_id):
+        return
+
+    with document_lock(file_id):
+        marker = _read_marker(file_id) or {'since': time.time(), 'attempts': 0}
+        marker['next_attempt'] = max(marker.get('next_attempt', 0), marker['since'] + _delay)
+        # A new version tells the writer that a save happened while it was writing
+        marker['version'] = os.urandom(8).hex()
+        _write_marker(file_id, marker)
+
+    _ensure_syncer()
+
+def save_document_sidecar(file_id, document_data):
+    """Write the sidecar of a document to storage
+
+    The sidecar is the processed document (page text, summaries and notes)
+    as compact JSON, gzip-compressed, without the fields that only apply
+    to this node.
+
+    Args:
+        file_id (str): The ID of the document
+        document_data (dict): The document, with page text
+
+    Returns:
+        int: Size of the sidecar in bytes
+    """
+    document = {key: value for key, value in document_data.items() if key not in LOCAL_FIELDS}
+    payload = json.dumps({'format': SIDECAR_FORMAT, 'file_id': file_id, 'saved': time.time(),
+                          'document': document}, separators=(',', ':')).encode()
+    compressed = gzip.compress(payload, compresslevel=6)
+    get_storage_backend().upload(io.BytesIO(compressed), sidecar_blob_name(file_id),
+                                 content_type='application/gzip')
+    return len(compressed)
+
+def load_document_sidecar(file_id):
+    """Read the sidecar of a document from storage
+
+    Returns:
+        dict: The processed document, or None if it has no (readable) sidecar
+    """
+    if not _is_valid_id(file_id):
+        return None
+
+    try:
+        raw = get_storage_backend().read(sidecar_blob_name(file_id))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        # Also how Cloud Storage reports a document without a sidecar
+        print(f"Could not read sidecar of document {file_id}: {str(e)}")
+        return None
+
+    try:
+        sidecar = json.loads(gzip.decompress(raw))
+    except Exception as e:
+        print(f"Ignoring unreadable sidecar of document {file_id}: {str(e)}")
+        return None
+    if sidecar.get('format') != SIDECAR_FORMAT or not isinstance(sidecar.get('document'), dict):
+        print(f"Ignoring sidecar of document {file_id} in format {sidecar.get('format')}")
+        return None
+    # Sidecars written by older versions may still have some of them
+    return {key: value for key, value in sidecar['document'].items() if key not in LOCAL_FIELDS}
+
+def restore_document_from_sidecar(file_id):
+    """Save a document to the document store from its sidecar
+
+    Used when this node has no processed data for a document, e.g. on a
+    fresh container: one small read replaces downloading and processing
+    the upload, and keeps the summaries and notes made elsewhere. Lazy
+    documents also need their upload to extract pages from, so it is
+    downloaded as their source.
+
+    Args:
+        file_id (str): The ID of the document
+
+    Returns:
+        bool: True if the document is in the store now (also when another
+            request saved it meanwhile), False if it has no usable sidecar
+    """
+    from app.utils.bucket_manifest import lookup_file
+    from app.utils.gcs_utils import download_blob_to_file
+    from app.utils.local_files import local_upload_path, register_local_file
+
+    document = load_document_sidecar(file_id)
+    if document is None:
+        return False
+    document['file_id'] = file_id
+
+    if document.get('lazy'):
+        matching_file = lookup_file(file_id)
+        if not matching_file:
+            print(f"Ignoring sidecar of lazy document {file_id}: its upload is not in storage")
+            return False
+        source_path = local_upload_path(file_id, matching_file['extension'].lower())
+        download_blob_to_file(matching_file['blob_name'], source_path)
+        register_local_file(file_id, source_path)
+        document['source_path'] = source_path
+
+    store = get_document_store()
+    with document_lock(file_id):
+        if store.exists(file_id):
+            return True
+        if not store.save(file_id, document):
+            return False
+
+    print(f"Restored document {file_id} from its sidecar ({len(document.get('pages', []))} pages)")
+    return True
+
+def delete_document_sidecar(file_id):
+    """Drop a document's pending sidecar write and its sidecar in storage"""
+    if _queue_dir is not None and _is_valid_id(file_id):
+        with document_lock(file_id):
+            try:
+                os.remove(_marker_path(file_id))
+            except FileNotFoundError:
+                pass
+
+    try:
+        get_storage_backend().delete(sidecar_blob_name(file_id))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Could not delete sidecar of document {file_id}: {str(e)}")
+
+def get_sidecar_status():
+    """Return the number of documents whose sidecar is waiting to be written"""
+    if _queue_dir is None:
+        return {'enabled': False, 'pending': 0}
+    return {'enabled': True, 'pending': len(_pending_ids())}
+
+def sync_sidecars(force=False):
+    """Write the sidecars of changed documents
+
+    Runs under an app context. Only one worker writes at a time; the
+    others skip their turn.
+
+    Args:
+        force (bool): Also write sidecars whose delay has not passed yet
+
+    Returns:
+        int: Number of sidecars written, or None if another worker is writing
+    """
+    lock = _try_lock()
+    if lock is None:
+        return None
+
+    try:
+        now = time.time()
+        written = 0
+        for file_id in _pending_ids():
+            marker = _read_marker(file_id)
+            if marker is None or (not force and marker['next_attempt'] > now):
+                continue
+            if _sync_one(file_id, marker):
+                written += 1
+        if written:
+            print(f"Wrote sidecars of {written} documents")
+        return written
+    finally:
+        _unlock(lock)
+
+def _sync_one(file_id, marker):
+    """Write one document's sidecar and clear its marker unless it changed meanwhile"""
+    store = get_document_store()
+    try:
+        data = store.load(file_id)
+        if data is not None:
+            size = save_document_sidecar(file_id, data)
+            print(f"Wrote sidecar of document {file_id} ({size} bytes)")
+    except Exception as e:
+        with document_lock(file_id):
+            current = _read_marker(file_id)
+            if current is None or current['version'] != marker['version']:
+                return False
+            current['attempts'] = current.get('attempts', 0) + 1
+            delay = min(_delay * 2 ** current['attempts'], max(_delay, MAX_RETRY_DELAY))
+            current['next_attempt'] = time.time() + delay
+            _write_marker(file_id, current)
+        print(f"Writing sidecar of document {file_id} failed ({str(e)}), retrying in {delay:.1f}s")
+        return False
+
+    with document_lock(file_id):
+        current = _read_marker(file_id)
+        if current is None and data is not None:
+            # The document was deleted while its sidecar was being written
+            print(f"Document {file_id} was deleted, deleting its sidecar")
+            delete_document_sidecar(file_id)
+            return False
+        if current is not None and current['version'] == marker['version']:
+            os.remove(_marker_path(file_id))
+    return data is not None
+
+def _pending_ids():
+    try:
+        filenames = os.listdir(_queue_dir)
+    except FileNotFoundError:
+        return []
+    return [filename[:-len('.json')] for filename in filenames if filename.endswith('.json')]
+
+def _is_valid_id(file_id):
+    return bool(file_id) and os.path.basename(file_id) == file_id and not file_id.startswith('.')
+
+def _marker_path(file_id):
+    return os.path.join(_queue_dir, f"{file_id}.json")
+
+def _read_marker(file_id):
+    try:
+        with open(_marker_path(file_id), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error reading sidecar marker {file_id}: {str(e)}")
+        return None
+
+def _write_marker(file_id, marker):
+    """Atomically write a document's marker"""
+    path = _marker_path(file_id)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(marker, f)
+    os.replace(temp_path, path)
+
+def _try_lock():
+    """Take the syncer lock without waiting, or return None if it is held"""
+    if fcntl is None:
+        return _run_lock if _run_lock.acquire(blocking=False) else None
+
+    lock_file = open(os.path.join(get_lock_dir(), 'document_sidecars.lock'), 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+def _unlock(lock):
+    if fcntl is None:
+        lock.release()
+        return
+
+    fcntl.flock(lock, fcntl.LOCK_UN)
+    lock.close()
+
+def _ensure_syncer():
+    """Start the syncer thread in this process (again after a fork)"""
+    global _syncer_pid
+
+    with _syncer_lock:
+        if _syncer_pid == os.getpid():
+            return
+        _syncer_pid = os.getpid()
+
+    threading.Thread(target=_sync_loop, name='sidecar-sync', daemon=True).start()
+
+def _sync_loop():
+    while True:
+        time.sleep(_delay)
+        try:
+            with _app.app_context():
+                sync_sidecars()
+        except Exception as e:
+            print(f"Error writing sidecars: {str(e)}")
+            print(traceback.format_exc())
+
+def _sync_at_exit():
+    try:
+        with _app.app_context():
+            sync_sidecars(force=True)
+    except Exception as e:
+        print(f"Error writing sidecars at exit: {str(e)}")
@@ -0,0 +1,418 @@
+import os
+import gzip
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from app.utils.document_locks import document_lock
+
+# Number of parsed documents kept in memory per process
+DEFAULT_CACHE_SIZE = 64
+
+# Characters of page text kept in memory per process
+DEFAULT_TEXT_CACHE_CHARS = 64 * 1024 * 1024
+
+# Characters of page text kept in the index for thumbnails
+TEXT_PREVIEW_CHARS = 40
+
+_store = None
+_store_config = None
+_store_lock = threading.Lock()
+
+class DocumentStore:
+    """Reads and writes processed document JSON through an in-process LRU cache
+
+    Documents are saved as <document_dir>/<file_id>.json. Older code saved
+    some documents in other directories; those are still found on read.
+    A cached document is reused for as long as its file's mtime and size
+    are unchanged, so writes from other workers are picked up on the next
+    read.
+
+    The document file is a small index: page text is moved out into
+    gzip-compressed shards under <document_dir>/text/, named by the SHA-256
+    of the text, and pages keep only a text_ref and a short text_preview.
+    Documents saved with inline text are still read as they are.
+
+    Saves write a temporary file and rename it over the document, so a
+    reader never sees a half-written file. The page and field updates hold
+    the document's exclusive lock from load to save, so concurrent edits
+    from other threads or workers are not lost. They work on the index
+    alone: pages whose text they don't set keep their text_ref, so only
+    new text is compressed and written to a shard.
+    """
+
+    def __init__(self, document_dir, legacy_dirs=(), cache_size=DEFAULT_CACHE_SIZE,
+                 text_cache_chars=DEFAULT_TEXT_CACHE_CHARS):
+        self.document_dir = document_dir
+        self.text_dir = os.path.join(document_dir, 'text')
+        self.legacy_dirs = [d for d in legacy_dirs if d != document_dir]
+        self.cache_size = cache_size
+        self.text_cache_chars = text_cache_chars
+        self._cache = OrderedDict()
+        self._text_cache = OrderedDict()
+        self._text_cache_size = 0
+        self._lock = threading.Lock()
+
+    def path_for(self, file_id):
+        """Return the path a document is saved to"""
+        return os.path.join(self.document_dir, f"{file_id}.json")
+
+    def candidate_paths(self, file_id):
+        """Return every path a document may be found at, in lookup order"""
+        return [self.path_for(file_id)] + [os.path.join(d, f"{file_id}.json") for d in self.legacy_dirs]
+
+    def locate(self, file_id):
+        """Return the path of a stored document and its stat, or (None, None)"""
+        if not _is_valid_id(file_id):
+            return None, None
+
+        for path in self.candidate_paths(file_id):
+            try:
+                return path, os.stat(path)
+            except FileNotFoundError:
+                continue
+        return None, None
+
+    def exists(self, file_id):
+        """Check whether a document is stored"""
+        return self.locate(file_id)[0] is not None
+
+    def locations(self, file_id):
+        """Describe where a document is looked for, for debugging"""
+        return [{'path': path, 'exists': os.path.exists(path)} for path in self.candidate_paths(file_id)]
+
+    def load(self, file_id, include_text=True):
+        """Load a document, from the cache when the file is unchanged
+
+        Args:
+            file_id (str): The ID of the document
+            include_text (bool): Read each page's text. Without it pages only
+                have a text_preview, and no text shard is read.
+
+        Returns:
+            dict: Document data the caller may modify, or None if not found
+        """
+        index = self._load_index(file_id)
+        if index is None:
+            return None
+
+        data = _copy_document(index)
+        for page in data.get('pages', []):
+            if include_text:
+                if 'text_ref' in page:
+                    page['text'] = self._read_text(page.pop('text_ref'))
+                    page.pop('text_preview', None)
+            elif isinstance(page.get('text'), str):
+                page['text_preview'] = page.pop('text')[:TEXT_PREVIEW_CHARS]
+            else:
+                page.pop('text_ref', None)
+                page.pop('text', None)
+        return data
+
+    def load_page_text(self, file_id, page_number):
+        """Return the text of one page, or None if the page is not found"""
+        index = self._load_index(file_id)
+        if index is None:
+            return None
+
+        for page in index.get('pages', []):
+            if page.get('page_number') == page_number:
+                if 'text_ref' in page:
+                    return self._read_text(page['text_ref'])
+                return page.get('text')
+        return None
+
+    def save(self, file_id, data):
+        """Save a document to the document directory
+
+        Args:
+            file_id (str): The ID of the document
+            data (dict): Document data
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        if not _is_valid_id(file_id):
+            print(f"Refusing to save document with invalid ID: {file_id}")
+            return False
+
+        path = self.path_for(file_id)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.document_dir, exist_ok=True)
+            index = _copy_document(data)
+            for page in index.get('pages', []):
+                if isinstance(page.get('text'), str) and page['text']:
+                    text = page.pop('text')
+                    page['text_ref'] = self._write_text(text)
+                    page['text_preview'] = text[:TEXT_PREVIEW_CHARS]
+            with open(temp_path, 'w') as f:
+                json.dump(index, f)
+            os.replace(temp_path, path)
+            stat = os.stat(path)
+        except Exception as e:
+            print(f"Error saving document {file_id}: {str(e)}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return False
+
+        self._remember(file_id, (path, stat.st_mtime_ns, stat.st_size), index)
+        return True
+
+    def update_document(self, file_id, fields):
+        """Set document-level fields
+
+        Returns:
+            bool: True if successful, False if the document was not found or not saved
+        """
+        if not _is_valid_id(file_id):
+            return False
+
+        with document_lock(file_id):
+            data = self._load_for_update(file_id)
+            if data is None:
+                return False
+            data.update(fields)
+            return self.save(file_id, data)
+
+    def update_pages(self, file_id, updates):
+        """Set fields on individual pages
+
+        Args:
+            file_id (str): The ID of the document
+            updates (dict): Maps page numbers to dicts of fields to set
+
+        Returns:
+            bool: True if successful, False if the document was not found or not saved
+        """
+        if not _is_valid_id(file_id):
+            return False
+
+        with document_lock(file_id):
+            data = self._load_for_update(file_id)
+            if data is None:
+                return False
+            for page in data.get('pages', []):
+                if page.get('page_number') in updates:
+                    fields = updates[page['page_number']]
+                    if 'text' in fields:
+                        page.pop('text_ref', None)
+                        page.pop('text_preview', None)
+                    page.update(fields)
+            return self.save(file_id, data)
+
+    def remove_page(self, file_id, page_number):
+        """Remove a page and renumber the pages after it
+
+        The page number is added to the document's removed_pages, so page
+        numbers recorded before the removal can be brought up to date.
+
+        Returns:
+            bool: True if successful, False if the document was not found or not saved
+        """
+        if not _is_valid_id(file_id):
+            return False
+
+        with document_lock(file_id):
+            data = self._load_for_update(file_id)
+            if data is None:
+                return False
+            data['pages'] = [p for p in data.get('pages', []) if p['page_number'] != page_number]
+            for index, page in enumerate(data['pages']):
+                page['page_number'] = index + 1
+            data['removed_pages'] = data.get('removed_pages', []) + [page_number]
+            return self.save(file_id, data)
+
+    def append_pages(self, file_id, pages, fields=None):
+        """Add pages after the last page of a document, creating it if needed
+
+        The pages are numbered from the document's current page count, and
+        their page_number is set in place.
+
+        Args:
+            file_id (str): The ID of the document
+            pages (list): Page dicts to add
+            fields (dict, optional): Document-level fields to set as well
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        if not _is_valid_id(file_id):
+            print(f"Refusing to save document with invalid ID: {file_id}")
+            return False
+
+        with document_lock(file_id):
+            data = self._load_for_update(file_id) or {'pages': []}
+            data.update(fields or {})
+            data.setdefault('pages', [])
+            for page in pages:
+                page['page_number'] = len(data['pages']) + 1
+                data['pages'].append(dict(page))
+            return self.save(file_id, data)
+
+    def delete(self, file_id):
+        """Remove a document from every location and the cache"""
+        with self._lock:
+            self._cache.pop(file_id, None)
+
+        if not _is_valid_id(file_id):
+            return
+        with document_lock(file_id):
+            for path in self.candidate_paths(file_id):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def text_refs(self):
+        """Return the refs of every text shard a stored document points to"""
+        refs = set()
+        for directory in [self.document_dir] + self.legacy_dirs:
+            try:
+                filenames = os.listdir(directory)
+            except FileNotFoundError:
+                continue
+            for filename in filenames:
+                if not filename.endswith('.json'):
+                    continue
+                index = self._load_index(filename[:-len('.json')])
+                if isinstance(index, dict):
+                    refs.update(page['text_ref'] for page in index.get('pages', [])
+                                if isinstance(page, dict) and 'text_ref' in page)
+        return refs
+
+    def _load_index(self, file_id):
+        """Return the parsed document file, shared with the cache (don't modify it)"""
+        path, stat = self.locate(file_id)
+        if path is None:
+            return None
+
+        version = (path, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._cache.get(file_id)
+            if cached and cached[0] == version:
+                self._cache.move_to_end(file_id)
+                return cached[1]
+
+        try:
+            with open(path, 'r') as f:
+                index = json.load(f)
+        except Exception as e:
+            print(f"Error loading document {file_id} from {path}: {str(e)}")
+            return None
+
+        self._remember(file_id, version, index)
+        return index
+
+    def _load_for_update(self, file_id):
+        """Return a copy of the document file to modify and save, pages keeping their text_ref"""
+        index = self._load_index(file_id)
+        return _copy_document(index) if index is not None else None
+
+    def _text_path(self, ref):
+        return os.path.join(self.text_dir, ref[:2], f"{ref}.gz")
+
+    def _write_text(self, text):
+        """Store page text in its content-addressed shard and return its ref"""
+        data = text.encode('utf-8')
+        ref = hashlib.sha256(data).hexdigest()
+
+        path = self._text_path(ref)
+        try:
+            # A reused shard counts as new, so the storage collector leaves it alone
+            os.utime(path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(gzip.compress(data, compresslevel=5))
+            os.replace(temp_path, path)
+
+        self._remember_text(ref, text)
+        return ref
+
+    def _read_text(self, ref):
+        """Return the text of a shard, from the cache when possible"""
+        with self._lock:
+            text = self._text_cache.get(ref)
+            if text is not None:
+                self._text_cache.move_to_end(ref)
+                return text
+
+        try:
+            with open(self._text_path(ref), 'rb') as f:
+                text = gzip.decompress(f.read()).decode('utf-8')
+        except Exception as e:
+            print(f"Error reading page text {ref}: {str(e)}")
+            return "[Page text is missing]"
+
+        self._remember_text(ref, text)
+        return text
+
+    def _remember_text(self, ref, text):
+        with self._lock:
+            if ref in self._text_cache:
+                self._text_cache.move_to_end(ref)
+                return
+            self._text_cache[ref] = text
+            self._text_cache_size += len(text)
+            while self._text_cache_size > self.text_cache_chars and len(self._text_cache) > 1:
+                _, evicted = self._text_cache.popitem(last=False)
+                self._text_cache_size -= len(evicted)
+
+    def _remember(self, file_id, version, data):
+        with self._lock:
+            self._cache[file_id] = (version, data)
+            self._cache.move_to_end(file_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+def _is_valid_id(file_id):
+    """Only plain IDs, so a value can't point outside the document directories"""
+    return bool(file_id) and os.path.basename(file_id) == file_id and file_id not in ('.', '..')
+
+def _copy_document(data):
+    """Copy a document down to its page dicts, which is as deep as callers modify it"""
+    copy = dict(data)
+    if isinstance(copy.get('pages'), list):
+        copy['pages'] = [dict(page) for page in copy['pages']]
+    return copy
+
+def get_document_store():
+    """Return the process-wide document store for the current app config
+
+    DOCUMENT_STORE_BACKEND selects JSON files ('json') or a SQLite database
+    with a row per page ('sqlite').
+    """
+    global _store, _store_config
+
+    if has_app_context():
+        backend = current_app.config.get('DOCUMENT_STORE_BACKEND', 'json')
+        document_dir = current_app.config['DOCUMENT_DIR']
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+        # Only the app's own folders: text_refs reads every JSON file in them
+        legacy_dirs = (os.path.join(upload_folder, 'studyflow'), upload_folder,
+                       os.path.join(tempfile.gettempdir(), 'studyflow'))
+        db_path = current_app.config.get('DOCUMENT_DB_PATH') or os.path.join(document_dir, 'documents.sqlite3')
+        cache_size = current_app.config.get('DOCUMENT_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+    else:
+        backend = 'json'
+        document_dir = os.path.join(tempfile.gettempdir(), 'studyflow')
+        legacy_dirs = ()
+        db_path = None
+        cache_size = DEFAULT_CACHE_SIZE
+
+    config = (backend, document_dir, legacy_dirs, db_path, cache_size)
+    with _store_lock:
+        if _store is None or _store_config != config:
+            if backend == 'sqlite':
+                from app.utils.sqlite_document_store import SqliteDocumentStore
+                _store = SqliteDocumentStore(db_path, cache_size)
+            else:
+                _store = DocumentStore(document_dir, legacy_dirs, cache_size)
+            _store_config = config
+        return _store
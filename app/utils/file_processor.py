@@ -1,15 +1,53 @@
 import os
 import PyPDF2
 from PIL import Image
-import pytesseract
 import json
 import tempfile
+import hashlib
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app, has_app_context
+from app.utils.page_cache import PageCache, page_key
+from app.utils.ocr_engine import find_tesseract, ocr_image, ocr_images, DEFAULT_MAX_SIDE
 
-def process_file(file_path):
+# PDFs with fewer pages than this are always extracted serially, since the
+# cost of re-opening the file in each worker outweighs the speedup
+PARALLEL_MIN_PAGES = 16
+
+_pdf_pool = None
+_pdf_pool_workers = 0
+_pdf_pool_users = {}  # pool -> extractions using it
+_pdf_pool_lock = threading.Lock()
+_page_cache = None
+
+def _get_config(key, default=None):
+    """Read an app config value, falling back to a default outside of a request"""
+    if has_app_context():
+        return current_app.config.get(key, default)
+    return default
+
+def get_page_cache():
+    """Return the page text cache configured for the app, or None if disabled"""
+    global _page_cache
+    
+    cache_dir = _get_config('PAGE_CACHE_DIR',
+                            os.path.join(tempfile.gettempdir(), 'studyflow', 'page_cache'))
+    max_bytes = _get_config('PAGE_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+    if not max_bytes:
+        return None
+    
+    if _page_cache is None or (_page_cache.cache_dir, _page_cache.max_bytes) != (cache_dir, max_bytes):
+        _page_cache = PageCache(cache_dir, max_bytes)
+    return _page_cache
+
+def process_file(file_path, progress_callback=None):
     """Extract text from a file
     
     Args:
         file_path (str): Path to the file
+        progress_callback (callable, optional): Called as
+            progress_callback(pages_done, pages_total) while pages are extracted
     
     Returns:
         dict: Dictionary containing the extracted data
@@ -20,12 +58,39 @@ def process_file(file_path):
         
         # Process based on file type
         if file_ext == '.pdf':
+            # Very large PDFs are extracted page by page as they are viewed
+            lazy_min_pages = _get_config('LAZY_EXTRACTION_MIN_PAGES', 0)
+            if lazy_min_pages:
+                try:
+                    num_pages = count_pdf_pages(file_path)
+                except Exception as e:
+                    print(f"Error counting PDF pages, extracting eagerly: {str(e)}")
+                    num_pages = 0
+                
+                if num_pages >= lazy_min_pages:
+                    print(f"PDF has {num_pages} pages, deferring extraction until pages are read")
+                    return {
+                        'pages': [{
+                            'page_number': i + 1,
+                            'source_page': i + 1,
+                            'text': None,
+                            'extracted': False,
+                            'summary': "",
+                            'notes': ''
+                        } for i in range(num_pages)],
+                        'lazy': True,
+                        'source_path': file_path,
+                        'total_pages': num_pages
+                    }
+            
             print(f"Processing PDF file: {file_path}")
-            pages_data = process_pdf(file_path)
+            pages_data = process_pdf(file_path, progress_callback=progress_callback)
             return {'pages': pages_data}
         elif file_ext in ['.jpg', '.jpeg', '.png']:
             print(f"Processing image file: {file_path}")
             pages_data = process_image(file_path)
+            if progress_callback:
+                progress_callback(1, 1)
             return {'pages': pages_data}
         else:
             print(f"Unsupported file type: {file_ext}")
@@ -48,11 +113,15 @@ def process_file(file_path):
             }]
         }
 
-def process_pdf(file_path):
+def process_pdf(file_path, workers=None, progress_callback=None):
     """Extract text from PDF file
     
     Args:
         file_path (str): Path to the PDF file
+        workers (int, optional): Number of extraction processes to use.
+            Defaults to the PDF_EXTRACTION_WORKERS app config value.
+        progress_callback (callable, optional): Called as
+            progress_callback(pages_done, pages_total) while pages are extracted
     
     Returns:
         list: List of dictionaries containing page data
@@ -120,30 +189,20 @@ def process_pdf(file_path):
                         'notes': ''
                     }]
                 
-                # Process each page
-                for i in range(num_pages):
-                    try:
-                        page = pdf_reader.pages[i]
-                        text = page.extract_text() or f"[Page {i+1} - No text could be extracted]"
-                        
-                        page_data = {
-                            'page_number': i + 1,
-                            'text': text,
-                            'summary': "",
-                            'notes': ''
-                        }
-                        
-                        pages_data.append(page_data)
-                        print(f"Processed page {i+1}/{num_pages}")
-                    except Exception as e:
-                        print(f"Error processing page {i+1}: {str(e)}")
-                        # Add a placeholder for this page
-                        pages_data.append({
-                            'page_number': i + 1,
-                            'text': f"[Error extracting text from page {i+1}: {str(e)}]",
-                            'summary': "",
-                            'notes': ''
-                        })
+                # Process each page, fanning out to a process pool for large PDFs
+                if workers is None:
+                    workers = _get_config('PDF_EXTRACTION_WORKERS', 1)
+                min_pages = _get_config('PDF_PARALLEL_MIN_PAGES', PARALLEL_MIN_PAGES)
+                page_cache = get_page_cache()
+                
+                if workers > 1 and num_pages >= min_pages:
+                    pages_data.extend(_extract_pages_parallel(
+                        file_path, num_pages, workers, page_cache, progress_callback))
+                else:
+                    pages_data.extend(_extract_pages(
+                        pdf_reader, 0, num_pages, num_pages, page_cache, progress_callback))
+                
+                _finish_pages(pdf_reader, pages_data, page_cache)
             except Exception as e:
                 print(f"Error reading PDF with PyPDF2: {str(e)}")
                 # If PyPDF2 fails, return a single page with error info
@@ -174,6 +233,293 @@ def process_pdf(file_path):
     
     return pages_data
 
+@contextmanager
+def _use_pdf_pool(workers):
+    """Use the shared process pool for PDF extraction
+    
+    If the size changed, a new pool is created. The old one is only shut
+    down once the extractions still submitting to it are done with it.
+    
+    Args:
+        workers (int): Number of worker processes
+    
+    Yields:
+        ProcessPoolExecutor: The shared pool
+    """
+    global _pdf_pool, _pdf_pool_workers
+    
+    with _pdf_pool_lock:
+        if _pdf_pool is None or _pdf_pool_workers != workers:
+            if _pdf_pool is not None and not _pdf_pool_users.get(_pdf_pool):
+                _pdf_pool.shutdown(wait=False)
+            _pdf_pool = ProcessPoolExecutor(max_workers=workers)
+            _pdf_pool_workers = workers
+        pool = _pdf_pool
+        _pdf_pool_users[pool] = _pdf_pool_users.get(pool, 0) + 1
+    
+    try:
+        yield pool
+    finally:
+        with _pdf_pool_lock:
+            _pdf_pool_users[pool] -= 1
+            if not _pdf_pool_users[pool]:
+                del _pdf_pool_users[pool]
+                # The last user of a replaced pool shuts it down
+                if pool is not _pdf_pool:
+                    pool.shutdown(wait=False)
+
+def _extract_pages(pdf_reader, start, end, num_pages, page_cache=None, progress_callback=None):
+    """Extract text from a range of pages of an open PDF
+    
+    Args:
+        pdf_reader (PyPDF2.PdfReader): Reader for the PDF
+        start (int): Index of the first page (inclusive)
+        end (int): Index of the last page (exclusive)
+        num_pages (int): Total number of pages, for progress output
+        page_cache (PageCache, optional): Cache of previously extracted page text
+        progress_callback (callable, optional): Called after each page
+    
+    Returns:
+        list: List of dictionaries containing page data
+    """
+    pages_data = []
+    cache_hits = 0
+    
+    for i in range(start, end):
+        try:
+            page = pdf_reader.pages[i]
+            
+            text = None
+            key = None
+            if page_cache is not None:
+                try:
+                    key = page_key(page)
+                except Exception as e:
+                    # A page whose resources can't be hashed is still extracted, just not cached
+                    print(f"Could not compute cache key of page {i+1}: {str(e)}")
+                if key is not None:
+                    text = page_cache.get(key)
+                    if text is not None:
+                        cache_hits += 1
+            
+            if text is None:
+                text = page.extract_text()
+                if key is not None:
+                    page_cache.put(key, text)
+            
+            # Pages without a text layer stay empty here; process_pdf tries
+            # OCR on them before falling back to a placeholder
+            text = text or ''
+            
+            page_data = {
+                'page_number': i + 1,
+                'text': text,
+                'summary': "",
+                'notes': ''
+            }
+            
+            pages_data.append(page_data)
+            print(f"Processed page {i+1}/{num_pages}")
+        except Exception as e:
+            print(f"Error processing page {i+1}: {str(e)}")
+            # Add a placeholder for this page
+            pages_data.append({
+                'page_number': i + 1,
+                'text': f"[Error extracting text from page {i+1}: {str(e)}]",
+                'summary': "",
+                'notes': ''
+            })
+        
+        if progress_callback:
+            progress_callback(i + 1, num_pages)
+    
+    if page_cache is not None:
+        print(f"Page cache: {cache_hits} hits, {end - start - cache_hits} misses for pages {start+1}-{end}")
+    
+    return pages_data
+
+def _extract_page_range(file_path, start, end, num_pages, page_cache=None):
+    """Worker entry point: open the PDF and extract a range of pages
+    
+    Args:
+        file_path (str): Path to the PDF file
+        start (int): Index of the first page (inclusive)
+        end (int): Index of the last page (exclusive)
+        num_pages (int): Total number of pages, for progress output
+        page_cache (PageCache, optional): Cache of previously extracted page text
+    
+    Returns:
+        list: List of dictionaries containing page data
+    """
+    try:
+        with open(file_path, 'rb') as pdf_file:
+            pdf_reader = PyPDF2.PdfReader(pdf_file)
+            return _extract_pages(pdf_reader, start, end, num_pages, page_cache)
+    except Exception as e:
+        print(f"Error reading pages {start+1}-{end} of {file_path}: {str(e)}")
+        return [{
+            'page_number': i + 1,
+            'text': f"[Error extracting text from page {i+1}: {str(e)}]",
+            'summary': "",
+            'notes': ''
+        } for i in range(start, end)]
+
+def _extract_pages_parallel(file_path, num_pages, workers, page_cache=None, progress_callback=None):
+    """Split a PDF into contiguous page ranges and extract them on a process pool
+    
+    Args:
+        file_path (str): Path to the PDF file
+        num_pages (int): Total number of pages
+        workers (int): Number of worker processes
+        page_cache (PageCache, optional): Cache of previously extracted page text
+        progress_callback (callable, optional): Called as each range completes
+    
+    Returns:
+        list: List of dictionaries containing page data, in page order
+    """
+    chunk_size = -(-num_pages // workers)  # Ceiling division
+    ranges = [(start, min(start + chunk_size, num_pages))
+              for start in range(0, num_pages, chunk_size)]
+    print(f"Extracting {num_pages} pages in {len(ranges)} ranges on {workers} workers")
+    
+    pages_data = []
+    with _use_pdf_pool(workers) as pool:
+        futures = [pool.submit(_extract_page_range, file_path, start, end, num_pages, page_cache)
+                   for start, end in ranges]
+        
+        for (start, end), future in zip(ranges, futures):
+            try:
+                pages_data.extend(future.result())
+            except Exception as e:
+                print(f"Error in extraction worker for pages {start+1}-{end}: {str(e)}")
+                pages_data.extend({
+                    'page_number': i + 1,
+                    'text': f"[Error extracting text from page {i+1}: {str(e)}]",
+                    'summary': "",
+                    'notes': ''
+                } for i in range(start, end))
+            
+            if progress_callback:
+                progress_callback(end, num_pages)
+    
+    return pages_data
+
+def _finish_pages(pdf_reader, pages_data, page_cache=None):
+    """OCR pages without a text layer and give placeholders to pages still empty
+    
+    Args:
+        pdf_reader (PyPDF2.PdfReader): Reader for the PDF
+        pages_data (list): Extracted page data, updated in place
+        page_cache (PageCache, optional): Cache of previously extracted page text
+    """
+    # Scanned pages have no text layer: OCR just those pages
+    if _get_config('PDF_OCR_FALLBACK', True):
+        _ocr_pages_without_text(pdf_reader, pages_data, page_cache)
+    
+    for page_data in pages_data:
+        if not page_data['text']:
+            page_data['text'] = f"[Page {page_data['page_number']} - No text could be extracted]"
+
+def extract_pages(file_path, page_numbers):
+    """Extract the text of selected pages of a PDF
+    
+    Args:
+        file_path (str): Path to the PDF file
+        page_numbers (list): 1-based numbers of the pages to extract
+    
+    Returns:
+        dict: Extracted text keyed by page number
+    """
+    with open(file_path, 'rb') as pdf_file:
+        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        num_pages = len(pdf_reader.pages)
+        page_cache = get_page_cache()
+        
+        pages_data = []
+        for page_number in page_numbers:
+            if 1 <= page_number <= num_pages:
+                pages_data.extend(_extract_pages(
+                    pdf_reader, page_number - 1, page_number, num_pages, page_cache))
+        
+        _finish_pages(pdf_reader, pages_data, page_cache)
+    
+    return {page_data['page_number']: page_data['text'] for page_data in pages_data}
+
+def count_pdf_pages(file_path):
+    """Return the number of pages in a PDF without extracting any text"""
+    with open(file_path, 'rb') as pdf_file:
+        return len(PyPDF2.PdfReader(pdf_file).pages)
+
+def _ocr_pages_without_text(pdf_reader, pages_data, page_cache=None):
+    """Fill in the text of pages without a text layer by OCR of their scans
+    
+    The largest embedded image on each such page is taken as its scan and
+    all scans are OCRed together on the OCR pool. Results are cached by a
+    hash of the image data.
+    
+    Args:
+        pdf_reader (PyPDF2.PdfReader): Reader for the PDF
+        pages_data (list): Extracted page data, updated in place
+        page_cache (PageCache, optional): Cache of previously extracted page text
+    """
+    missing = [page_data for page_data in pages_data if not page_data['text']]
+    if not missing:
+        return
+    
+    if not find_tesseract():
+        print(f"{len(missing)} pages have no text layer, but Tesseract OCR is not available")
+        return
+    
+    print(f"{len(missing)} pages have no text layer, running OCR on their scans")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        ocr_jobs = []
+        
+        for page_data in missing:
+            page_number = page_data['page_number']
+            try:
+                page = pdf_reader.pages[page_number - 1]
+                images = page.images
+                if not images:
+                    continue
+                scan = max(images, key=lambda image: len(image.data))
+                
+                key = hashlib.sha256(b'ocr:' + scan.data).hexdigest()
+                cached = page_cache.get(key) if page_cache is not None else None
+                if cached is not None:
+                    page_data['text'] = cached
+                    continue
+                
+                scan_path = os.path.join(temp_dir, f"page_{page_number}_{scan.name}")
+                with open(scan_path, 'wb') as f:
+                    f.write(scan.data)
+                
+                # Match the orientation the page is displayed in
+                if page.rotation:
+                    with Image.open(scan_path) as image:
+                        rotated = image.rotate(-page.rotation, expand=True)
+                    scan_path = os.path.splitext(scan_path)[0] + '.png'
+                    rotated.save(scan_path)
+                
+                ocr_jobs.append((page_data, scan_path, key))
+            except Exception as e:
+                print(f"Error extracting scan from page {page_number}: {str(e)}")
+        
+        results = ocr_images([scan_path for _, scan_path, _ in ocr_jobs],
+                             workers=_get_config('OCR_WORKERS', 1),
+                             max_side=_get_config('OCR_MAX_SIDE', DEFAULT_MAX_SIDE))
+        
+        for (page_data, _, key), result in zip(ocr_jobs, results):
+            if isinstance(result, Exception):
+                print(f"Error performing OCR on page {page_data['page_number']}: {str(result)}")
+                continue
+            
+            text = result.strip()
+            if page_cache is not None:
+                page_cache.put(key, text)
+            page_data['text'] = text
+            print(f"OCR extracted {len(text)} characters from page {page_data['page_number']}")
+
 def process_image(file_path):
     """Extract text from image using OCR
     
@@ -185,43 +531,19 @@ def process_image(file_path):
     """
     try:
         print(f"Opening image file: {file_path}")
-        image = Image.open(file_path)
+        with Image.open(file_path) as image:
+            print(f"Image size: {image.size[0]}x{image.size[1]}")
         
         try:
-            # Check for Tesseract and set its path explicitly for macOS
-            import shutil
-            import platform
-            import os
-            
-            # Set common Tesseract paths based on OS
-            if platform.system() == 'Darwin':  # macOS
-                possible_paths = [
-                    '/opt/homebrew/bin/tesseract',  # Apple Silicon
-                    '/usr/local/bin/tesseract',     # Intel Mac
-                    '/opt/local/bin/tesseract',     # MacPorts
-                ]
-                
-                # Set the first path that exists
-                for path in possible_paths:
-                    if os.path.exists(path):
-                        print(f"Found Tesseract at: {path}")
-                        pytesseract.pytesseract.tesseract_cmd = path
-                        break
-            
-            # Check if tesseract is available
-            tesseract_path = pytesseract.pytesseract.tesseract_cmd
-            tesseract_available = os.path.exists(tesseract_path) if tesseract_path != 'tesseract' else shutil.which('tesseract') is not None
-            
-            print(f"Tesseract path: {tesseract_path}")
-            print(f"Tesseract available: {tesseract_available}")
-            
-            if not tesseract_available:
+            if not find_tesseract():
                 print("Tesseract OCR not found. Using fallback mode.")
                 # Generate a placeholder response
                 text = "[Image uploaded successfully but OCR is not available. Tesseract OCR needs to be installed.]"
             else:
                 print("Performing OCR on image...")
-                text = pytesseract.image_to_string(image)
+                text = ocr_image(file_path,
+                                 workers=_get_config('OCR_WORKERS', 1),
+                                 max_side=_get_config('OCR_MAX_SIDE', DEFAULT_MAX_SIDE))
                 
                 if not text.strip():
                     text = "[No text could be extracted from this image]"
@@ -255,7 +577,7 @@ def process_image(file_path):
         }]
 
 def save_processed_data(file_id, processed_data):
-    """Save processed data to a temporary file
+    """Save processed data to the document store
     
     Args:
         file_id (str): The ID of the file
@@ -264,18 +586,13 @@ def save_processed_data(file_id, processed_data):
     Returns:
         bool: True if successful, False otherwise
     """
-    try:
-        # Create temp directory if it doesn't exist
-        temp_dir = os.path.join(tempfile.gettempdir(), 'studyflow')
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        # Save processed data to file
-        file_path = os.path.join(temp_dir, f"{file_id}.json")
-        with open(file_path, 'w') as f:
-            json.dump(processed_data, f)
-            
-        print(f"Saved processed data to {file_path}")
-        return True
-    except Exception as e:
-        print(f"Error saving processed data: {str(e)}")
-        return False 
\ No newline at end of file
+    from app.utils.document_store import get_document_store
+    from app.utils.document_sidecars import mark_sidecar_stale
+
+    store = get_document_store()
+    if not store.save(file_id, processed_data):
+        return False
+    mark_sidecar_stale(file_id)
+
+    print(f"Saved processed data to {store.path_for(file_id)}")
+    return True
@@ -1,12 +1,113 @@
 from google.cloud import storage
-from flask import current_app
+from flask import current_app, has_app_context
+from requests.adapters import HTTPAdapter
 import os
-from datetime import datetime, timedelta
+import threading
 from werkzeug.utils import secure_filename
+from app.utils.storage_backends import get_storage_backend
+
+# Connections to Cloud Storage each process keeps open for reuse
+DEFAULT_HTTP_POOL_SIZE = 32
+
+_client = None
+_client_pid = None
+_buckets = {}
+_client_lock = threading.Lock()
 
 def get_gcs_client():
-    """Create and return a Google Cloud Storage client"""
-    return storage.Client()
+    """Return the process-wide Google Cloud Storage client
+
+    The client is created on first use and shared by all threads, so
+    credentials are loaded once and calls reuse open connections from its
+    HTTP pool (GCS_HTTP_POOL_SIZE connections) instead of a new TLS
+    handshake each. A forked worker creates its own client.
+    """
+    global _client, _client_pid
+
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            if has_app_context():
+                pool_size = current_app.config.get('GCS_HTTP_POOL_SIZE', DEFAULT_HTTP_POOL_SIZE)
+            else:
+                pool_size = DEFAULT_HTTP_POOL_SIZE
+
+            client = storage.Client()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            client._http.mount('https://', adapter)
+            client._http.mount('http://', adapter)
+
+            _client = client
+            _client_pid = os.getpid()
+            _buckets.clear()
+        return _client
+
+def get_gcs_bucket(bucket_name=None):
+    """Return the shared handle of a bucket (by default GOOGLE_CLOUD_BUCKET)"""
+    bucket_name = bucket_name or current_app.config['GOOGLE_CLOUD_BUCKET']
+    client = get_gcs_client()
+    with _client_lock:
+        bucket = _buckets.get(bucket_name)
+        if bucket is None:
+            bucket = _buckets[bucket_name] = client.bucket(bucket_name)
+        return bucket
+
+def parse_blob_name(blob_name):
+    """Split the name of an uploaded blob into its parts
+
+    Uploads are named uploads/<original name>_<file id>.<extension>.
+
+    Args:
+        blob_name (str): Name of the blob in the bucket
+
+    Returns:
+        dict: The file's id, original name and extension, or None if the
+            blob is not an upload
+    """
+    if blob_name.endswith('/'):
+        return None
+
+    parts = blob_name.split('/')[-1].split('_')
+    if len(parts) < 2:
+        return None
+    return {
+        'id': parts[-1].split('.')[0],
+        'name': '_'.join(parts[:-1]),
+        'extension': parts[-1].split('.')[-1]
+    }
+
+def get_blob_name(file_id, file_extension, original_filename=None):
+    """Return the name an upload is stored under in the bucket
+
+    Args:
+        file_id (str): Unique identifier for the file
+        file_extension (str): File extension (e.g., 'pdf', 'jpg')
+        original_filename (str, optional): Original filename used as prefix
+    """
+    if original_filename:
+        original_name_without_ext = os.path.splitext(secure_filename(original_filename))[0]
+        return f"uploads/{original_name_without_ext}_{file_id}.{file_extension}"
+    return f"uploads/{file_id}.{file_extension}"
+
+def generate_download_url(blob_name):
+    """Return a signed URL for reading a blob
+
+    URLs come from the signed URL cache and are only signed again when
+    they are close to expiring.
+    """
+    from app.utils.signed_urls import get_signed_url
+    return get_signed_url(blob_name)
+
+def sign_blob_url(blob_name, expiration):
+    """Sign a new URL for reading a blob
+
+    Args:
+        blob_name (str): Name of the blob in the bucket
+        expiration (datetime): When the URL stops working (UTC)
+
+    Returns:
+        str: The signed URL
+    """
+    return get_storage_backend().sign_url(blob_name, expiration)
 
 def upload_file_to_gcs(file_obj, file_id, file_extension, original_filename=None):
     """Upload a file to Google Cloud Storage
@@ -21,10 +122,6 @@ def upload_file_to_gcs(file_obj, file_id, file_extension, original_filename=None
         str: GCS URL of the uploaded file
     """
     try:
-        client = get_gcs_client()
-        bucket_name = current_app.config['GOOGLE_CLOUD_BUCKET']
-        bucket = client.bucket(bucket_name)
-        
         # Use provided original filename or get from file object
         if original_filename:
             original_name_without_ext = os.path.splitext(secure_filename(original_filename))[0]
@@ -33,7 +130,6 @@ def upload_file_to_gcs(file_obj, file_id, file_extension, original_filename=None
         
         # Create the GCS blob (path in bucket) with original filename as prefix
         blob_name = f"uploads/{original_name_without_ext}_{file_id}.{file_extension}"
-        blob = bucket.blob(blob_name)
         
         # Determine content type based on file extension
         content_type = None
@@ -45,123 +141,103 @@ def upload_file_to_gcs(file_obj, file_id, file_extension, original_filename=None
             content_type = 'image/png'
         
         # Upload the file
-        blob.upload_from_file(
-            file_obj,
-            content_type=content_type
-        )
-        
-        # Generate a signed URL that expires in 7 days
-        url = blob.generate_signed_url(
-            version="v4",
-            expiration=datetime.utcnow() + timedelta(days=7),
-            method="GET"
-        )
+        blob = get_storage_backend().upload(file_obj, blob_name, content_type=content_type)
+
+        # Make the upload visible to manifest lookups right away
+        from app.utils.bucket_manifest import record_upload
+        record_upload(blob_name, blob['size'], blob['created'])
         
-        return url
+        return generate_download_url(blob_name)
         
     except Exception as e:
         print(f"Error uploading to GCS: {str(e)}")
         raise
 
-def get_file_from_gcs(file_id, file_extension, original_filename=None):
-    """Get a file from Google Cloud Storage
+def append_file_to_gcs(file_obj, file_id, file_extension, original_filename, expected_size):
+    """Append to an uploaded file in Google Cloud Storage, sending only the new bytes
     
     Args:
+        file_obj: File object with the bytes to append
         file_id (str): Unique identifier for the file
         file_extension (str): File extension (e.g., 'pdf', 'jpg')
-        original_filename (str, optional): Original filename to use as prefix
+        original_filename (str): Original filename used as prefix
+        expected_size (int): Size of the stored file the bytes follow
     
     Returns:
-        bytes: File contents
+        str: GCS URL of the file, or None if the stored file is not
+            expected_size bytes long and has to be uploaded in full
     """
     try:
-        client = get_gcs_client()
-        bucket_name = current_app.config['GOOGLE_CLOUD_BUCKET']
-        bucket = client.bucket(bucket_name)
-        
-        # Create blob name with original filename prefix if provided
-        if original_filename:
-            original_name_without_ext = os.path.splitext(secure_filename(original_filename))[0]
-            blob_name = f"uploads/{original_name_without_ext}_{file_id}.{file_extension}"
-        else:
-            blob_name = f"uploads/{file_id}.{file_extension}"
-            
-        print(f"Attempting to get file from GCS: {blob_name}")
-        blob = bucket.blob(blob_name)
-        
-        # Download the file content
-        return blob.download_as_bytes()
-        
+        blob_name = get_blob_name(file_id, file_extension, original_filename)
+        blob = get_storage_backend().append(blob_name, file_obj, expected_size)
+        if blob is None:
+            return None
+
+        from app.utils.bucket_manifest import record_upload
+        record_upload(blob_name, blob['size'], blob['created'])
+
+        return generate_download_url(blob_name)
+
+    except Exception as e:
+        print(f"Error appending to GCS file: {str(e)}")
+        raise
+
+def download_blob_to_file(blob_name, dest_path, start=None, end=None):
+    """Stream a blob, or a byte range of it, to a local file
+
+    The download is written in chunks to a temporary file next to
+    dest_path, which is renamed over dest_path once complete. Memory use
+    does not grow with the size of the file, and readers of dest_path never
+    see a partial download.
+
+    Args:
+        blob_name (str): Name of the blob in the bucket
+        dest_path (str): Local path to write to
+        start (int, optional): First byte to download
+        end (int, optional): Last byte to download (inclusive)
+
+    Returns:
+        int: Number of bytes written
+    """
+    temp_path = f"{dest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        print(f"Downloading file from GCS: {blob_name} -> {dest_path}")
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        with open(temp_path, 'wb') as f:
+            get_storage_backend().download(blob_name, f, start=start, end=end)
+        os.replace(temp_path, dest_path)
+        return os.path.getsize(dest_path)
+
     except Exception as e:
-        print(f"Error getting file from GCS: {str(e)}")
+        print(f"Error downloading file from GCS: {str(e)}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
         raise
 
-def delete_file_from_gcs(file_id, file_extension):
+def delete_file_from_gcs(file_id, file_extension, original_filename=None):
     """Delete a file from Google Cloud Storage
     
     Args:
         file_id (str): Unique identifier for the file
         file_extension (str): File extension (e.g., 'pdf', 'jpg')
+        original_filename (str, optional): Original filename used as prefix
     """
     try:
-        client = get_gcs_client()
-        bucket_name = current_app.config['GOOGLE_CLOUD_BUCKET']
-        bucket = client.bucket(bucket_name)
-        
-        blob_name = f"uploads/{file_id}.{file_extension}"
-        blob = bucket.blob(blob_name)
+        # Uploads are named like in upload_file_to_gcs
+        blob_name = get_blob_name(file_id, file_extension, original_filename)
+            
+        print(f"Deleting file from GCS: {blob_name}")
         
         # Delete the blob
-        blob.delete()
+        get_storage_backend().delete(blob_name)
+
+        from app.utils.bucket_manifest import forget_file
+        from app.utils.signed_urls import invalidate_signed_url
+        forget_file(file_id)
+        invalidate_signed_url(blob_name)
         
     except Exception as e:
         print(f"Error deleting file from GCS: {str(e)}")
         raise
-
-def list_files_in_bucket():
-    """List all files in the GCS bucket
-    
-    Returns:
-        list: List of dictionaries containing file information
-    """
-    try:
-        client = get_gcs_client()
-        bucket_name = current_app.config['GOOGLE_CLOUD_BUCKET']
-        bucket = client.bucket(bucket_name)
-        
-        files = []
-        blobs = bucket.list_blobs(prefix='uploads/')
-        
-        for blob in blobs:
-            # Skip if it's a directory
-            if blob.name.endswith('/'):
-                continue
-                
-            # Extract file ID and original filename from the blob name
-            # Format: uploads/originalname_fileid.extension
-            parts = blob.name.split('/')[-1].split('_')
-            if len(parts) >= 2:
-                original_name = '_'.join(parts[:-1])
-                file_id = parts[-1].split('.')[0]
-                extension = parts[-1].split('.')[-1]
-                
-                # Generate a signed URL that expires in 7 days
-                url = blob.generate_signed_url(
-                    version="v4",
-                    expiration=datetime.utcnow() + timedelta(days=7),
-                    method="GET"
-                )
-                
-                files.append({
-                    'id': file_id,
-                    'name': original_name,
-                    'extension': extension,
-                    'url': url,
-                    'created': blob.time_created.isoformat() if blob.time_created else None
-                })
-        
-        return files
-        
-    except Exception as e:
-        print(f"Error listing files from GCS: {str(e)}")
-        raise 
\ No newline at end of file
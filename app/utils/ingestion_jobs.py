@@ -0,0 +1,437 @@
+import os
+import json
+import time
+import uuid
+import tempfile
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, as_completed
+
+try:
+    import fcntl
+except ImportError:  # Windows: jobs are only recovered by the process that owns them
+    fcntl = None
+
+from app.utils.file_processor import process_file, save_processed_data
+from app.utils.document_locks import document_lock
+from app.utils.bucket_manifest import lookup_file
+from app.utils.gcs_utils import generate_download_url
+from app.utils.upload_queue import enqueue_upload, has_pending_upload
+
+# Stages every ingestion job goes through, in order
+JOB_STAGES = ['save', 'upload', 'extract', 'store']
+
+# Minimum seconds between journal writes for per-page progress updates
+PROGRESS_WRITE_INTERVAL = 0.5
+
+_app = None
+_executor = None
+_journal_dir = None
+_journal_lock = threading.Lock()
+_job_locks = {}
+_futures = {}
+
+def init_ingestion(app):
+    """Set up the ingestion worker pool and resume jobs left unfinished by a restart
+
+    Args:
+        app (Flask): The application the jobs run under
+    """
+    global _app, _executor, _journal_dir
+
+    _app = app
+    _journal_dir = app.config['INGEST_JOURNAL_DIR']
+    os.makedirs(_journal_dir, exist_ok=True)
+    _executor = ThreadPoolExecutor(max_workers=app.config['INGEST_WORKERS'],
+                                   thread_name_prefix='ingest')
+
+    recover_jobs()
+
+def submit_ingestion_job(file_id, file_path, filename, copy_from=None, content_hash=None):
+    """Create a journaled ingestion job for a saved upload and queue it
+
+    Args:
+        file_id (str): ID of the uploaded file
+        file_path (str): Path of the local copy saved by the request
+        filename (str): Sanitized original filename
+        copy_from (str, optional): ID of a document with the same contents,
+            whose extracted pages and summaries are copied instead of
+            extracting them again if it is processed by then
+        content_hash (str, optional): Hex SHA-256 digest of the upload,
+            required with copy_from
+
+    Returns:
+        dict: The new job record
+    """
+    now = time.time()
+    job = {
+        'job_id': str(uuid.uuid4()),
+        'file_id': file_id,
+        'filename': filename,
+        'file_path': file_path,
+        'status': 'queued',
+        'stages': [{'name': name, 'status': 'pending'} for name in JOB_STAGES],
+        'pages_done': 0,
+        'pages_total': None,
+        'file_url': None,
+        'copy_from': copy_from,
+        'content_hash': content_hash,
+        'summaries_copied': False,
+        'error': None,
+        'created': now,
+        'updated': now
+    }
+
+    # The request has already written the local copy
+    job['stages'][0]['status'] = 'completed'
+    _write_job(job)
+
+    print(f"Queued ingestion job {job['job_id']} for file {file_id}")
+    return _submit(job)
+
+def get_job(job_id):
+    """Return the current state of a job from the journal
+
+    Args:
+        job_id (str): The ID of the job
+
+    Returns:
+        dict: Job record, or None if the job is unknown
+    """
+    # Only allow plain job IDs so the value can't be used to escape the journal directory
+    if not job_id or os.path.basename(job_id) != job_id:
+        return None
+    return _read_job(job_id)
+
+def recover_jobs():
+    """Re-queue journaled jobs that were queued or running when a worker died
+
+    Returns:
+        int: Number of jobs recovered
+    """
+    recovered = 0
+
+    for filename in sorted(os.listdir(_journal_dir)):
+        if not filename.endswith('.json'):
+            continue
+
+        job = _read_job(filename[:-5])
+        if not job or job['status'] not in ('queued', 'running'):
+            continue
+
+        # A job still locked by a live worker is not orphaned
+        if fcntl is not None and _is_job_locked(job['job_id']):
+            continue
+
+        print(f"Recovering ingestion job {job['job_id']} (was {job['status']})")
+        job['status'] = 'queued'
+        _write_job(job)
+        _submit(job)
+        recovered += 1
+
+    if recovered:
+        print(f"Recovered {recovered} ingestion jobs from {_journal_dir}")
+    return recovered
+
+def iter_finished_jobs(job_ids, poll_interval=0.5, timeout=None):
+    """Yield job records as each of the given jobs completes or fails
+
+    Jobs submitted by this process are waited on directly; any others
+    (e.g. run by another worker) are polled from the journal.
+
+    Args:
+        job_ids (list): IDs of the jobs to wait for
+        poll_interval (float): Seconds between journal polls
+        timeout (float, optional): Stop waiting after this many seconds,
+            leaving the jobs not finished by then out
+
+    Yields:
+        dict: Final job record of each job, in completion order
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    with _journal_lock:
+        futures = {_futures[job_id]: job_id for job_id in job_ids if job_id in _futures}
+    remaining = [job_id for job_id in job_ids if job_id not in futures.values()]
+
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            job_id = futures[future]
+            job = _read_job(job_id)
+            if job and job['status'] not in ('completed', 'failed'):
+                # Another worker took the job over; follow it through the journal
+                remaining.append(job_id)
+            else:
+                yield job or _missing_job(job_id)
+    except FuturesTimeoutError:
+        return
+
+    while remaining:
+        for job_id in list(remaining):
+            job = _read_job(job_id)
+            if not job or job['status'] in ('completed', 'failed'):
+                remaining.remove(job_id)
+                yield job or _missing_job(job_id)
+        if not remaining or (deadline is not None and time.time() >= deadline):
+            return
+        time.sleep(poll_interval if deadline is None else min(poll_interval, max(0, deadline - time.time())))
+
+def _missing_job(job_id):
+    """Final record reported for a job that is gone from the journal"""
+    return {'job_id': job_id, 'status': 'failed', 'error': 'Job not found'}
+
+def _submit(job):
+    """Hand a job to the worker pool"""
+    future = _executor.submit(_run_job, job['job_id'])
+
+    with _journal_lock:
+        _futures[job['job_id']] = future
+    future.add_done_callback(lambda _: _forget_future(job['job_id']))
+    return job
+
+def _forget_future(job_id):
+    with _journal_lock:
+        _futures.pop(job_id, None)
+
+def _run_job(job_id):
+    """Run the remaining stages of a job inside the application context"""
+    with _app.app_context():
+        lock_file = _acquire_job_lock(job_id)
+        if lock_file is None:
+            print(f"Ingestion job {job_id} is already being run by another worker")
+            return
+
+        try:
+            job = _read_job(job_id)
+            if not job or job['status'] in ('completed', 'failed'):
+                return
+
+            job['status'] = 'running'
+            _write_job(job)
+
+            for stage in job['stages']:
+                if stage['status'] == 'completed':
+                    continue
+
+                stage['status'] = 'running'
+                stage['started'] = time.time()
+                _write_job(job)
+
+                _STAGE_HANDLERS[stage['name']](job)
+
+                stage['status'] = 'completed'
+                stage['finished'] = time.time()
+                _write_job(job)
+
+            job['status'] = 'completed'
+            _write_job(job)
+            print(f"Ingestion job {job_id} completed for file {job['file_id']}")
+        except Exception as e:
+            print(f"Ingestion job {job_id} failed: {str(e)}")
+            print(traceback.format_exc())
+            job = _read_job(job_id) or {'job_id': job_id, 'stages': []}
+            for stage in job['stages']:
+                if stage['status'] == 'running':
+                    stage['status'] = 'failed'
+            job['status'] = 'failed'
+            job['error'] = str(e)
+            _write_job(job)
+        finally:
+            _release_job_lock(job_id, lock_file)
+
+def _stage_save(job):
+    """The request saves the upload; a recovered job only checks it is still there"""
+    if not os.path.exists(job['file_path']):
+        raise FileNotFoundError(f"Local copy of upload is missing: {job['file_path']}")
+
+def _stage_upload(job):
+    """Queue the local copy for upload to storage, which runs alongside extraction"""
+    _stage_save(job)
+    ext = os.path.splitext(job['file_path'])[1].lower()[1:]
+    enqueue_upload(job['file_id'], job['file_path'], ext, original_filename=job['filename'])
+
+def _stage_extract(job):
+    """Extract page text, journaling per-page progress"""
+    last_write = [0.0]
+
+    def on_progress(pages_done, pages_total):
+        job['pages_done'] = pages_done
+        job['pages_total'] = pages_total
+        now = time.time()
+        if pages_done == pages_total or now - last_write[0] >= PROGRESS_WRITE_INTERVAL:
+            last_write[0] = now
+            _write_job(job)
+
+    processed_data = _copy_processed_pages(job) if job.get('copy_from') else None
+    if processed_data is None:
+        processed_data = process_file(job['file_path'], progress_callback=on_progress)
+    job['pages_total'] = job['pages_done'] = len(processed_data['pages'])
+
+    # Keep the extracted pages next to the journal until the store stage runs
+    with open(_result_path(job['job_id']), 'w') as f:
+        json.dump(processed_data, f)
+
+def _copy_processed_pages(job):
+    """Copy the extracted pages and summaries of the document the upload duplicates
+
+    Only the processed pages are shared; notes are not copied, and the
+    upload becomes a document of its own that can be edited or deleted
+    without touching the other one.
+
+    Returns:
+        dict: Processed data for the job's document, or None if the other
+            document is not processed yet, or was edited or deleted
+    """
+    from app.utils.document_store import get_document_store
+    from app.utils.upload_dedup import find_duplicate
+
+    source_id = job['copy_from']
+    with document_lock(source_id, shared=True):
+        source = get_document_store().load(source_id)
+    if source is None:
+        print(f"Document {source_id} is not processed yet, extracting {job['file_id']} itself")
+        return None
+
+    # An edited document no longer has the uploaded contents
+    duplicate = find_duplicate(job['content_hash'])
+    if not duplicate or duplicate['file_id'] != source_id:
+        print(f"Document {source_id} changed, extracting {job['file_id']} itself")
+        return None
+
+    pages = [dict(page, notes='') for page in source.get('pages', [])]
+    processed_data = {'pages': pages}
+    for key in ('lazy', 'total_pages', 'summarize_on_extract'):
+        if key in source:
+            processed_data[key] = source[key]
+    if source.get('lazy'):
+        # Pages not extracted yet are extracted from this upload's own copy
+        processed_data['source_path'] = job['file_path']
+
+    job['summaries_copied'] = bool(source.get('summarize_on_extract')) or any(page.get('summary') for page in pages)
+    print(f"Copied {len(pages)} processed pages of document {source_id} to {job['file_id']}")
+    return processed_data
+
+def _stage_store(job):
+    """Persist the extracted pages as the document's processed data"""
+    result_path = _result_path(job['job_id'])
+    with open(result_path, 'r') as f:
+        processed_data = json.load(f)
+
+    # Where the original lives, so the local copy can be dropped and fetched again later
+    processed_data.setdefault('file_type', os.path.splitext(job['file_path'])[1].lower()[1:])
+    processed_data.setdefault('original_name', job['filename'])
+
+    # The uploader sets the URL of a file it finishes after this save; one
+    # it finished before is already in the manifest
+    with document_lock(job['file_id']):
+        if not job.get('file_url') and not has_pending_upload(job['file_id']):
+            matching_file = lookup_file(job['file_id'])
+            if matching_file:
+                job['file_url'] = generate_download_url(matching_file['blob_name'])
+        if job.get('file_url'):
+            processed_data['file_url'] = job['file_url']
+            processed_data['download_url'] = job['file_url']
+
+        if not save_processed_data(job['file_id'], processed_data):
+            raise IOError(f"Could not save processed data for {job['file_id']}")
+    os.remove(result_path)
+
+_STAGE_HANDLERS = {
+    'save': _stage_save,
+    'upload': _stage_upload,
+    'extract': _stage_extract,
+    'store': _stage_store
+}
+
+def _job_path(job_id):
+    return os.path.join(_journal_dir, f"{job_id}.json")
+
+def _result_path(job_id):
+    return os.path.join(_journal_dir, f"{job_id}.result")
+
+def _read_job(job_id):
+    """Load a job record from the journal"""
+    try:
+        with open(_job_path(job_id), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error reading ingestion job {job_id}: {str(e)}")
+        return None
+
+def _write_job(job):
+    """Atomically write a job record to the journal"""
+    job['updated'] = time.time()
+    path = _job_path(job['job_id'])
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with _journal_lock:
+        with open(temp_path, 'w') as f:
+            json.dump(job, f)
+        os.replace(temp_path, path)
+
+def _acquire_job_lock(job_id):
+    """Take the exclusive run lock for a job
+
+    Returns:
+        The open lock file (or True without fcntl), or None if another worker holds it
+    """
+    if fcntl is None:
+        with _journal_lock:
+            if job_id in _job_locks:
+                return None
+            _job_locks[job_id] = True
+        return True
+
+    lock_path = os.path.join(_journal_dir, f"{job_id}.lock")
+    while True:
+        lock_file = open(lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+
+        # The holder removes the lock file before releasing it. If that
+        # happened after it was opened here, this lock is on the removed
+        # file and another worker may lock a new one, so start over
+        try:
+            if os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                return lock_file
+        except FileNotFoundError:
+            pass
+        lock_file.close()
+
+def _release_job_lock(job_id, lock_file):
+    """Release a lock taken by _acquire_job_lock
+
+    The lock file is removed while the lock is still held, so the next
+    worker to take it notices and locks a new file instead.
+    """
+    if fcntl is None:
+        with _journal_lock:
+            _job_locks.pop(job_id, None)
+        return
+
+    try:
+        os.remove(lock_file.name)
+    except OSError:
+        pass
+    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    lock_file.close()
+
+def _is_job_locked(job_id):
+    """Check whether some live process holds the run lock for a job"""
+    lock_path = os.path.join(_journal_dir, f"{job_id}.lock")
+    try:
+        # Opened without creating it, so a released lock's file isn't left behind
+        lock_file = open(lock_path, 'r')
+    except FileNotFoundError:
+        return False
+
+    with lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return False
@@ -0,0 +1,100 @@
+from flask import current_app, has_app_context
+from app.utils.file_processor import extract_pages
+from app.utils.document_store import get_document_store
+from app.utils.document_locks import document_lock
+from app.utils.document_analyzer import generate_summary
+from app.utils.document_sidecars import mark_sidecar_stale
+
+def ensure_pages_extracted(file_id, document_data, page_numbers=None, readahead=None, summarize=True):
+    """Extract the text of lazily extracted pages before they are read
+
+    Each requested page is extracted together with the next few pages of
+    read-ahead, and the result is saved so every page is extracted only once.
+    If the document was already analyzed, the new pages are summarized too,
+    as are requested pages that were extracted without a summary.
+
+    Args:
+        file_id (str): The ID of the document
+        document_data (dict): Loaded document data, updated in place
+        page_numbers (list, optional): Pages about to be read. Defaults to
+            all pages.
+        readahead (int, optional): Pages to extract after each requested
+            page. Defaults to the LAZY_READAHEAD_PAGES app config value.
+        summarize (bool): Summarize the pages of an analyzed document. Without
+            it they are summarized on a later read instead.
+
+    Returns:
+        dict: The updated document data
+    """
+    if not document_data.get('lazy') and not document_data.get('summarize_on_extract'):
+        return document_data
+
+    pages = {page['page_number']: page for page in document_data.get('pages', [])}
+
+    if page_numbers is None:
+        wanted = set(pages)
+    else:
+        if readahead is None:
+            readahead = current_app.config.get('LAZY_READAHEAD_PAGES', 0) if has_app_context() else 0
+        wanted = {n + offset for n in page_numbers for offset in range(readahead + 1)}
+
+    summary_model = document_data.get('summarize_on_extract') if summarize else None
+    pending = [pages[n] for n in sorted(wanted)
+               if n in pages and pages[n].get('extracted') is False]
+    unsummarized = [pages[n] for n in sorted(wanted)
+                    if summary_model and n in pages and pages[n].get('extracted') is True
+                    and not pages[n].get('summary')]
+    if not pending and not unsummarized:
+        return document_data
+
+    texts = {}
+    if pending:
+        print(f"Extracting {len(pending)} pending pages of lazy document {file_id}")
+        try:
+            texts = extract_pages(document_data['source_path'], [page['source_page'] for page in pending])
+        except Exception as e:
+            print(f"Error extracting pages of lazy document {file_id}: {str(e)}")
+
+    updates = {}
+    for page in unsummarized:
+        page['summary'] = generate_summary(page.get('text', ''), model=summary_model)
+        updates[page['source_page']] = {'summary': page['summary']}
+
+    for page in pending:
+        text = texts.get(page['source_page'])
+        if text is None:
+            # Shown in this response only; the page stays pending and is
+            # extracted again on its next read, as the failure may be transient
+            page['text'] = f"[Error extracting text from page {page['page_number']}]"
+            continue
+        page['text'] = text
+        page['extracted'] = True
+
+        if summary_model:
+            page['summary'] = generate_summary(text, model=summary_model)
+        updates[page['source_page']] = {key: page[key] for key in ('text', 'extracted', 'summary') if key in page}
+
+    if not updates:
+        return document_data
+
+    # Pages may have been renumbered while extracting, so match them up by source page
+    store = get_document_store()
+    with document_lock(file_id):
+        current = store.load(file_id, include_text=False)
+        if current is None:
+            return document_data
+
+        by_source = {page.get('source_page'): page for page in current.get('pages', [])}
+        store.update_pages(file_id, {by_source[source_page]['page_number']: fields
+                                     for source_page, fields in updates.items() if source_page in by_source})
+        for source_page, fields in updates.items():
+            if source_page in by_source:
+                by_source[source_page].update(fields)
+
+        if all(page.get('extracted') is not False for page in current.get('pages', [])):
+            print(f"All pages of lazy document {file_id} are now extracted")
+            document_data['lazy'] = False
+            store.update_document(file_id, {'lazy': False})
+        mark_sidecar_stale(file_id)
+
+    return document_data
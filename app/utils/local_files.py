@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import threading
+from flask import current_app
+
+# Extensions a document's local file can have (the allowed upload types)
+FILE_EXTENSIONS = ('pdf', 'png', 'jpg', 'jpeg')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS local_files (
+    file_id TEXT PRIMARY KEY,
+    path TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+_local = threading.local()
+
+def local_upload_path(file_id, extension):
+    """Return where the local copy of an upload is kept, creating its directory
+
+    Uploads are spread over subdirectories of UPLOAD_FOLDER named after the
+    first two characters of their ID, so no directory grows with the total
+    number of uploads.
+
+    Args:
+        file_id (str): ID of the upload
+        extension (str): File extension, with or without the dot
+
+    Returns:
+        str: Path of the file
+
+    Raises:
+        ValueError: If file_id is not a plain ID
+    """
+    if not _is_valid_id(file_id):
+        raise ValueError(f"Invalid file ID: {file_id}")
+    shard_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], file_id[:2])
+    os.makedirs(shard_dir, exist_ok=True)
+    return os.path.join(shard_dir, f"{file_id}.{extension.lstrip('.')}")
+
+def register_local_file(file_id, path):
+    """Record the local file of a document, replacing the one recorded before"""
+    try:
+        _connect().execute("INSERT OR REPLACE INTO local_files (file_id, path) VALUES (?, ?)",
+                           (file_id, os.path.abspath(path)))
+    except sqlite3.Error as e:
+        # Lookups still find the file where it is expected, just less directly
+        print(f"Error updating local file index: {str(e)}")
+
+def forget_local_file(file_id):
+    """Drop the index entry of a document whose local file was removed"""
+    try:
+        _connect().execute("DELETE FROM local_files WHERE file_id = ?", (file_id,))
+    except sqlite3.Error as e:
+        print(f"Error updating local file index: {str(e)}")
+
+def find_local_file(file_id):
+    """Return the path of a document's local file, or None if there is none
+
+    The index (LOCAL_FILE_INDEX_PATH) answers with one lookup. Files it
+    does not know, e.g. kept in UPLOAD_FOLDER itself before it was sharded,
+    are looked for at the few paths they can have and then recorded.
+    """
+    if not _is_valid_id(file_id):
+        return None
+
+    try:
+        row = _connect().execute("SELECT path FROM local_files WHERE file_id = ?", (file_id,)).fetchone()
+    except sqlite3.Error as e:
+        print(f"Error reading local file index: {str(e)}")
+        row = None
+
+    if row:
+        if os.path.exists(row[0]):
+            return row[0]
+        forget_local_file(file_id)
+
+    for path in _candidate_paths(file_id):
+        if os.path.exists(path):
+            register_local_file(file_id, path)
+            return path
+    return None
+
+def find_local_files(file_id):
+    """Return every local copy of a document, including unsharded and scratch ones"""
+    if not _is_valid_id(file_id):
+        return []
+
+    paths = []
+    indexed = find_local_file(file_id)
+    if indexed:
+        paths.append(indexed)
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    scratch = [os.path.join(upload_folder, f"{file_id}_original.{extension}") for extension in FILE_EXTENSIONS]
+    for path in _candidate_paths(file_id) + scratch:
+        if path not in paths and os.path.exists(path):
+            paths.append(path)
+    return paths
+
+def _is_valid_id(file_id):
+    return bool(file_id) and os.path.basename(file_id) == file_id and not file_id.startswith('.')
+
+def _candidate_paths(file_id):
+    """Paths a document's local file can have, sharded first, then unsharded"""
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    paths = [os.path.join(upload_folder, file_id[:2], f"{file_id}.{extension}") for extension in FILE_EXTENSIONS]
+    paths.append(os.path.join(upload_folder, f"merged_{file_id}.pdf"))
+    paths += [os.path.join(upload_folder, f"{file_id}.{extension}") for extension in FILE_EXTENSIONS]
+    return paths
+
+def _connect():
+    """Return this thread's connection to the index, opening one in a forked worker as well"""
+    db_path = current_app.config['LOCAL_FILE_INDEX_PATH']
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid() or _local.path != db_path:
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.path = db_path
+    return conn
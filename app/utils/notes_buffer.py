@@ -0,0 +1,170 @@
+import os
+import atexit
+import threading
+import traceback
+
+from app.utils.document_locks import document_lock
+from app.utils.document_store import get_document_store
+from app.utils.document_sidecars import mark_sidecar_stale
+
+# Pending saves that trigger a flush before the timer fires
+MAX_PENDING_NOTES = 500
+
+_app = None
+_interval = 2.0
+_pending = {}  # (file_id, removals seen, page_number) -> notes, oldest save first
+_pending_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_wake = threading.Event()
+_flusher_pid = None
+
+def init_notes_buffer(app):
+    """Set up the notes write-behind buffer
+
+    Args:
+        app (Flask): The application the buffer flushes under
+    """
+    global _app, _interval
+
+    _app = app
+    _interval = app.config['NOTES_FLUSH_INTERVAL']
+    atexit.register(flush_notes)
+
+def buffer_notes(file_id, page_number, notes, removals=0):
+    """Queue a page's notes to be saved
+
+    A later save of the same page replaces a pending one, so rapid
+    autosaves are written once. Pending notes are written in batches,
+    every NOTES_FLUSH_INTERVAL seconds and when the process exits.
+
+    Pages may be removed and renumbered, in any worker, before the notes
+    are written. The notes remember how many pages the document had had
+    removed when they were saved, and are moved to the page's number
+    after the removals made since (or dropped with a removed page).
+
+    Args:
+        file_id (str): The ID of the document
+        page_number (int): The page the notes belong to
+        notes (str): The notes
+        removals (int): Length of the document's removed_pages that
+            page_number refers to
+    """
+    _ensure_flusher()
+
+    with _pending_lock:
+        # Re-added at the end, so it wins over older saves that end up on the same page
+        _pending.pop((file_id, removals, page_number), None)
+        _pending[(file_id, removals, page_number)] = notes
+        if len(_pending) >= MAX_PENDING_NOTES:
+            _wake.set()
+
+def get_pending_notes(file_id, removed_pages=()):
+    """Return notes of a document that are not saved yet
+
+    Args:
+        file_id (str): The ID of the document
+        removed_pages (list): The document's current removed_pages
+
+    Returns:
+        dict: Maps current page numbers to their pending notes
+    """
+    with _pending_lock:
+        pending = {key[1:]: notes for key, notes in _pending.items() if key[0] == file_id}
+    return _renumber(pending, removed_pages)
+
+def discard_notes(file_id):
+    """Drop a document's pending notes, e.g. because it is being deleted"""
+    with _pending_lock:
+        for key in [key for key in _pending if key[0] == file_id]:
+            del _pending[key]
+
+def flush_notes(file_id=None):
+    """Save pending notes, grouped into one update per document
+
+    Args:
+        file_id (str, optional): Only flush this document's notes
+
+    Returns:
+        int: Number of pages whose notes were saved
+    """
+    with _flush_lock:
+        with _pending_lock:
+            batch = {key: notes for key, notes in _pending.items()
+                     if file_id is None or key[0] == file_id}
+            for key in batch:
+                del _pending[key]
+
+        if not batch:
+            return 0
+
+        by_document = {}
+        for (doc_id, removals, page_number), notes in batch.items():
+            by_document.setdefault(doc_id, {})[(removals, page_number)] = notes
+
+        saved = 0
+        with _app.app_context():
+            store = get_document_store()
+            for doc_id, pending in by_document.items():
+                # Held from reading removed_pages until the notes are saved, so no page is removed in between
+                with document_lock(doc_id):
+                    document = store.load(doc_id, include_text=False)
+                    if document is None:
+                        print(f"Dropping notes of deleted document {doc_id}")
+                        continue
+
+                    notes_by_page = _renumber(pending, document.get('removed_pages', []))
+                    updates = {page_number: {'notes': notes} for page_number, notes in notes_by_page.items()}
+                    if not updates:
+                        continue
+                    if store.update_pages(doc_id, updates):
+                        saved += len(updates)
+                        mark_sidecar_stale(doc_id)
+                        continue
+
+                print(f"Could not save notes of document {doc_id}, will retry")
+                with _pending_lock:
+                    for (removals, page_number), notes in pending.items():
+                        # Keep a newer save made while this one was being written
+                        _pending.setdefault((doc_id, removals, page_number), notes)
+
+        print(f"Saved notes of {saved} pages")
+        return saved
+
+def _renumber(pending, removed_pages):
+    """Map notes keyed by (removals seen, page number) to current page numbers
+
+    Notes of a page that was removed since are dropped. When several saves
+    end up on the same page, the last one wins.
+    """
+    notes_by_page = {}
+    for (removals, page_number), notes in pending.items():
+        for removed in removed_pages[removals:]:
+            if page_number == removed:
+                page_number = None
+                break
+            if page_number > removed:
+                page_number -= 1
+        if page_number is not None:
+            notes_by_page[page_number] = notes
+    return notes_by_page
+
+def _ensure_flusher():
+    """Start the flush thread in this process (again after a fork)"""
+    global _flusher_pid
+
+    with _pending_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+
+    threading.Thread(target=_flush_loop, name='notes-flusher', daemon=True).start()
+
+def _flush_loop():
+    while True:
+        _wake.wait(_interval)
+        _wake.clear()
+        try:
+            flush_notes()
+        except Exception as e:
+            print(f"Error flushing notes: {str(e)}")
+            print(traceback.format_exc())
@@ -0,0 +1,210 @@
+import os
+import shutil
+import platform
+import threading
+import functools
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image, ImageOps
+import pytesseract
+
+# Longest side, in pixels, images are downscaled to before OCR. Phone photos
+# of notes are ~4000px wide; ~2000px keeps handwriting and print legible
+DEFAULT_MAX_SIDE = 2000
+
+# Where Tesseract is usually installed on macOS, where it is often not on PATH
+MACOS_TESSERACT_PATHS = [
+    '/opt/homebrew/bin/tesseract',  # Apple Silicon
+    '/usr/local/bin/tesseract',     # Intel Mac
+    '/opt/local/bin/tesseract',     # MacPorts
+]
+
+# ITU-R BT.601 luma weights
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+_ocr_pool = None
+_ocr_pool_workers = 0
+_ocr_pool_users = {}  # pool -> OCR calls using it
+_ocr_pool_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=None)
+def find_tesseract():
+    """Locate the Tesseract binary once per process
+
+    Returns:
+        str: Path to tesseract, or None if it is not installed
+    """
+    if platform.system() == 'Darwin':
+        for path in MACOS_TESSERACT_PATHS:
+            if os.path.exists(path):
+                print(f"Found Tesseract at: {path}")
+                pytesseract.pytesseract.tesseract_cmd = path
+                break
+
+    tesseract_path = pytesseract.pytesseract.tesseract_cmd
+    if tesseract_path == 'tesseract':
+        tesseract_path = shutil.which('tesseract')
+    elif not os.path.exists(tesseract_path):
+        tesseract_path = None
+
+    print(f"Tesseract available: {tesseract_path is not None} ({tesseract_path})")
+    return tesseract_path
+
+def preprocess_image(image, max_side=DEFAULT_MAX_SIDE):
+    """Prepare an image for OCR: grayscale, downscale and binarize it
+
+    Grayscale conversion uses the BT.601 luma weights, downscaling averages
+    whole-pixel blocks, and binarization uses Otsu's threshold. All three are
+    vectorized NumPy operations.
+
+    Args:
+        image (PIL.Image.Image): Image to preprocess
+        max_side (int): Longest side of the result, in pixels
+
+    Returns:
+        PIL.Image.Image: Black-and-white 'L' mode image
+    """
+    # Phone cameras store rotation in EXIF rather than in the pixels
+    image = ImageOps.exif_transpose(image)
+
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    pixels = np.asarray(image, dtype=np.float32)
+    gray = pixels @ _LUMA if pixels.ndim == 3 else pixels
+
+    # Downscale by an integer factor, averaging each factor x factor block
+    factor = -(-max(gray.shape) // max_side)  # Ceiling division
+    if factor > 1:
+        height = gray.shape[0] // factor * factor
+        width = gray.shape[1] // factor * factor
+        gray = gray[:height, :width].reshape(
+            height // factor, factor, width // factor, factor).mean(axis=(1, 3))
+
+    threshold = otsu_threshold(gray)
+    binary = np.where(gray > threshold, 255, 0).astype(np.uint8)
+    return Image.fromarray(binary, mode='L')
+
+def otsu_threshold(gray):
+    """Compute Otsu's threshold for a grayscale image
+
+    Args:
+        gray (numpy.ndarray): Grayscale pixel values in [0, 255]
+
+    Returns:
+        float: Threshold maximizing the between-class variance
+    """
+    histogram = np.bincount(np.clip(gray, 0, 255).astype(np.uint8).ravel(),
+                            minlength=256).astype(np.float64)
+    levels = np.arange(256, dtype=np.float64)
+
+    weight_background = np.cumsum(histogram)
+    weight_foreground = weight_background[-1] - weight_background
+    sum_background = np.cumsum(histogram * levels)
+    mean_background = sum_background / np.maximum(weight_background, 1)
+    mean_foreground = (sum_background[-1] - sum_background) / np.maximum(weight_foreground, 1)
+
+    between_variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+    return float(np.argmax(between_variance))
+
+def _ocr_file(file_path, max_side):
+    """Worker entry point: load, preprocess and OCR one image file
+
+    Args:
+        file_path (str): Path to the image
+        max_side (int): Longest side to downscale to
+
+    Returns:
+        str: Extracted text
+    """
+    find_tesseract()
+    with Image.open(file_path) as image:
+        return pytesseract.image_to_string(preprocess_image(image, max_side))
+
+@contextmanager
+def _use_ocr_pool(workers):
+    """Use the shared process pool for OCR
+
+    If the size changed, a new pool is created. The old one is only shut
+    down once the OCR calls still submitting to it are done with it.
+
+    Args:
+        workers (int): Number of worker processes
+
+    Yields:
+        ProcessPoolExecutor: The shared pool
+    """
+    global _ocr_pool, _ocr_pool_workers
+
+    with _ocr_pool_lock:
+        if _ocr_pool is None or _ocr_pool_workers != workers:
+            if _ocr_pool is not None and not _ocr_pool_users.get(_ocr_pool):
+                _ocr_pool.shutdown(wait=False)
+            _ocr_pool = ProcessPoolExecutor(max_workers=workers)
+            _ocr_pool_workers = workers
+        pool = _ocr_pool
+        _ocr_pool_users[pool] = _ocr_pool_users.get(pool, 0) + 1
+
+    try:
+        yield pool
+    finally:
+        with _ocr_pool_lock:
+            _ocr_pool_users[pool] -= 1
+            if not _ocr_pool_users[pool]:
+                del _ocr_pool_users[pool]
+                # The last user of a replaced pool shuts it down
+                if pool is not _ocr_pool:
+                    pool.shutdown(wait=False)
+
+def ocr_images(file_paths, workers=1, max_side=DEFAULT_MAX_SIDE):
+    """Run OCR on several image files on a bounded process pool
+
+    Args:
+        file_paths (list): Paths of the images
+        workers (int): Maximum number of OCR processes
+        max_side (int): Longest side to downscale to
+
+    Returns:
+        list: Extracted text per image, in input order. Images that fail
+            are returned as the raised exception instead of a string.
+    """
+    if workers <= 1 or len(file_paths) == 0:
+        results = []
+        for file_path in file_paths:
+            try:
+                results.append(_ocr_file(file_path, max_side))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    results = []
+    with _use_ocr_pool(workers) as pool:
+        futures = [pool.submit(_ocr_file, file_path, max_side) for file_path in file_paths]
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+    return results
+
+def ocr_image(file_path, workers=1, max_side=DEFAULT_MAX_SIDE):
+    """Run OCR on a single image file
+
+    With workers > 1 the OCR runs on the shared pool, which bounds how many
+    OCR processes concurrent requests can start.
+
+    Args:
+        file_path (str): Path to the image
+        workers (int): Size of the shared OCR pool
+        max_side (int): Longest side to downscale to
+
+    Returns:
+        str: Extracted text
+
+    Raises:
+        Exception: Whatever loading the image or running Tesseract raised
+    """
+    result = ocr_images([file_path], workers, max_side)[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
@@ -0,0 +1,169 @@
+import os
+import hashlib
+import threading
+import PyPDF2
+
+# Bumped whenever extraction changes in a way that invalidates cached text
+CACHE_VERSION = f"1:{PyPDF2.__version__}"
+
+class PageCache:
+    """Disk-backed cache of extracted page text with size-bounded LRU eviction
+
+    Entries live in <cache_dir>/<key[:2]>/<key>.txt. A hit bumps the entry's
+    mtime, and eviction removes the least recently used entries until the
+    cache fits in max_bytes again.
+
+    Instances are plain data so they can be passed to extraction workers.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Locks and size estimates are per process
+        return {'cache_dir': self.cache_dir, 'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state['cache_dir'], state['max_bytes'])
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.txt")
+
+    def get(self, key):
+        """Return the cached text for a page key, or None on a miss"""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            os.utime(path)  # Mark as recently used
+            return text
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error reading page cache entry {key}: {str(e)}")
+            return None
+
+    def put(self, key, text):
+        """Store the extracted text for a page key"""
+        path = self._entry_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(temp_path, path)
+        except Exception as e:
+            print(f"Error writing page cache entry {key}: {str(e)}")
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += os.path.getsize(path)
+            over_budget = self._size > self.max_bytes
+
+        if over_budget:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits its budget
+
+        Returns:
+            int: Number of bytes reclaimed
+        """
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.txt'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        # Evict down to 90% so a full cache doesn't rescan on every write
+        target = int(self.max_bytes * 0.9)
+        reclaimed = 0
+
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            reclaimed += size
+
+        with self._lock:
+            self._size = total
+
+        if reclaimed:
+            print(f"Page cache evicted {reclaimed} bytes, {total} bytes remain")
+        return reclaimed
+
+    def _scan_size(self):
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except FileNotFoundError:
+                    pass
+        return total
+
+def page_key(page):
+    """Hash everything that determines a page's extracted text
+
+    The key covers the decoded content stream, any form XObjects and, for
+    each font the page uses, its base font, encoding and ToUnicode map, since
+    those decide how the content stream's glyphs turn into text.
+
+    Args:
+        page (PyPDF2.PageObject): The page to hash
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    digest = hashlib.sha256(CACHE_VERSION.encode())
+
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+
+    resources = page.get('/Resources')
+    resources = resources.get_object() if resources is not None else {}
+    fonts = resources.get('/Font')
+    fonts = fonts.get_object() if fonts is not None else {}
+
+    for name in sorted(fonts.keys()):
+        font = fonts[name].get_object()
+        digest.update(f"|{name}|{font.get('/BaseFont')}|{font.get('/Subtype')}|".encode())
+
+        encoding = font.get('/Encoding')
+        if encoding is not None:
+            encoding = encoding.get_object()
+            digest.update(repr(encoding.get('/Differences') if hasattr(encoding, 'get') else encoding).encode())
+
+        to_unicode = font.get('/ToUnicode')
+        if to_unicode is not None:
+            digest.update(to_unicode.get_object().get_data())
+
+    # Form XObjects can carry text of their own
+    xobjects = resources.get('/XObject')
+    xobjects = xobjects.get_object() if xobjects is not None else {}
+
+    for name in sorted(xobjects.keys()):
+        xobject = xobjects[name].get_object()
+        if xobject.get('/Subtype') == '/Form':
+            digest.update(f"|{name}|".encode())
+            digest.update(xobject.get_data())
+
+    return digest.hexdigest()
@@ -0,0 +1,223 @@
+import os
+from io import BytesIO
+
+from PyPDF2 import PdfReader
+from PyPDF2.generic import (ArrayObject, DictionaryObject, IndirectObject, NameObject,
+                            NullObject, NumberObject, StreamObject)
+
+# Bytes at the end of a PDF searched for its startxref
+TAIL_SIZE = 1024
+
+class IncrementalAppendUnsupported(Exception):
+    """The PDF can't be appended to in place and has to be merged in full"""
+
+def write_incremental_append(original_path, new_path, update_path):
+    """Write an incremental update that appends the pages of one PDF to another
+
+    The update holds only the new pages (and the objects they use), a new
+    version of the original's page tree root and a cross-reference section
+    chaining to the original's. Appending its bytes to the original file
+    gives a PDF with all pages, without rewriting the original.
+
+    Only PDFs with a classic cross-reference table and no encryption are
+    supported; others raise IncrementalAppendUnsupported and have to be
+    merged with PdfMerger.
+
+    Args:
+        original_path (str): PDF the pages are appended to
+        new_path (str): PDF whose pages are appended
+        update_path (str): Where to write the update
+
+    Returns:
+        int: Number of pages appended
+
+    Raises:
+        IncrementalAppendUnsupported: If the original can't be updated in place
+    """
+    original_size = os.path.getsize(original_path)
+    with open(original_path, 'rb') as f:
+        f.seek(max(0, original_size - TAIL_SIZE))
+        tail = f.read()
+        startxref = _parse_startxref(tail)
+        f.seek(startxref)
+        if not f.read(4) == b'xref':
+            raise IncrementalAppendUnsupported("Original PDF uses a cross-reference stream")
+        f.seek(original_size - 1)
+        ends_with_newline = f.read(1) in (b'\n', b'\r')
+
+    original = PdfReader(original_path, strict=False)
+    new = PdfReader(new_path, strict=False)
+    if original.is_encrypted or new.is_encrypted:
+        raise IncrementalAppendUnsupported("Encrypted PDFs can't be appended to")
+    if original.xref_objStm or '/XRefStm' in original.trailer:
+        raise IncrementalAppendUnsupported("Original PDF uses object streams")
+
+    root_ref = original.trailer.raw_get('/Root')
+    pages_ref = original.trailer['/Root'].raw_get('/Pages')
+    if not isinstance(pages_ref, IndirectObject):
+        raise IncrementalAppendUnsupported("Original PDF has no indirect page tree")
+    pages_root = pages_ref.get_object()
+
+    copier = _ObjectCopier(int(original.trailer['/Size']), pages_ref)
+    new_pages = list(new.pages)
+    for page in new_pages:
+        if page.indirect_reference is None:
+            raise IncrementalAppendUnsupported("Appended PDF has a direct page object")
+        copier.reserve_page(page.indirect_reference)
+    new_page_refs = [copier.copy_page(page, pages_root) for page in new_pages]
+
+    # The page tree root with the new pages added at the end
+    updated_root = DictionaryObject(pages_root)
+    updated_root[NameObject('/Kids')] = ArrayObject(list(pages_root['/Kids']) + new_page_refs)
+    updated_root[NameObject('/Count')] = NumberObject(int(pages_root['/Count']) + len(new_page_refs))
+
+    body = BytesIO()
+    if not ends_with_newline:
+        body.write(b'\n')
+    offsets = {}
+    objects = [(pages_ref.idnum, pages_ref.generation, updated_root)]
+    objects += [(number, 0, obj) for number, obj in copier.objects]
+    for number, generation, obj in objects:
+        offsets[number] = (original_size + body.tell(), generation)
+        body.write(f"{number} {generation} obj\n".encode())
+        obj.write_to_stream(body, None)
+        body.write(b"\nendobj\n")
+
+    xref_offset = original_size + body.tell()
+    # The section starts with the head of the free list (object 0), as
+    # readers expect cross-reference tables to
+    body.write(b"xref\n")
+    for first, numbers in _subsections([0] + sorted(offsets)):
+        body.write(f"{first} {len(numbers)}\n".encode())
+        for number in numbers:
+            if number == 0:
+                body.write(b"0000000000 65535 f\r\n")
+                continue
+            offset, generation = offsets[number]
+            body.write(f"{offset:010d} {generation:05d} n\r\n".encode())
+
+    trailer = DictionaryObject({
+        NameObject('/Size'): NumberObject(copier.next_number),
+        NameObject('/Root'): root_ref,
+        NameObject('/Prev'): NumberObject(startxref)
+    })
+    for key in ('/Info', '/ID'):
+        if key in original.trailer:
+            trailer[NameObject(key)] = original.trailer.raw_get(key)
+    body.write(b"trailer\n")
+    trailer.write_to_stream(body, None)
+    body.write(f"\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+
+    with open(update_path, 'wb') as f:
+        f.write(body.getvalue())
+    return len(new_page_refs)
+
+def append_update(original_path, update_path):
+    """Append an update written by write_incremental_append to the original file
+
+    If the append fails, the original is truncated back to its old size.
+    """
+    original_size = os.path.getsize(original_path)
+    with open(original_path, 'ab') as original, open(update_path, 'rb') as update:
+        try:
+            while True:
+                chunk = update.read(1024 * 1024)
+                if not chunk:
+                    break
+                original.write(chunk)
+            original.flush()
+            os.fsync(original.fileno())
+        except BaseException:
+            original.truncate(original_size)
+            raise
+
+def _parse_startxref(tail):
+    position = tail.rfind(b'startxref')
+    if position < 0:
+        raise IncrementalAppendUnsupported("No startxref found at the end of the original PDF")
+    try:
+        return int(tail[position + len(b'startxref'):].split()[0])
+    except (IndexError, ValueError):
+        raise IncrementalAppendUnsupported("Invalid startxref in the original PDF")
+
+def _subsections(numbers):
+    """Group sorted object numbers into runs of consecutive numbers"""
+    runs = []
+    for number in numbers:
+        if runs and runs[-1][-1] == number - 1:
+            runs[-1].append(number)
+        else:
+            runs.append([number])
+    return [(run[0], run) for run in runs]
+
+class _ObjectCopier:
+    """Copies objects of the appended PDF into new object numbers of the original"""
+
+    def __init__(self, next_number, pages_ref):
+        self.next_number = next_number
+        self.pages_ref = pages_ref
+        self.numbers = {}  # (idnum, generation) in the appended PDF -> new number
+        self.objects = []  # (new number, copied object), in the order written
+        self.page_keys = set()
+
+    def reserve_page(self, reference):
+        self.page_keys.add((reference.idnum, reference.generation))
+        self._number_for(reference)
+
+    def copy_page(self, page, pages_root):
+        """Copy a page, pointing it at the original's page tree root"""
+        copied = DictionaryObject()
+        for key, value in page.items():
+            if key != '/Parent':
+                copied[NameObject(key)] = self._copy(value)
+        copied[NameObject('/Parent')] = self.pages_ref
+
+        # Don't let attributes the original's page tree passes down apply to the new page
+        if '/Rotate' in pages_root and '/Rotate' not in copied:
+            copied[NameObject('/Rotate')] = NumberObject(0)
+        if '/CropBox' in pages_root and '/CropBox' not in copied and '/MediaBox' in copied:
+            copied[NameObject('/CropBox')] = copied.raw_get('/MediaBox')
+        if '/Resources' in pages_root and '/Resources' not in copied:
+            copied[NameObject('/Resources')] = DictionaryObject()
+
+        reference = page.indirect_reference
+        number = self._number_for(reference)
+        self.objects.append((number, copied))
+        return IndirectObject(number, 0, None)
+
+    def _number_for(self, reference):
+        key = (reference.idnum, reference.generation)
+        if key not in self.numbers:
+            self.numbers[key] = self.next_number
+            self.next_number += 1
+        return self.numbers[key]
+
+    def _copy(self, value):
+        if isinstance(value, IndirectObject):
+            key = (value.idnum, value.generation)
+            if key in self.numbers:
+                return IndirectObject(self.numbers[key], 0, None)
+
+            target = value.get_object()
+            if isinstance(target, DictionaryObject) and target.get('/Type') in ('/Page', '/Pages'):
+                # Links to pages that are not appended (e.g. of the page tree) go nowhere
+                return NullObject()
+
+            number = self._number_for(value)
+            self.objects.append((number, self._copy(target)))
+            return IndirectObject(number, 0, None)
+
+        if isinstance(value, StreamObject):
+            copied = value.__class__()
+            copied._data = value._data
+            for key, item in value.items():
+                copied[NameObject(key)] = self._copy(item)
+            return copied
+        if isinstance(value, DictionaryObject):
+            copied = DictionaryObject()
+            for key, item in value.items():
+                copied[NameObject(key)] = self._copy(item)
+            return copied
+        if isinstance(value, ArrayObject):
+            return ArrayObject([self._copy(item) for item in value])
+        return value
@@ -0,0 +1,120 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from flask import current_app
+from app.utils.storage_backends import get_storage_backend
+
+# How long generated URLs are valid for (the most V4 signing allows), and
+# how long before expiry a cached URL is replaced by a new one
+SIGNED_URL_LIFETIME = 7 * 24 * 60 * 60
+SIGNED_URL_REFRESH_MARGIN = 24 * 60 * 60
+
+# Signed URLs each process keeps in memory in front of the shared cache
+MEMORY_CACHE_SIZE = 4096
+
+# Writes between purges of expired rows from the shared cache
+PURGE_EVERY = 256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS signed_urls (
+    bucket TEXT NOT NULL,
+    blob_name TEXT NOT NULL,
+    url TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (bucket, blob_name)
+) WITHOUT ROWID;
+"""
+
+_memory = OrderedDict()  # (bucket, blob_name) -> (url, expires)
+_memory_lock = threading.Lock()
+_local = threading.local()
+_writes = 0
+
+def get_signed_url(blob_name):
+    """Return a signed URL for reading a blob, signing only when needed
+
+    A URL is reused, from this process's memory or from the cache shared
+    by all workers (SIGNED_URL_CACHE_PATH), until it is within
+    SIGNED_URL_REFRESH_MARGIN of expiring. Only then is a new one signed.
+
+    Args:
+        blob_name (str): Name of the blob in the bucket
+
+    Returns:
+        str: The signed URL
+    """
+    key = (get_storage_backend().name, blob_name)
+    fresh_after = time.time() + SIGNED_URL_REFRESH_MARGIN
+
+    with _memory_lock:
+        cached = _memory.get(key)
+        if cached and cached[1] > fresh_after:
+            _memory.move_to_end(key)
+            return cached[0]
+
+    try:
+        row = _connect().execute(
+            "SELECT url, expires FROM signed_urls WHERE bucket = ? AND blob_name = ?", key).fetchone()
+    except sqlite3.Error as e:
+        print(f"Error reading signed URL cache: {str(e)}")
+        row = None
+
+    if row and row[1] > fresh_after:
+        url, expires = row
+    else:
+        from app.utils.gcs_utils import sign_blob_url
+        expires = time.time() + SIGNED_URL_LIFETIME
+        url = sign_blob_url(blob_name, datetime.utcfromtimestamp(expires))
+        _store(key, url, expires)
+
+    _remember(key, url, expires)
+    return url
+
+def invalidate_signed_url(blob_name):
+    """Forget the cached URL of a blob, e.g. because it was deleted"""
+    key = (get_storage_backend().name, blob_name)
+    with _memory_lock:
+        _memory.pop(key, None)
+    try:
+        _connect().execute("DELETE FROM signed_urls WHERE bucket = ? AND blob_name = ?", key)
+    except sqlite3.Error as e:
+        print(f"Error updating signed URL cache: {str(e)}")
+
+def _store(key, url, expires):
+    global _writes
+
+    try:
+        conn = _connect()
+        conn.execute("INSERT OR REPLACE INTO signed_urls (bucket, blob_name, url, expires) VALUES (?, ?, ?, ?)",
+                     key + (url, expires))
+        _writes += 1
+        if _writes % PURGE_EVERY == 0:
+            conn.execute("DELETE FROM signed_urls WHERE expires < ?", (time.time(),))
+    except sqlite3.Error as e:
+        # The URL is still good; other workers just sign their own
+        print(f"Error updating signed URL cache: {str(e)}")
+
+def _remember(key, url, expires):
+    with _memory_lock:
+        _memory[key] = (url, expires)
+        _memory.move_to_end(key)
+        while len(_memory) > MEMORY_CACHE_SIZE:
+            _memory.popitem(last=False)
+
+def _connect():
+    """Return this thread's connection to the shared cache, opening one in a forked worker as well"""
+    db_path = current_app.config['SIGNED_URL_CACHE_PATH']
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid() or _local.path != db_path:
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.path = db_path
+    return conn
@@ -0,0 +1,436 @@
+import os
+import json
+import sqlite3
+import argparse
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from app.utils.document_store import (DEFAULT_CACHE_SIZE, TEXT_PREVIEW_CHARS, DocumentStore, _is_valid_id,
+                                       _copy_document)
+
+# Page fields kept in their own columns or tables; the rest go in pages.meta
+PAGE_COLUMNS = ('page_number', 'text', 'summary', 'notes')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    file_id TEXT PRIMARY KEY,
+    meta TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS pages (
+    file_id TEXT NOT NULL,
+    page_number INTEGER NOT NULL,
+    text TEXT,
+    meta TEXT NOT NULL,
+    PRIMARY KEY (file_id, page_number)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS summaries (
+    file_id TEXT NOT NULL,
+    page_number INTEGER NOT NULL,
+    summary TEXT,
+    PRIMARY KEY (file_id, page_number)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS notes (
+    file_id TEXT NOT NULL,
+    page_number INTEGER NOT NULL,
+    notes TEXT,
+    PRIMARY KEY (file_id, page_number)
+) WITHOUT ROWID;
+"""
+
+# Tables keyed by (file_id, page_number), renumbered together
+PAGE_TABLES = ('pages', 'summaries', 'notes')
+
+class SqliteDocumentStore:
+    """Document store keeping documents, pages, summaries and notes as SQLite rows
+
+    Has the same interface as DocumentStore, but page-level edits only
+    touch the rows of the pages involved instead of rewriting the whole
+    document. The database runs in WAL mode so readers in other workers
+    are not blocked by a write. Each document has a version that every
+    write bumps; a cached document is reused while its version matches.
+    """
+
+    def __init__(self, db_path, cache_size=DEFAULT_CACHE_SIZE):
+        self.db_path = db_path
+        self.document_dir = os.path.dirname(db_path)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        os.makedirs(self.document_dir, exist_ok=True)
+        self._connect().executescript(SCHEMA)
+
+    def path_for(self, file_id):
+        """Return the database documents are saved to"""
+        return self.db_path
+
+    def locations(self, file_id):
+        """Describe where a document is looked for, for debugging"""
+        return [{'path': self.db_path, 'exists': self.exists(file_id)}]
+
+    def exists(self, file_id):
+        """Check whether a document is stored"""
+        row = self._connect().execute(
+            "SELECT 1 FROM documents WHERE file_id = ?", (file_id,)).fetchone()
+        return row is not None
+
+    def load(self, file_id, include_text=True):
+        """Load a document, from the cache when its version is unchanged
+
+        Args:
+            file_id (str): The ID of the document
+            include_text (bool): Read each page's text. Without it pages only
+                have a text_preview.
+
+        Returns:
+            dict: Document data the caller may modify, or None if not found
+        """
+        conn = self._connect()
+        row = conn.execute("SELECT version FROM documents WHERE file_id = ?", (file_id,)).fetchone()
+        if row is None:
+            return None
+
+        with self._lock:
+            cached = self._cache.get(file_id)
+            if cached and cached[0] == row[0]:
+                self._cache.move_to_end(file_id)
+                data = _copy_document(cached[1])
+                if not include_text:
+                    for page in data['pages']:
+                        text = page.pop('text')
+                        if text is not None:
+                            page['text_preview'] = text[:TEXT_PREVIEW_CHARS]
+                return data
+
+        # Read the document in one snapshot so a concurrent edit can't tear it
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute("SELECT meta, version FROM documents WHERE file_id = ?", (file_id,)).fetchone()
+            if row is None:
+                return None
+            data = json.loads(row[0])
+            version = row[1]
+            data['pages'] = self._load_pages(conn, file_id, include_text)
+        finally:
+            conn.execute("COMMIT")
+
+        if not include_text:
+            return data
+        self._remember(file_id, version, data)
+        return _copy_document(data)
+
+    def load_page_text(self, file_id, page_number):
+        """Return the text of one page, or None if the page is not found"""
+        row = self._connect().execute(
+            "SELECT text FROM pages WHERE file_id = ? AND page_number = ?", (file_id, page_number)).fetchone()
+        return row[0] if row else None
+
+    def save(self, file_id, data):
+        """Replace a document with the given data
+
+        Args:
+            file_id (str): The ID of the document
+            data (dict): Document data
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        if not _is_valid_id(file_id):
+            print(f"Refusing to save document with invalid ID: {file_id}")
+            return False
+
+        meta = {key: value for key, value in data.items() if key != 'pages'}
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT INTO documents (file_id, meta, version) VALUES (?, ?, 1) "
+                    "ON CONFLICT(file_id) DO UPDATE SET meta = excluded.meta, version = version + 1",
+                    (file_id, json.dumps(meta)))
+                for table in PAGE_TABLES:
+                    conn.execute(f"DELETE FROM {table} WHERE file_id = ?", (file_id,))
+                for page in data.get('pages', []):
+                    self._insert_page(conn, file_id, page['page_number'], page)
+        except Exception as e:
+            print(f"Error saving document {file_id}: {str(e)}")
+            return False
+        return True
+
+    def update_document(self, file_id, fields):
+        """Set document-level fields
+
+        Returns:
+            bool: True if successful, False if the document was not found or not saved
+        """
+        try:
+            with self._transaction() as conn:
+                row = conn.execute("SELECT meta FROM documents WHERE file_id = ?", (file_id,)).fetchone()
+                if row is None:
+                    return False
+                meta = json.loads(row[0])
+                meta.update(fields)
+                conn.execute("UPDATE documents SET meta = ?, version = version + 1 WHERE file_id = ?",
+                             (json.dumps(meta), file_id))
+        except Exception as e:
+            print(f"Error updating document {file_id}: {str(e)}")
+            return False
+        return True
+
+    def update_pages(self, file_id, updates):
+        """Set fields on individual pages
+
+        Args:
+            file_id (str): The ID of the document
+            updates (dict): Maps page numbers to dicts of fields to set
+
+        Returns:
+            bool: True if successful, False if the document was not found or not saved
+        """
+        try:
+            with self._transaction() as conn:
+                if not self._bump_version(conn, file_id):
+                    return False
+                for page_number, fields in updates.items():
+                    self._update_page(conn, file_id, page_number, fields)
+        except Exception as e:
+            print(f"Error updating pages of document {file_id}: {str(e)}")
+            return False
+        return True
+
+    def remove_page(self, file_id, page_number):
+        """Remove a page and renumber the pages after it
+
+        The page number is added to the document's removed_pages, so page
+        numbers recorded before the removal can be brought up to date.
+
+        Returns:
+            bool: True if successful, False if the document was not found or not saved
+        """
+        try:
+            with self._transaction() as conn:
+                row = conn.execute("SELECT meta FROM documents WHERE file_id = ?", (file_id,)).fetchone()
+                if row is None:
+                    return False
+                meta = json.loads(row[0])
+                meta['removed_pages'] = meta.get('removed_pages', []) + [page_number]
+                conn.execute("UPDATE documents SET meta = ?, version = version + 1 WHERE file_id = ?",
+                             (json.dumps(meta), file_id))
+                for table in PAGE_TABLES:
+                    conn.execute(f"DELETE FROM {table} WHERE file_id = ? AND page_number = ?",
+                                 (file_id, page_number))
+                    # Shift through negative numbers so no step collides with the primary key
+                    conn.execute(f"UPDATE {table} SET page_number = -(page_number - 1) "
+                                 f"WHERE file_id = ? AND page_number > ?", (file_id, page_number))
+                    conn.execute(f"UPDATE {table} SET page_number = -page_number "
+                                 f"WHERE file_id = ? AND page_number < 0", (file_id,))
+        except Exception as e:
+            print(f"Error removing page {page_number} of document {file_id}: {str(e)}")
+            return False
+        return True
+
+    def append_pages(self, file_id, pages, fields=None):
+        """Add pages after the last page of a document, creating it if needed
+
+        The pages are numbered from the document's current page count, and
+        their page_number is set in place.
+
+        Args:
+            file_id (str): The ID of the document
+            pages (list): Page dicts to add
+            fields (dict, optional): Document-level fields to set as well
+
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        if not _is_valid_id(file_id):
+            print(f"Refusing to save document with invalid ID: {file_id}")
+            return False
+
+        try:
+            with self._transaction() as conn:
+                row = conn.execute("SELECT meta FROM documents WHERE file_id = ?", (file_id,)).fetchone()
+                meta = json.loads(row[0]) if row else {}
+                meta.update(fields or {})
+                conn.execute(
+                    "INSERT INTO documents (file_id, meta, version) VALUES (?, ?, 1) "
+                    "ON CONFLICT(file_id) DO UPDATE SET meta = excluded.meta, version = version + 1",
+                    (file_id, json.dumps(meta)))
+
+                last = conn.execute("SELECT COALESCE(MAX(page_number), 0) FROM pages WHERE file_id = ?",
+                                    (file_id,)).fetchone()[0]
+                for offset, page in enumerate(pages, start=1):
+                    page['page_number'] = last + offset
+                    self._insert_page(conn, file_id, page['page_number'], page)
+        except Exception as e:
+            print(f"Error appending pages to document {file_id}: {str(e)}")
+            return False
+        return True
+
+    def delete(self, file_id):
+        """Remove a document and its pages"""
+        with self._lock:
+            self._cache.pop(file_id, None)
+
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM documents WHERE file_id = ?", (file_id,))
+            for table in PAGE_TABLES:
+                conn.execute(f"DELETE FROM {table} WHERE file_id = ?", (file_id,))
+
+    def _connect(self):
+        """Return this thread's connection, opening one in a forked worker as well"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Run statements in a write transaction, rolling back on error"""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _bump_version(self, conn, file_id):
+        cursor = conn.execute("UPDATE documents SET version = version + 1 WHERE file_id = ?", (file_id,))
+        return cursor.rowcount > 0
+
+    def _load_pages(self, conn, file_id, include_text=True):
+        summaries = dict(conn.execute(
+            "SELECT page_number, summary FROM summaries WHERE file_id = ?", (file_id,)))
+        notes = dict(conn.execute(
+            "SELECT page_number, notes FROM notes WHERE file_id = ?", (file_id,)))
+
+        text_column = "text" if include_text else f"substr(text, 1, {TEXT_PREVIEW_CHARS})"
+        pages = []
+        for page_number, text, meta in conn.execute(
+                f"SELECT page_number, {text_column}, meta FROM pages WHERE file_id = ? ORDER BY page_number",
+                (file_id,)):
+            if include_text:
+                page = {'page_number': page_number, 'text': text}
+            else:
+                page = {'page_number': page_number}
+                if text is not None:
+                    page['text_preview'] = text
+            page.update(json.loads(meta))
+            if page_number in summaries:
+                page['summary'] = summaries[page_number]
+            if page_number in notes:
+                page['notes'] = notes[page_number]
+            pages.append(page)
+        return pages
+
+    def _insert_page(self, conn, file_id, page_number, page):
+        meta = {key: value for key, value in page.items() if key not in PAGE_COLUMNS}
+        conn.execute("INSERT INTO pages (file_id, page_number, text, meta) VALUES (?, ?, ?, ?)",
+                     (file_id, page_number, page.get('text'), json.dumps(meta)))
+        if 'summary' in page:
+            conn.execute("INSERT INTO summaries (file_id, page_number, summary) VALUES (?, ?, ?)",
+                         (file_id, page_number, page['summary']))
+        if 'notes' in page:
+            conn.execute("INSERT INTO notes (file_id, page_number, notes) VALUES (?, ?, ?)",
+                         (file_id, page_number, page['notes']))
+
+    def _update_page(self, conn, file_id, page_number, fields):
+        row = conn.execute("SELECT 1 FROM pages WHERE file_id = ? AND page_number = ?",
+                           (file_id, page_number)).fetchone()
+        if row is None:
+            return
+
+        if 'text' in fields:
+            conn.execute("UPDATE pages SET text = ? WHERE file_id = ? AND page_number = ?",
+                         (fields['text'], file_id, page_number))
+        if 'summary' in fields:
+            conn.execute("INSERT OR REPLACE INTO summaries (file_id, page_number, summary) VALUES (?, ?, ?)",
+                         (file_id, page_number, fields['summary']))
+        if 'notes' in fields:
+            conn.execute("INSERT OR REPLACE INTO notes (file_id, page_number, notes) VALUES (?, ?, ?)",
+                         (file_id, page_number, fields['notes']))
+
+        other = {key: value for key, value in fields.items() if key not in PAGE_COLUMNS}
+        if other:
+            row = conn.execute("SELECT meta FROM pages WHERE file_id = ? AND page_number = ?",
+                               (file_id, page_number)).fetchone()
+            meta = json.loads(row[0])
+            meta.update(other)
+            conn.execute("UPDATE pages SET meta = ? WHERE file_id = ? AND page_number = ?",
+                         (json.dumps(meta), file_id, page_number))
+
+    def _remember(self, file_id, version, data):
+        with self._lock:
+            self._cache[file_id] = (version, data)
+            self._cache.move_to_end(file_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+def migrate_json_documents(json_dir, store, overwrite=False):
+    """Import processed document JSON files into a SQLite store
+
+    The documents are read through a DocumentStore on json_dir, so page
+    text kept in its text shards is imported along with the pages.
+
+    Args:
+        json_dir (str): Directory holding <file_id>.json documents
+        store (SqliteDocumentStore): Store to import into
+        overwrite (bool): Replace documents that are already in the store
+
+    Returns:
+        tuple: Number of documents imported, skipped and failed
+    """
+    imported = skipped = failed = 0
+    json_store = DocumentStore(json_dir, cache_size=0)
+
+    for filename in sorted(os.listdir(json_dir)):
+        if not filename.endswith('.json'):
+            continue
+        file_id = filename[:-5]
+
+        if not overwrite and store.exists(file_id):
+            skipped += 1
+            continue
+
+        try:
+            data = json_store.load(file_id)
+        except Exception as e:
+            print(f"Skipping {filename}: {str(e)}")
+            failed += 1
+            continue
+        if data is None:
+            print(f"Skipping {filename}: not a readable document")
+            failed += 1
+            continue
+
+        # Only processed documents; other JSON files (e.g. job records) have no pages
+        if not isinstance(data, dict) or not isinstance(data.get('pages'), list):
+            skipped += 1
+            continue
+
+        if store.save(file_id, data):
+            imported += 1
+        else:
+            failed += 1
+
+    return imported, skipped, failed
+
+if __name__ == '__main__':
+    default_dir = os.path.join(tempfile.gettempdir(), 'studyflow')
+
+    parser = argparse.ArgumentParser(description="Import processed document JSON files into the SQLite document store")
+    parser.add_argument('--json-dir', default=default_dir, help="Directory with <file_id>.json documents")
+    parser.add_argument('--db', default=os.path.join(default_dir, 'documents.sqlite3'), help="SQLite database to import into")
+    parser.add_argument('--overwrite', action='store_true', help="Replace documents already in the database")
+    args = parser.parse_args()
+
+    imported, skipped, failed = migrate_json_documents(args.json_dir, SqliteDocumentStore(args.db), args.overwrite)
+    print(f"Imported {imported} documents into {args.db} ({skipped} skipped, {failed} failed)")
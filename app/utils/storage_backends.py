@@ -0,0 +1,278 @@
+import os
+import hmac
+import uuid
+import shutil
+import hashlib
+import tempfile
+import threading
+from datetime import datetime, timezone
+from urllib.parse import quote
+from flask import current_app, has_app_context
+
+# Bytes copied at a time by the local backend
+COPY_CHUNK_SIZE = 1024 * 1024
+
+_backend = None
+_backend_config = None
+_backend_lock = threading.Lock()
+
+class StorageBackend:
+    """Where uploaded files are kept, addressed by blob name
+
+    Blob names look the same in every backend, e.g.
+    uploads/<original name>_<file id>.<extension>. The `name` attribute
+    identifies the bucket or directory, for keys of caches that must not
+    mix backends.
+    """
+    name = None
+
+    def upload(self, file_obj, blob_name, content_type=None):
+        """Store the contents of a file object
+
+        Returns:
+            dict: The blob's name, size and created time
+        """
+        raise NotImplementedError
+
+    def append(self, blob_name, file_obj, expected_size):
+        """Add the contents of a file object to the end of a blob
+
+        Only the new bytes are sent. The blob is left alone unless it is
+        expected_size bytes long, i.e. holds what the caller appended to.
+
+        Returns:
+            dict: The blob's name, size and created time, or None if the blob
+                is missing, has another size or can't be appended to; it then
+                has to be uploaded in full
+        """
+        raise NotImplementedError
+
+    def download(self, blob_name, file_obj, start=None, end=None):
+        """Write a blob, or the byte range start..end (inclusive), to a file object"""
+        raise NotImplementedError
+
+    def read(self, blob_name):
+        """Return the contents of a blob as bytes"""
+        raise NotImplementedError
+
+    def delete(self, blob_name):
+        """Remove a blob"""
+        raise NotImplementedError
+
+    def list(self, prefix=''):
+        """Yield the name, size and created time of each blob under a prefix"""
+        raise NotImplementedError
+
+    def sign_url(self, blob_name, expiration):
+        """Return a URL that can read a blob until expiration (UTC datetime)"""
+        raise NotImplementedError
+
+class GCSBackend(StorageBackend):
+    """Blobs in a Google Cloud Storage bucket, through the shared client"""
+
+    # Only the blob fields list() returns are requested
+    LIST_FIELDS = 'items(name,size,timeCreated),nextPageToken'
+
+    def __init__(self, bucket_name):
+        self.bucket_name = bucket_name
+        self.name = f"gs://{bucket_name}"
+
+    def _blob(self, blob_name):
+        from app.utils.gcs_utils import get_gcs_bucket
+        return get_gcs_bucket(self.bucket_name).blob(blob_name)
+
+    def upload(self, file_obj, blob_name, content_type=None):
+        blob = self._blob(blob_name)
+        blob.upload_from_file(file_obj, content_type=content_type)
+        return {'name': blob_name, 'size': blob.size, 'created': blob.time_created}
+
+    def append(self, blob_name, file_obj, expected_size):
+        from google.api_core.exceptions import BadRequest, NotFound, PreconditionFailed
+        from app.utils.gcs_utils import get_gcs_bucket
+
+        bucket = get_gcs_bucket(self.bucket_name)
+        blob = bucket.get_blob(blob_name)
+        if blob is None or blob.size != expected_size:
+            return None
+
+        # Upload the new bytes as their own object, outside uploads/, and
+        # have the server concatenate the two in place of the blob
+        part = bucket.blob(f"appends/{blob_name}.{uuid.uuid4().hex}")
+        part.upload_from_file(file_obj, content_type=blob.content_type)
+        try:
+            # Fails if the blob changed meanwhile, or after 1024 appends,
+            # the most components a composite object can have
+            blob.compose([blob, part], if_generation_match=blob.generation)
+        except (BadRequest, NotFound, PreconditionFailed) as e:
+            print(f"Could not append to {blob_name}: {str(e)}")
+            return None
+        finally:
+            try:
+                part.delete()
+            except Exception as e:
+                print(f"Error deleting appended part of {blob_name}: {str(e)}")
+        return {'name': blob_name, 'size': blob.size, 'created': blob.time_created}
+
+    def download(self, blob_name, file_obj, start=None, end=None):
+        self._blob(blob_name).download_to_file(file_obj, start=start, end=end)
+
+    def read(self, blob_name):
+        return self._blob(blob_name).download_as_bytes()
+
+    def delete(self, blob_name):
+        self._blob(blob_name).delete()
+
+    def list(self, prefix=''):
+        from app.utils.gcs_utils import get_gcs_bucket
+        for blob in get_gcs_bucket(self.bucket_name).list_blobs(prefix=prefix, fields=self.LIST_FIELDS):
+            yield {'name': blob.name, 'size': blob.size, 'created': blob.time_created}
+
+    def sign_url(self, blob_name, expiration):
+        return self._blob(blob_name).generate_signed_url(version="v4", expiration=expiration, method="GET")
+
+class LocalBackend(StorageBackend):
+    """Blobs as files under a local directory, standing in for a bucket
+
+    Lets the app, and benchmarks of uploads, downloads and listings, run
+    without cloud credentials. Signed URLs point at /api/storage/<blob name>
+    and carry an expiry and an HMAC-SHA256 signature made with the app's
+    secret key, which the route serving them checks.
+    """
+
+    def __init__(self, root_dir, secret_key, url_prefix='/api/storage'):
+        self.root_dir = os.path.abspath(root_dir)
+        self.name = f"file://{self.root_dir}"
+        self.url_prefix = url_prefix
+        self._secret_key = secret_key.encode() if isinstance(secret_key, str) else secret_key
+
+    def path_for(self, blob_name):
+        """Return the file a blob is kept in
+
+        Raises:
+            ValueError: If the name points outside the storage directory
+        """
+        path = os.path.normpath(os.path.join(self.root_dir, blob_name))
+        if not path.startswith(self.root_dir + os.sep):
+            raise ValueError(f"Invalid blob name: {blob_name}")
+        return path
+
+    def upload(self, file_obj, blob_name, content_type=None):
+        path = self.path_for(blob_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                shutil.copyfileobj(file_obj, f, COPY_CHUNK_SIZE)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+        stat = os.stat(path)
+        return {'name': blob_name, 'size': stat.st_size,
+                'created': datetime.fromtimestamp(stat.st_mtime, timezone.utc)}
+
+    def append(self, blob_name, file_obj, expected_size):
+        path = self.path_for(blob_name)
+        try:
+            with open(path, 'r+b') as f:
+                if f.seek(0, os.SEEK_END) != expected_size:
+                    return None
+                shutil.copyfileobj(file_obj, f, COPY_CHUNK_SIZE)
+        except FileNotFoundError:
+            return None
+
+        stat = os.stat(path)
+        return {'name': blob_name, 'size': stat.st_size,
+                'created': datetime.fromtimestamp(stat.st_mtime, timezone.utc)}
+
+    def download(self, blob_name, file_obj, start=None, end=None):
+        with open(self.path_for(blob_name), 'rb') as f:
+            if start:
+                f.seek(start)
+            remaining = None if end is None else end - (start or 0) + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(COPY_CHUNK_SIZE if remaining is None else min(COPY_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                file_obj.write(chunk)
+                if remaining is not None:
+                    remaining -= len(chunk)
+
+    def read(self, blob_name):
+        with open(self.path_for(blob_name), 'rb') as f:
+            return f.read()
+
+    def delete(self, blob_name):
+        os.remove(self.path_for(blob_name))
+
+    def list(self, prefix=''):
+        for root, _, filenames in os.walk(self.root_dir):
+            for filename in sorted(filenames):
+                if filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, filename)
+                blob_name = os.path.relpath(path, self.root_dir).replace(os.sep, '/')
+                if not blob_name.startswith(prefix):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield {'name': blob_name, 'size': stat.st_size,
+                       'created': datetime.fromtimestamp(stat.st_mtime, timezone.utc)}
+
+    def sign_url(self, blob_name, expiration):
+        expires = int(expiration.replace(tzinfo=timezone.utc).timestamp())
+        return (f"{self.url_prefix}/{quote(blob_name)}"
+                f"?expires={expires}&signature={self._signature(blob_name, expires)}")
+
+    def verify_url(self, blob_name, expires, signature):
+        """Check the expiry and signature of a URL made by sign_url"""
+        try:
+            expires = int(expires)
+        except (TypeError, ValueError):
+            return False
+        if expires < datetime.now(timezone.utc).timestamp():
+            return False
+        return hmac.compare_digest(self._signature(blob_name, expires), signature or '')
+
+    def _signature(self, blob_name, expires):
+        message = f"{blob_name}\n{expires}".encode()
+        return hmac.new(self._secret_key, message, hashlib.sha256).hexdigest()
+
+def get_storage_backend():
+    """Return the process-wide storage backend for the current app config
+
+    STORAGE_BACKEND selects Google Cloud Storage ('gcs', the default when
+    GOOGLE_CLOUD_BUCKET is set) or a local directory ('local',
+    LOCAL_STORAGE_DIR).
+    """
+    global _backend, _backend_config
+
+    if has_app_context():
+        config = current_app.config
+        bucket_name = config.get('GOOGLE_CLOUD_BUCKET')
+        backend = config.get('STORAGE_BACKEND') or ('gcs' if bucket_name else 'local')
+        local_dir = config.get('LOCAL_STORAGE_DIR') or os.path.join(tempfile.gettempdir(), 'studyflow-storage')
+        secret_key = config.get('SECRET_KEY') or ''
+    else:
+        bucket_name = None
+        backend = 'local'
+        local_dir = os.path.join(tempfile.gettempdir(), 'studyflow-storage')
+        secret_key = ''
+
+    backend_config = (backend, bucket_name, local_dir, secret_key)
+    with _backend_lock:
+        if _backend is None or _backend_config != backend_config:
+            if backend == 'local':
+                _backend = LocalBackend(local_dir, secret_key)
+            elif backend == 'gcs':
+                _backend = GCSBackend(bucket_name)
+            else:
+                raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+            _backend_config = backend_config
+        return _backend
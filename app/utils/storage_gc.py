@@ -0,0 +1,282 @@
+import os
+import json
+import time
+import threading
+import traceback
+
+try:
+    import fcntl
+except ImportError:  # Windows: only one collector per process is ruled out
+    fcntl = None
+
+from flask import current_app
+from app.utils.document_locks import document_lock, get_lock_dir
+from app.utils.document_store import get_document_store
+from app.utils.upload_queue import has_pending_upload, pending_upload_paths
+from app.utils.local_files import forget_local_file
+
+# Scratch files (temp copies, merge sources, unfinished writes) older than
+# this are never in use any more
+SCRATCH_GRACE = 60 * 60
+
+_app = None
+_interval = 0
+_collector_pid = None
+_collector_lock = threading.Lock()
+_run_lock = threading.Lock()
+_last_report = None
+
+def init_storage_gc(app):
+    """Set up the background storage collector
+
+    The collector starts with the first request of each worker process and
+    runs every STORAGE_GC_INTERVAL seconds (0 disables it).
+
+    Args:
+        app (Flask): The application the collector runs under
+    """
+    global _app, _interval
+
+    _app = app
+    _interval = app.config['STORAGE_GC_INTERVAL']
+    if _interval > 0:
+        app.before_request(_ensure_collector)
+
+def get_last_report():
+    """Return the report of the last collection in this process, or None"""
+    return _last_report
+
+def collect_garbage():
+    """Remove local files that are no longer needed, within the disk budget
+
+    Runs under an app context. In order:
+      1. scratch files: temp_* copies, *_original.* merge sources and
+         unfinished *.tmp writes older than an hour
+      2. finished ingestion jobs and abandoned upload sessions older than STORAGE_TTL
+      3. text shards no stored document points to
+      4. uploads that belong to no document or job, older than STORAGE_TTL
+      5. local copies of documents that are also in Google Cloud Storage:
+         those unused for STORAGE_TTL, then the least recently used ones
+         while UPLOAD_FOLDER and DOCUMENT_DIR hold more than STORAGE_MAX_BYTES
+
+    Document data, notes and copies that only exist locally or are still
+    queued for upload are never removed.
+    Only one worker collects at a time; the others skip their turn.
+
+    Returns:
+        dict: What was removed and how much space it freed, or None if
+            another worker is collecting
+    """
+    global _last_report
+
+    lock = _try_lock()
+    if lock is None:
+        return None
+
+    try:
+        started = time.time()
+        ttl = current_app.config['STORAGE_TTL']
+        max_bytes = current_app.config['STORAGE_MAX_BYTES']
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+        document_dir = current_app.config['DOCUMENT_DIR']
+        store = get_document_store()
+
+        report = {
+            'started': started,
+            'bytes_before': _tree_size(upload_folder) + _tree_size(document_dir),
+            'reclaimed_bytes': 0,
+            'files_removed': 0,
+            'removed': {}
+        }
+
+        def remove(path, category):
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                return 0
+            counts = report['removed'].setdefault(category, {'files': 0, 'bytes': 0})
+            counts['files'] += 1
+            counts['bytes'] += size
+            report['files_removed'] += 1
+            report['reclaimed_bytes'] += size
+            return size
+
+        # 1. Scratch files
+        scratch = [entry for entry in _scan(document_dir)
+                   if entry.name.startswith('temp_') or entry.name.endswith('.tmp')]
+        scratch += [entry for entry in _scan_uploads(upload_folder)
+                    if '_original.' in entry.name or entry.name.endswith('.tmp')]
+        for entry in scratch:
+            if started - entry.stat().st_mtime > SCRATCH_GRACE:
+                remove(entry.path, 'scratch')
+
+        # 2. Finished jobs and abandoned upload sessions
+        active_files = pending_upload_paths()
+        journal_dir = current_app.config['INGEST_JOURNAL_DIR']
+        for entry in _scan(journal_dir):
+            if not entry.name.endswith('.json'):
+                continue
+            job = _read_json(entry.path)
+            if not job:
+                continue
+            if job.get('status') not in ('completed', 'failed'):
+                active_files.add(os.path.abspath(job.get('file_path', '')))
+            elif started - job.get('updated', entry.stat().st_mtime) > ttl:
+                job_id = entry.name[:-len('.json')]
+                for suffix in ('.json', '.result', '.lock'):
+                    remove(os.path.join(journal_dir, f"{job_id}{suffix}"), 'jobs')
+
+        session_dir = current_app.config['UPLOAD_SESSION_DIR']
+        for entry in _scan(session_dir):
+            if entry.name.endswith('.part') and started - entry.stat().st_mtime > ttl:
+                upload_id = entry.name[:-len('.part')]
+                remove(entry.path, 'upload_sessions')
+                remove(os.path.join(session_dir, f"{upload_id}.json"), 'upload_sessions')
+
+        # 3. Text shards no document points to
+        if hasattr(store, 'text_refs'):
+            referenced = store.text_refs()
+            for shard_dir in _scan(store.text_dir, files=False):
+                for entry in _scan(shard_dir.path):
+                    ref = entry.name.split('.', 1)[0]
+                    if ref not in referenced and started - entry.stat().st_mtime > SCRATCH_GRACE:
+                        remove(entry.path, 'text_shards')
+
+        # 4 and 5. Uploads: orphans, then cold copies of documents in the cloud
+        cold_copies = []
+        for entry in _scan_uploads(upload_folder):
+            if entry.name.endswith('.tmp'):
+                continue
+            path = os.path.abspath(entry.path)
+            if path in active_files:
+                continue
+            stat = entry.stat()
+            last_used = max(stat.st_atime, stat.st_mtime)
+            file_id = entry.name.split('.', 1)[0]
+
+            document = store.load(file_id, include_text=False)
+            if document is None:
+                if started - stat.st_mtime > ttl:
+                    remove(entry.path, 'orphaned_uploads')
+            elif _is_evictable(file_id, document, path):
+                cold_copies.append((last_used, entry.path, file_id))
+
+        cold_copies.sort()
+        total = report['bytes_before'] - report['reclaimed_bytes']
+        for last_used, path, file_id in cold_copies:
+            expired = started - last_used > ttl
+            if not expired and (not max_bytes or total <= max_bytes):
+                break
+            with document_lock(file_id):
+                # Skip a copy that became the source of a lazy document meanwhile
+                document = store.load(file_id, include_text=False)
+                if document is None or not _is_evictable(file_id, document, os.path.abspath(path)):
+                    continue
+                total -= remove(path, 'expired_copies' if expired else 'evicted_copies')
+                forget_local_file(file_id)
+
+        report['bytes_after'] = _tree_size(upload_folder) + _tree_size(document_dir)
+        report['max_bytes'] = max_bytes
+        report['over_budget'] = bool(max_bytes) and report['bytes_after'] > max_bytes
+        report['duration'] = round(time.time() - started, 3)
+
+        print(f"Storage GC reclaimed {report['reclaimed_bytes'] / (1024 * 1024):.1f} MB "
+              f"in {report['files_removed']} files ({report['removed']}), "
+              f"{report['bytes_after'] / (1024 * 1024):.1f} MB in use")
+        if report['over_budget']:
+            print(f"Warning: local storage is over its budget of {max_bytes} bytes "
+                  f"and nothing else can be evicted")
+
+        _last_report = report
+        return report
+    finally:
+        _unlock(lock)
+
+def _is_evictable(file_id, document, path):
+    """A local copy can go when the cloud has the file and extraction no longer reads it"""
+    if not str(document.get('file_url') or '').startswith(('http', '/api/storage/')):
+        return False
+    if has_pending_upload(file_id):
+        return False
+    if document.get('lazy') and os.path.abspath(document.get('source_path', '')) == path:
+        return False
+    return True
+
+def _scan(directory, files=True):
+    """Return the regular files (or the subdirectories) of a directory, if it exists
+
+    Dotfiles such as .gitkeep are left out.
+    """
+    try:
+        with os.scandir(directory) as entries:
+            return [entry for entry in entries if not entry.name.startswith('.') and
+                    (entry.is_file(follow_symlinks=False) if files else entry.is_dir(follow_symlinks=False))]
+    except FileNotFoundError:
+        return []
+
+def _scan_uploads(upload_folder):
+    """Return the files in UPLOAD_FOLDER and in its per-ID-prefix subdirectories"""
+    entries = _scan(upload_folder)
+    for shard_dir in _scan(upload_folder, files=False):
+        entries += _scan(shard_dir.path)
+    return entries
+
+def _tree_size(directory):
+    total = 0
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                pass
+    return total
+
+def _read_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def _try_lock():
+    """Take the collector lock without waiting, or return None if it is held"""
+    if fcntl is None:
+        return _run_lock if _run_lock.acquire(blocking=False) else None
+
+    lock_file = open(os.path.join(get_lock_dir(), 'storage_gc.lock'), 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+def _unlock(lock):
+    if fcntl is None:
+        lock.release()
+        return
+
+    fcntl.flock(lock, fcntl.LOCK_UN)
+    lock.close()
+
+def _ensure_collector():
+    """Start the collector thread in this process (again after a fork)"""
+    global _collector_pid
+
+    with _collector_lock:
+        if _collector_pid == os.getpid():
+            return
+        _collector_pid = os.getpid()
+
+    threading.Thread(target=_collect_loop, name='storage-gc', daemon=True).start()
+
+def _collect_loop():
+    while True:
+        time.sleep(_interval)
+        try:
+            with _app.app_context():
+                collect_garbage()
+        except Exception as e:
+            print(f"Error collecting storage: {str(e)}")
+            print(traceback.format_exc())
@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+
+from app.utils.ingestion_jobs import get_job
+from app.utils.document_store import get_document_store
+
+# Size of the chunks read from the upload stream while hashing
+CHUNK_SIZE = 64 * 1024
+
+def get_index_dir():
+    """Return the directory holding the content-hash index entries"""
+    index_dir = os.path.join(tempfile.gettempdir(), 'studyflow', 'content_index')
+    os.makedirs(index_dir, exist_ok=True)
+    return index_dir
+
+def save_upload_hashed(file_obj, dest_path):
+    """Stream an upload to disk, hashing it as it is written
+
+    Args:
+        file_obj: Uploaded file (werkzeug FileStorage or any readable binary stream)
+        dest_path (str): Where to write the file
+
+    Returns:
+        str: Hex SHA-256 digest of the file contents
+    """
+    stream = getattr(file_obj, 'stream', file_obj)
+    digest = hashlib.sha256()
+
+    with open(dest_path, 'wb') as f:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+
+    return digest.hexdigest()
+
+def find_duplicate(content_hash):
+    """Look up an already ingested upload with the same contents
+
+    An entry only counts if its document was processed, or is still being
+    processed; entries whose ingestion failed are ignored.
+
+    Args:
+        content_hash (str): Hex SHA-256 digest of the upload
+
+    Returns:
+        dict: Index entry with 'file_id', 'job_id' and 'filename', or None
+    """
+    entry_path = os.path.join(get_index_dir(), f"{content_hash}.json")
+
+    try:
+        with open(entry_path, 'r') as f:
+            entry = json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error reading content index entry {content_hash}: {str(e)}")
+        return None
+
+    if get_document_store().exists(entry['file_id']):
+        return entry
+
+    job = get_job(entry.get('job_id')) if entry.get('job_id') else None
+    if job and job['status'] in ('queued', 'running'):
+        return entry
+
+    print(f"Content index entry {content_hash} is stale, ignoring it")
+    return None
+
+def register_content(content_hash, file_id, job_id=None, filename=None):
+    """Record which document holds the given contents
+
+    Args:
+        content_hash (str): Hex SHA-256 digest of the upload
+        file_id (str): ID of the document created from it
+        job_id (str, optional): Ingestion job processing the document
+        filename (str, optional): Original filename of the upload
+    """
+    entry_path = os.path.join(get_index_dir(), f"{content_hash}.json")
+    temp_path = f"{entry_path}.{os.getpid()}.tmp"
+
+    with open(temp_path, 'w') as f:
+        json.dump({
+            'file_id': file_id,
+            'job_id': job_id,
+            'filename': filename,
+            'created': time.time()
+        }, f)
+    os.replace(temp_path, entry_path)
+
+    # Reverse reference so the entry can be dropped when the document is edited
+    with open(os.path.join(get_index_dir(), f"{file_id}.ref"), 'w') as f:
+        f.write(content_hash)
+
+def forget_document(file_id):
+    """Drop the index entry for a document whose pages were edited
+
+    Once pages are added or removed the document no longer matches the
+    uploaded contents, so new uploads must not be aliased to it.
+
+    Args:
+        file_id (str): ID of the edited document
+    """
+    index_dir = get_index_dir()
+    ref_path = os.path.join(index_dir, f"{file_id}.ref")
+
+    try:
+        with open(ref_path, 'r') as f:
+            content_hash = f.read().strip()
+    except FileNotFoundError:
+        return
+
+    for path in (os.path.join(index_dir, f"{content_hash}.json"), ref_path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    print(f"Removed content index entry for edited document {file_id}")
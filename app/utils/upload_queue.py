@@ -0,0 +1,380 @@
+import os
+import json
+import time
+import uuid
+import threading
+import traceback
+
+try:
+    import fcntl
+except ImportError:  # Windows: uploads are only recovered by the process that queued them
+    fcntl = None
+
+from app.utils.document_locks import document_lock
+from app.utils.document_store import get_document_store
+
+# Longest a worker waits before looking for due uploads again, e.g. ones
+# queued by another process or left behind by a dead one
+POLL_INTERVAL = 5.0
+
+# Longest wait between attempts of a failing upload, and the wait between
+# attempts of a failed one
+MAX_RETRY_DELAY = 300.0
+
+_app = None
+_queue_dir = None
+_workers = 4
+_max_attempts = 8
+_retry_delay = 5.0
+_worker_pid = None
+_worker_lock = threading.Lock()
+_wake = threading.Condition()
+_claimed = set()  # file IDs being uploaded by this process, without fcntl
+
+def init_upload_queue(app):
+    """Set up the background uploader
+
+    Uploads queued with enqueue_upload are written to UPLOAD_QUEUE_DIR and
+    sent to the storage backend by GCS_UPLOAD_WORKERS threads per process,
+    which start with the first request (or upload) of each worker process.
+    Uploads left queued by a restart are picked up then.
+
+    Args:
+        app (Flask): The application the uploads run under
+    """
+    global _app, _queue_dir, _workers, _max_attempts, _retry_delay
+
+    _app = app
+    _queue_dir = app.config['UPLOAD_QUEUE_DIR']
+    _workers = app.config['GCS_UPLOAD_WORKERS']
+    _max_attempts = app.config['GCS_UPLOAD_MAX_ATTEMPTS']
+    _retry_delay = app.config['GCS_UPLOAD_RETRY_DELAY']
+    os.makedirs(_queue_dir, exist_ok=True)
+    app.before_request(_ensure_workers)
+
+def enqueue_upload(file_id, file_path, file_extension, original_filename=None):
+    """Queue a local file to be uploaded as the file of a document
+
+    Returns as soon as the upload is recorded on disk. A later upload of
+    the same document replaces one that has not started yet, and one that
+    is running is followed by the newer one. Once the newest upload is
+    done, the document's file_url and download_url point at the stored
+    file. Until then the local file must stay where it is. An upload is
+    never given up on: after GCS_UPLOAD_MAX_ATTEMPTS it is marked failed
+    and tried again every MAX_RETRY_DELAY seconds.
+
+    Args:
+        file_id (str): ID of the document
+        file_path (str): Path of the local file to upload
+        file_extension (str): File extension (e.g., 'pdf', 'jpg')
+        original_filename (str, optional): Original filename used as prefix
+    """
+    _queue(file_id, file_path, file_extension, original_filename)
+    print(f"Queued upload of {file_path} for file {file_id}")
+
+def enqueue_append(file_id, update_path, base_size, file_path, file_extension, original_filename=None):
+    """Queue bytes appended to a local file to be appended to its stored copy
+
+    Only the appended bytes are sent, provided the stored copy is the
+    base_size bytes they were appended to. Otherwise, or if the document
+    has an upload that has not finished, the whole file is uploaded as by
+    enqueue_upload. The queue takes over the file of appended bytes.
+
+    Args:
+        file_id (str): ID of the document
+        update_path (str): File holding the appended bytes
+        base_size (int): Size of the local file before the bytes were appended
+        file_path (str): Path of the local file
+        file_extension (str): File extension (e.g., 'pdf', 'jpg')
+        original_filename (str, optional): Original filename used as prefix
+    """
+    if has_pending_upload(file_id):
+        os.remove(update_path)
+        enqueue_upload(file_id, file_path, file_extension, original_filename)
+        return
+
+    _queue(file_id, file_path, file_extension, original_filename, update_path, base_size)
+    print(f"Queued append of {os.path.getsize(file_path) - base_size} bytes to {file_path} for file {file_id}")
+
+def _queue(file_id, file_path, file_extension, original_filename, update_path=None, base_size=None):
+    """Write the upload entry of a document, replacing an earlier one"""
+    now = time.time()
+    version = str(uuid.uuid4())
+    entry = {
+        'file_id': file_id,
+        'version': version,
+        'file_path': os.path.abspath(file_path),
+        'file_extension': file_extension,
+        'original_filename': original_filename,
+        'update_path': None,
+        'base_size': base_size,
+        'status': 'queued',
+        'attempts': 0,
+        'next_attempt': now,
+        'error': None,
+        'queued': now
+    }
+    if update_path:
+        entry['update_path'] = os.path.join(_queue_dir, f"{file_id}.{version}.update")
+        os.replace(update_path, entry['update_path'])
+
+    replaced = _read_entry(file_id)
+    _write_entry(entry)
+    if replaced:
+        _remove_update(replaced)
+
+    _ensure_workers()
+    with _wake:
+        _wake.notify()
+
+def has_pending_upload(file_id):
+    """Check whether a document has an upload that has not finished, including a failed one"""
+    return os.path.exists(_entry_path(file_id))
+
+def pending_upload_paths():
+    """Return the local files that queued or failed uploads still need"""
+    return {entry['file_path'] for entry in _iter_entries()}
+
+def cancel_upload(file_id):
+    """Drop the queued upload of a document, e.g. because it was deleted"""
+    entry = _read_entry(file_id)
+    try:
+        os.remove(_entry_path(file_id))
+    except FileNotFoundError:
+        pass
+    if entry:
+        _remove_update(entry)
+
+def get_upload_status():
+    """Return the counts of queued and failed uploads, and the failed ones with their next attempt"""
+    entries = list(_iter_entries())
+    return {
+        'queued': sum(1 for entry in entries if entry['status'] == 'queued'),
+        'failed': [{key: entry[key] for key in ('file_id', 'attempts', 'error', 'next_attempt')}
+                   for entry in entries if entry['status'] == 'failed']
+    }
+
+def _run_upload(entry):
+    """Upload one queued file and record the outcome"""
+    from app.utils.gcs_utils import upload_file_to_gcs
+
+    file_id = entry['file_id']
+    try:
+        file_url = _append(entry) if entry.get('update_path') else None
+        if file_url is None:
+            with open(entry['file_path'], 'rb') as file_obj:
+                file_url = upload_file_to_gcs(file_obj, file_id, entry['file_extension'],
+                                              original_filename=entry['original_filename'])
+    except FileNotFoundError:
+        # The document was deleted or replaced meanwhile; there is nothing to upload
+        print(f"Dropping upload for file {file_id}: {entry['file_path']} is gone")
+        _finish(entry)
+        return
+    except Exception as e:
+        entry['attempts'] += 1
+        entry['error'] = str(e)
+        if entry['attempts'] >= _max_attempts:
+            # Keep the local file needed, and keep trying, until storage is back
+            entry['status'] = 'failed'
+            delay = max(_retry_delay, MAX_RETRY_DELAY)
+            print(f"Upload for file {file_id} failed {entry['attempts']} times ({str(e)}), "
+                  f"retrying in {delay:.1f}s")
+        else:
+            delay = min(_retry_delay * 2 ** (entry['attempts'] - 1), max(_retry_delay, MAX_RETRY_DELAY))
+            print(f"Upload for file {file_id} failed ({str(e)}), retrying in {delay:.1f}s")
+        entry['next_attempt'] = time.time() + delay
+        _update_entry(entry)
+        return
+
+    print(f"Uploaded {entry['file_path']} for file {file_id}")
+    _finish(entry, file_url)
+
+def _append(entry):
+    """Append the bytes of an append entry to the stored file
+
+    Returns:
+        str: URL of the stored file, or None if it has to be uploaded in full
+    """
+    from app.utils.gcs_utils import append_file_to_gcs
+
+    try:
+        update = open(entry['update_path'], 'rb')
+    except FileNotFoundError:
+        return None
+    with update:
+        file_url = append_file_to_gcs(update, entry['file_id'], entry['file_extension'],
+                                      entry['original_filename'], entry['base_size'])
+    if file_url is None:
+        print(f"Stored file of {entry['file_id']} is not the one appended to, uploading it in full")
+    return file_url
+
+def _finish(entry, file_url=None):
+    """Remove a finished upload and point the document at the uploaded file
+
+    Both happen under the document's lock, so code that saves the document
+    sees either the upload still queued or the file in storage.
+    """
+    file_id = entry['file_id']
+    with document_lock(file_id):
+        current = _read_entry(file_id)
+        if current is None and file_url:
+            # The document was deleted while its file was being uploaded
+            from app.utils.gcs_utils import delete_file_from_gcs
+            print(f"Upload for file {file_id} was cancelled, deleting the uploaded file")
+            try:
+                delete_file_from_gcs(file_id, entry['file_extension'], entry['original_filename'])
+            except Exception as e:
+                print(f"Could not delete cancelled upload for file {file_id}: {str(e)}")
+            return
+        if current and current['version'] != entry['version']:
+            # A newer upload was queued meanwhile and carries the current file
+            return
+        cancel_upload(file_id)
+        if file_url:
+            get_document_store().update_document(file_id, {'file_url': file_url, 'download_url': file_url})
+
+def _claim_next():
+    """Take the lock of the next due upload
+
+    Returns:
+        tuple: The upload entry, its lock and 0, or None, None and the
+            seconds until the next upload is due
+    """
+    now = time.time()
+    wait = POLL_INTERVAL
+    for entry in sorted(_iter_entries(), key=lambda entry: entry['next_attempt']):
+        if entry['next_attempt'] > now:
+            wait = min(wait, entry['next_attempt'] - now)
+            break
+
+        file_id = entry['file_id']
+        lock = _try_lock(file_id)
+        if lock is None:
+            continue
+        # Read it again under the lock; it may have been replaced or finished
+        entry = _read_entry(file_id)
+        if entry and entry['next_attempt'] <= now:
+            return entry, lock, 0
+        _unlock(file_id, lock)
+    return None, None, wait
+
+def _work_loop():
+    while True:
+        wait = POLL_INTERVAL
+        try:
+            with _app.app_context():
+                entry, lock, wait = _claim_next()
+                if entry is not None:
+                    try:
+                        _run_upload(entry)
+                    finally:
+                        _unlock(entry['file_id'], lock)
+                    continue
+        except Exception as e:
+            print(f"Error in background uploader: {str(e)}")
+            print(traceback.format_exc())
+
+        with _wake:
+            _wake.wait(wait)
+
+def _ensure_workers():
+    """Start the upload workers in this process (again after a fork)"""
+    global _worker_pid
+
+    with _worker_lock:
+        if _worker_pid == os.getpid():
+            return
+        _worker_pid = os.getpid()
+
+    for i in range(_workers):
+        threading.Thread(target=_work_loop, name=f"gcs-upload-{i}", daemon=True).start()
+
+def _remove_update(entry):
+    if entry.get('update_path'):
+        try:
+            os.remove(entry['update_path'])
+        except FileNotFoundError:
+            pass
+
+def _entry_path(file_id):
+    return os.path.join(_queue_dir, f"{file_id}.json")
+
+def _read_entry(file_id):
+    try:
+        with open(_entry_path(file_id), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error reading queued upload {file_id}: {str(e)}")
+        return None
+
+def _iter_entries():
+    try:
+        filenames = os.listdir(_queue_dir)
+    except FileNotFoundError:
+        return
+    for filename in filenames:
+        if filename.endswith('.json'):
+            entry = _read_entry(filename[:-len('.json')])
+            if entry:
+                yield entry
+
+def _write_entry(entry):
+    """Atomically write an upload entry"""
+    path = _entry_path(entry['file_id'])
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(entry, f)
+    os.replace(temp_path, path)
+
+def _update_entry(entry):
+    """Save the outcome of an attempt, unless a newer upload replaced the entry"""
+    with document_lock(entry['file_id']):
+        current = _read_entry(entry['file_id'])
+        if current and current['version'] == entry['version']:
+            _write_entry(entry)
+
+def _try_lock(file_id):
+    """Take the run lock of an upload without waiting, or return None if it is held"""
+    if fcntl is None:
+        with _worker_lock:
+            if file_id in _claimed:
+                return None
+            _claimed.add(file_id)
+        return True
+
+    lock_path = os.path.join(_queue_dir, f"{file_id}.lock")
+    while True:
+        lock_file = open(lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return None
+
+        # _unlock may have removed the file after it was opened here; then
+        # this lock is on the removed file and another worker may lock a
+        # new one, so start over
+        try:
+            if os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                return lock_file
+        except FileNotFoundError:
+            pass
+        lock_file.close()
+
+def _unlock(file_id, lock):
+    if fcntl is None:
+        with _worker_lock:
+            _claimed.discard(file_id)
+        return
+
+    # Lock files of finished uploads are not needed any more. The file is
+    # removed while still locked, so _try_lock notices it was replaced
+    if not os.path.exists(_entry_path(file_id)):
+        try:
+            os.remove(lock.name)
+        except OSError:
+            pass
+    fcntl.flock(lock, fcntl.LOCK_UN)
+    lock.close()
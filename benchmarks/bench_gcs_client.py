@@ -0,0 +1,153 @@
+"""Benchmark a client per GCS call vs. the shared, pooled client
+
+Starts a local stand-in for the Cloud Storage JSON API (the client talks to
+it through STORAGE_EMULATOR_HOST) and times downloads and listings made the
+old way, with a new storage.Client() per call, against gcs_utils' shared
+client and bucket. The stand-in can delay the first response on every new
+connection to model the TLS handshake and round trips to the real
+endpoint, which is the part connection reuse saves.
+
+Usage:
+    python benchmarks/bench_gcs_client.py
+    python benchmarks/bench_gcs_client.py --calls 200 --threads 1 8 --handshake-ms 0 30
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, unquote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from google.cloud import storage
+from app.utils import gcs_utils
+from app.utils.storage_backends import get_storage_backend
+
+BUCKET = 'studyflow-bench'
+FILE_ID = 'bench'
+ORIGINAL_NAME = 'notes.pdf'
+BLOB_NAME = f"uploads/notes_{FILE_ID}.pdf"
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves one object (with byte ranges) and its listing over keep-alive HTTP/1.1"""
+    protocol_version = 'HTTP/1.1'
+    handshake_seconds = 0.0
+    payload = b''
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; don't let Nagle hold the body back
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        type(self).connections += 1
+        time.sleep(self.handshake_seconds)
+
+    def do_GET(self):
+        path = unquote(urlparse(self.path).path)
+        if path == f"/download/storage/v1/b/{BUCKET}/o/{BLOB_NAME}":
+            byte_range = self.headers.get('Range')
+            if byte_range:
+                start, end = byte_range.split('=', 1)[1].split('-')
+                end = int(end) if end else len(self.payload) - 1
+                body = self.payload[int(start):end + 1]
+                self._send(body, 'application/pdf', status=206,
+                           extra_headers={'Content-Range': f"bytes {start}-{end}/{len(self.payload)}"})
+            else:
+                self._send(self.payload, 'application/pdf')
+        elif path == f"/storage/v1/b/{BUCKET}/o":
+            listing = {'kind': 'storage#objects',
+                       'items': [{'name': BLOB_NAME, 'bucket': BUCKET, 'size': str(len(self.payload))}]}
+            self._send(json.dumps(listing).encode(), 'application/json')
+        else:
+            self._send(b'{}', 'application/json', status=404)
+
+    def _send(self, body, content_type, status=200, extra_headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        # Large bodies go out in slices so the stand-in doesn't copy them whole
+        view = memoryview(body)
+        for offset in range(0, len(body), 1024 * 1024):
+            self.wfile.write(view[offset:offset + 1024 * 1024])
+
+    def log_message(self, format, *args):
+        pass
+
+def download_new_client():
+    """The old way to read a blob: a new client, bucket and HTTP session per call"""
+    client = storage.Client()
+    return client.bucket(BUCKET).blob(BLOB_NAME).download_as_bytes()
+
+def download_shared_client():
+    return get_storage_backend().read(gcs_utils.get_blob_name(FILE_ID, 'pdf', ORIGINAL_NAME))
+
+def list_new_client():
+    client = storage.Client()
+    return [blob.name for blob in client.bucket(BUCKET).list_blobs(prefix='uploads/')]
+
+def list_shared_client():
+    return [blob.name for blob in gcs_utils.get_gcs_bucket().list_blobs(prefix='uploads/')]
+
+def time_calls(app, func, calls, threads):
+    """Return the mean latency of func in milliseconds and the connections it opened"""
+    def call(_):
+        with app.app_context():
+            start = time.perf_counter()
+            func()
+            return time.perf_counter() - start
+
+    before = StandInHandler.connections
+    # gcs_utils logs every download; keep the table readable
+    with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(call, range(calls)))
+    return sum(latencies) / len(latencies) * 1000, StandInHandler.connections - before
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=100)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--handshake-ms', type=float, nargs='+', default=[0, 20])
+    parser.add_argument('--size-kb', type=int, default=256)
+    args = parser.parse_args()
+
+    StandInHandler.payload = os.urandom(args.size_kb * 1024)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['STORAGE_EMULATOR_HOST'] = f"http://127.0.0.1:{server.server_address[1]}"
+
+    app = Flask(__name__)
+    app.config['GOOGLE_CLOUD_BUCKET'] = BUCKET
+    app.config['GCS_HTTP_POOL_SIZE'] = max(args.threads)
+
+    cases = [('download', download_new_client, download_shared_client),
+             ('list', list_new_client, list_shared_client)]
+
+    print(f"{'call':>8} {'handshake':>10} {'threads':>8} {'new ms':>8} {'shared ms':>10} "
+          f"{'saved ms':>9} {'new conns':>10} {'shared conns':>13}")
+    for handshake_ms in args.handshake_ms:
+        StandInHandler.handshake_seconds = handshake_ms / 1000
+        for threads in args.threads:
+            for name, new_client, shared_client in cases:
+                # Warm up, so the shared client and its connections already exist
+                time_calls(app, shared_client, threads, threads)
+                new_ms, new_conns = time_calls(app, new_client, args.calls, threads)
+                shared_ms, shared_conns = time_calls(app, shared_client, args.calls, threads)
+                print(f"{name:>8} {handshake_ms:>8.0f}ms {threads:>8} {new_ms:>8.2f} {shared_ms:>10.2f} "
+                      f"{new_ms - shared_ms:>9.2f} {new_conns:>10} {shared_conns:>13}")
+
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
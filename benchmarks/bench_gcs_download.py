@@ -0,0 +1,92 @@
+"""Benchmark peak memory of cold GCS downloads: bytes in memory vs. streaming
+
+Serves files of several sizes from the local Cloud Storage stand-in of
+bench_gcs_client.py and, in a fresh process per run, fetches each the old
+way (download_as_bytes, then writing the bytes to a temp file and to the
+upload cache, as get_summaries did) and with download_blob_to_file. Reports
+how far each pushed the process's peak RSS above its baseline.
+
+Usage:
+    python benchmarks/bench_gcs_download.py
+    python benchmarks/bench_gcs_download.py --sizes-mb 10 50 200
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_gcs_client import StandInHandler, BUCKET, BLOB_NAME
+
+def peak_rss_mb():
+    # On Linux ru_maxrss survives exec, so a spawned child would report the
+    # parent's peak; VmHWM belongs to the child's own address space
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+def run_download(mode, emulator_host, dest_dir, results):
+    """Download the stand-in's file once in this (fresh) process"""
+    os.environ['STORAGE_EMULATOR_HOST'] = emulator_host
+
+    from flask import Flask
+    from app.utils import gcs_utils
+
+    app = Flask(__name__)
+    app.config['GOOGLE_CLOUD_BUCKET'] = BUCKET
+    with app.app_context():
+        gcs_utils.get_gcs_bucket()
+        baseline = peak_rss_mb()
+        start = time.perf_counter()
+
+        if mode == 'bytes':
+            content = gcs_utils.get_gcs_bucket().blob(BLOB_NAME).download_as_bytes()
+            for name in ('temp_bench.pdf', 'bench.pdf'):
+                with open(os.path.join(dest_dir, name), 'wb') as f:
+                    f.write(content)
+            del content
+        else:
+            gcs_utils.download_blob_to_file(BLOB_NAME, os.path.join(dest_dir, 'bench.pdf'))
+
+        results.put((time.perf_counter() - start, peak_rss_mb() - baseline))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes-mb', type=int, nargs='+', default=[16, 64, 256])
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    emulator_host = f"http://127.0.0.1:{server.server_address[1]}"
+
+    context = multiprocessing.get_context('spawn')
+    print(f"{'size MB':>8} {'mode':>8} {'seconds':>8} {'peak RSS growth MB':>19}")
+    with tempfile.TemporaryDirectory() as dest_dir:
+        for size_mb in args.sizes_mb:
+            StandInHandler.payload = os.urandom(size_mb * 1024 * 1024)
+            for mode in ('bytes', 'stream'):
+                results = context.Queue()
+                process = context.Process(target=run_download, args=(mode, emulator_host, dest_dir, results))
+                process.start()
+                elapsed, growth = results.get()
+                process.join()
+                print(f"{size_mb:>8} {mode:>8} {elapsed:>8.2f} {growth:>19.1f}")
+
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Benchmark finding a document's local file: flat directory scans vs. the index
+
+Fills an upload folder with empty files named like uploads, once flat (as
+uploads used to be kept) and once sharded by ID prefix and recorded in the
+local file index. Times the old lookups (the os.listdir prefix scan of
+add-page and the glob of get_summaries) against find_local_file, for
+documents with and without a local file.
+
+Usage:
+    python benchmarks/bench_local_lookup.py
+    python benchmarks/bench_local_lookup.py --files 1000 10000 100000
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from app.utils.local_files import local_upload_path, register_local_file, find_local_file
+
+def best_time(fn, repeat):
+    """Return the best wall-clock time of fn in milliseconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, nargs='+', default=[1000, 10000, 50000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'files':>7} {'listdir ms':>11} {'glob ms':>9} {'index hit ms':>13} {'index miss ms':>14}")
+    for num_files in args.files:
+        with tempfile.TemporaryDirectory() as work_dir:
+            flat_dir = os.path.join(work_dir, 'flat')
+            os.makedirs(flat_dir)
+            app = Flask(__name__)
+            app.config['UPLOAD_FOLDER'] = os.path.join(work_dir, 'sharded')
+            app.config['LOCAL_FILE_INDEX_PATH'] = os.path.join(work_dir, 'local_files.sqlite3')
+
+            with app.app_context():
+                file_ids = [str(uuid.uuid4()) for _ in range(num_files)]
+                for file_id in file_ids:
+                    open(os.path.join(flat_dir, f"{file_id}.pdf"), 'w').close()
+                    path = local_upload_path(file_id, 'pdf')
+                    open(path, 'w').close()
+                    register_local_file(file_id, path)
+
+                target = file_ids[num_files // 2]
+                missing = str(uuid.uuid4())
+
+                listdir_ms = best_time(lambda: [f for f in os.listdir(flat_dir) if f.startswith(target)], args.repeat)
+                glob_ms = best_time(lambda: glob.glob(os.path.join(flat_dir, f"{target}.*")), args.repeat)
+                hit_ms = best_time(lambda: find_local_file(target), args.repeat)
+                miss_ms = best_time(lambda: find_local_file(missing), args.repeat)
+
+            print(f"{num_files:>7} {listdir_ms:>11.3f} {glob_ms:>9.3f} {hit_ms:>13.3f} {miss_ms:>14.3f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark OCR time per megapixel before and after preprocessing
+
+Generates synthetic phone-photo-sized images of notes and compares running
+Tesseract on the full-resolution image (the old process_image behaviour)
+against the OCR engine's NumPy preprocessing plus Tesseract. Preprocessing
+is timed on its own as well, so the script is still useful where Tesseract
+is not installed.
+
+Usage:
+    python benchmarks/bench_ocr.py
+    python benchmarks/bench_ocr.py --sizes 4032x3024 3000x2000 --images 8 --workers 1 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageDraw, ImageFilter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytesseract
+from app.utils.ocr_engine import find_tesseract, preprocess_image, ocr_images, DEFAULT_MAX_SIDE
+
+def write_synthetic_photo(path, width, height):
+    """Write a noisy, slightly blurred photo of lined notes
+
+    Args:
+        path (str): Destination path (JPEG)
+        width (int): Image width in pixels
+        height (int): Image height in pixels
+    """
+    paper = Image.new('RGB', (width, height), (236, 230, 214))
+    noise = Image.effect_noise((width, height), 40).convert('RGB')
+    image = Image.blend(paper, noise, 0.15)
+
+    draw = ImageDraw.Draw(image)
+    line_height = max(height // 40, 12)
+    for row, y in enumerate(range(line_height, height - line_height, line_height)):
+        draw.line([(0, y + line_height - 4), (width, y + line_height - 4)], fill=(170, 190, 220), width=2)
+        draw.text((width // 20, y), f"Note {row}: entropy measures the uncertainty of a random variable",
+                  fill=(30, 30, 60))
+
+    image.filter(ImageFilter.GaussianBlur(1)).save(path, quality=90)
+
+def parse_size(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=[(4032, 3024), (2048, 1536)])
+    parser.add_argument('--images', type=int, default=4)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 1])
+    parser.add_argument('--max-side', type=int, default=DEFAULT_MAX_SIDE)
+    args = parser.parse_args()
+
+    tesseract = find_tesseract()
+    rows = []
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for width, height in args.sizes:
+            megapixels = width * height / 1e6
+            paths = []
+            for n in range(args.images):
+                path = os.path.join(temp_dir, f"notes_{width}x{height}_{n}.jpg")
+                write_synthetic_photo(path, width, height)
+                paths.append(path)
+            total_mp = megapixels * len(paths)
+
+            start = time.perf_counter()
+            for path in paths:
+                with Image.open(path) as image:
+                    preprocess_image(image, args.max_side)
+            rows.append((f"{width}x{height}", 'preprocess only', 1,
+                         (time.perf_counter() - start) / total_mp))
+
+            if not tesseract:
+                continue
+
+            start = time.perf_counter()
+            for path in paths:
+                with Image.open(path) as image:
+                    pytesseract.image_to_string(image)
+            rows.append((f"{width}x{height}", 'before: full-res OCR', 1,
+                         (time.perf_counter() - start) / total_mp))
+
+            for workers in sorted(set(args.workers)):
+                ocr_images(paths[:1], workers, args.max_side)  # Warm up the pool
+                start = time.perf_counter()
+                ocr_images(paths, workers, args.max_side)
+                rows.append((f"{width}x{height}", 'after: preprocess + OCR', workers,
+                             (time.perf_counter() - start) / total_mp))
+
+    print()
+    if not tesseract:
+        print("Tesseract is not installed: only preprocessing was timed")
+    print(f"{'size':>10} {'mode':>24} {'workers':>8} {'s/MP':>8}")
+    for size, mode, workers, seconds_per_mp in rows:
+        print(f"{size:>10} {mode:>24} {workers:>8} {seconds_per_mp:>8.4f}")
+
+if __name__ == '__main__':
+    main()
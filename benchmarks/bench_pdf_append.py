@@ -0,0 +1,69 @@
+"""Benchmark adding a page to a PDF: full merge vs. incremental append
+
+For synthetic PDFs of several sizes, adds a one-page PDF the way add-page
+used to (PdfMerger rewriting the whole file, which was then uploaded in
+full) and with an incremental update appended to the file (of which only
+the update is uploaded). Reports the time taken and the bytes written
+locally and sent to storage by each.
+
+Usage:
+    python benchmarks/bench_pdf_append.py
+    python benchmarks/bench_pdf_append.py --pages 100 1000 5000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyPDF2 import PdfMerger, PdfReader
+from bench_pdf_extraction import write_synthetic_pdf
+from app.utils.pdf_append import write_incremental_append, append_update
+
+def merge(original_path, new_path):
+    merger = PdfMerger()
+    merger.append(original_path)
+    merger.append(new_path)
+    merger.write(original_path)
+    merger.close()
+    return os.path.getsize(original_path)
+
+def append(original_path, new_path):
+    update_path = f"{original_path}.update"
+    write_incremental_append(original_path, new_path, update_path)
+    append_update(original_path, update_path)
+    size = os.path.getsize(update_path)
+    os.remove(update_path)
+    return size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, nargs='+', default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    print(f"{'pages':>6} {'size MB':>8} {'mode':>7} {'seconds':>8} {'MB written/sent':>16}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        new_path = os.path.join(work_dir, 'new.pdf')
+        write_synthetic_pdf(new_path, 1)
+
+        for num_pages in args.pages:
+            source_path = os.path.join(work_dir, f"{num_pages}.pdf")
+            write_synthetic_pdf(source_path, num_pages)
+            size_mb = os.path.getsize(source_path) / (1024 * 1024)
+
+            for mode, add_page in (('merge', merge), ('append', append)):
+                path = os.path.join(work_dir, f"{mode}.pdf")
+                shutil.copyfile(source_path, path)
+
+                start = time.perf_counter()
+                written = add_page(path, new_path)
+                elapsed = time.perf_counter() - start
+
+                assert len(PdfReader(path).pages) == num_pages + 1
+                print(f"{num_pages:>6} {size_mb:>8.1f} {mode:>7} {elapsed:>8.3f} {written / (1024 * 1024):>16.3f}")
+
+if __name__ == '__main__':
+    main()
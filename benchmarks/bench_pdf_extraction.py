@@ -0,0 +1,109 @@
+"""Benchmark serial vs. parallel PDF text extraction
+
+Generates synthetic text-heavy PDFs and times process_pdf across a range of
+page counts and worker counts.
+
+Usage:
+    python benchmarks/bench_pdf_extraction.py
+    python benchmarks/bench_pdf_extraction.py --pages 50 200 500 --workers 1 2 4 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.file_processor import process_pdf
+
+LINES_PER_PAGE = 45
+
+def write_synthetic_pdf(path, num_pages):
+    """Write a PDF with num_pages pages of Helvetica text
+
+    Args:
+        path (str): Destination path
+        num_pages (int): Number of pages to generate
+    """
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    pages = add(None)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    page_ids = []
+    for n in range(num_pages):
+        lines = [f"({'Lecture %d line %d: the quick brown fox jumps over the lazy dog' % (n + 1, i)}) Tj T*"
+                 for i in range(LINES_PER_PAGE)]
+        content = ("BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(lines) + " ET").encode()
+        stream = add(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        page_ids.append(add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 842] "
+                            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+                            % (pages, font, stream)))
+
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages
+    objects[pages - 1] = (b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % p for p in page_ids)
+                          + b"] /Count %d >>" % num_pages)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+
+    with open(path, 'wb') as f:
+        f.write(out)
+
+def time_extraction(path, workers, repeat):
+    """Return the best wall-clock time of process_pdf over several runs"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process_pdf(path, workers=workers)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, nargs='+', default=[20, 100, 300])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    workers_list = sorted(set(args.workers))
+    results = []
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for num_pages in args.pages:
+            path = os.path.join(temp_dir, f"synthetic_{num_pages}.pdf")
+            write_synthetic_pdf(path, num_pages)
+
+            # Warm up the pool so process start-up is not counted
+            for workers in workers_list:
+                if workers > 1:
+                    process_pdf(path, workers=workers)
+
+            for workers in workers_list:
+                results.append((num_pages, workers, time_extraction(path, workers, args.repeat)))
+
+    print()
+    print(f"{'pages':>6} {'workers':>8} {'seconds':>9} {'ms/page':>8} {'speedup':>8}")
+    serial = {pages: t for pages, workers, t in results if workers == 1}
+    for num_pages, workers, elapsed in results:
+        speedup = serial[num_pages] / elapsed if num_pages in serial else float('nan')
+        print(f"{num_pages:>6} {workers:>8} {elapsed:>9.3f} {elapsed / num_pages * 1000:>8.2f} {speedup:>7.2f}x")
+
+if __name__ == '__main__':
+    main()
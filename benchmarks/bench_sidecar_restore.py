@@ -0,0 +1,66 @@
+"""Benchmark a cold load of a document: processing the upload vs. reading its sidecar
+
+For synthetic PDFs of several sizes, times what get_summaries did on a node
+without the processed document (download the upload and run process_pdf
+on it) against reading and decompressing the document's sidecar. Both go
+through the local storage backend, so only the work on the node is
+compared. Summaries, which processing loses and would have to be
+generated again, are not counted.
+
+Usage:
+    python benchmarks/bench_sidecar_restore.py
+    python benchmarks/bench_sidecar_restore.py --pages 10 100 500
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from bench_pdf_extraction import write_synthetic_pdf
+from app.utils.file_processor import process_pdf
+from app.utils.gcs_utils import download_blob_to_file
+from app.utils.storage_backends import get_storage_backend
+from app.utils.document_sidecars import save_document_sidecar, load_document_sidecar
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, nargs='+', default=[10, 100, 500])
+    args = parser.parse_args()
+
+    print(f"{'pages':>6} {'upload KB':>10} {'sidecar KB':>11} {'process s':>10} {'sidecar s':>10}")
+    for num_pages in args.pages:
+        with tempfile.TemporaryDirectory() as work_dir:
+            app = Flask(__name__)
+            app.config['STORAGE_BACKEND'] = 'local'
+            app.config['LOCAL_STORAGE_DIR'] = os.path.join(work_dir, 'storage')
+            app.config['PAGE_CACHE_MAX_BYTES'] = 0
+
+            with app.app_context():
+                source_path = os.path.join(work_dir, 'source.pdf')
+                write_synthetic_pdf(source_path, num_pages)
+                with open(source_path, 'rb') as f:
+                    get_storage_backend().upload(f, 'uploads/bench.pdf')
+                file_id = 'bench'
+                pages = process_pdf(source_path)
+                sidecar_size = save_document_sidecar(file_id, {'file_id': file_id, 'pages': pages})
+
+                local_path = os.path.join(work_dir, 'download.pdf')
+                start = time.perf_counter()
+                download_blob_to_file('uploads/bench.pdf', local_path)
+                process_pdf(local_path)
+                process_s = time.perf_counter() - start
+
+                start = time.perf_counter()
+                document = load_document_sidecar(file_id)
+                sidecar_s = time.perf_counter() - start
+                assert len(document['pages']) == num_pages
+
+            upload_kb = os.path.getsize(source_path) / 1024
+            print(f"{num_pages:>6} {upload_kb:>10.1f} {sidecar_size / 1024:>11.1f} {process_s:>10.3f} {sidecar_s:>10.4f}")
+
+if __name__ == '__main__':
+    main()
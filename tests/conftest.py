@@ -0,0 +1,72 @@
+import os
+import tempfile
+
+import pytest
+
+from app import create_app
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """An app whose directories all live under tmp_path, with local storage
+
+    Background writers (storage collector, manifest refresher, sidecars,
+    notes flusher) are off or slowed down, so tests drive them directly.
+    """
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    document_dir = tmp_path / 'studyflow'
+    settings = {
+        'DOCUMENT_DIR': document_dir,
+        'DOCUMENT_LOCK_DIR': document_dir / 'locks',
+        'DOCUMENT_STORE_BACKEND': 'json',
+        'UPLOAD_SESSION_DIR': document_dir / 'upload_sessions',
+        'PAGE_CACHE_DIR': document_dir / 'page_cache',
+        'UPLOAD_QUEUE_DIR': document_dir / 'upload_queue',
+        'SIDECAR_QUEUE_DIR': document_dir / 'sidecars',
+        'INGEST_JOURNAL_DIR': document_dir / 'jobs',
+        'STORAGE_BACKEND': 'local',
+        'LOCAL_STORAGE_DIR': tmp_path / 'storage',
+        'DOCUMENT_SIDECARS': 'false',
+        'STORAGE_GC_INTERVAL': 0,
+        'BUCKET_MANIFEST_REFRESH_INTERVAL': 0,
+        'NOTES_FLUSH_INTERVAL': 3600,
+    }
+    for name, value in settings.items():
+        monkeypatch.setenv(name, str(value))
+
+    app = create_app()
+    app.config.update(TESTING=True, UPLOAD_FOLDER=str(tmp_path / 'uploads'))
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    with app.app_context():
+        yield app
+
+@pytest.fixture
+def make_pdf():
+    """Return a function writing a PDF with one page of Helvetica text per string"""
+    def write(path, texts):
+        objects = [None, None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+        page_ids = []
+        for text in texts:
+            content = b"BT /F1 12 Tf 40 800 Td (%s) Tj ET" % text.encode()
+            objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+            objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                           b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+            page_ids.append(len(objects))
+        objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+        objects[1] = (b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % n for n in page_ids)
+                      + b"] /Count %d >>" % len(page_ids))
+
+        out = bytearray(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(len(out))
+            out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+        xref = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+        out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+        out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+        os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(out)
+        return str(path)
+    return write
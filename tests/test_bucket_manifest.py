@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.utils.bucket_manifest import lookup_file, query_manifest, record_upload
+
+START = datetime(2024, 3, 1, 12, 0, tzinfo=timezone.utc)
+
+@pytest.fixture
+def manifest(app):
+    """Record ten uploads, lecture0 to lecture9, an hour apart from START"""
+    for i in range(10):
+        record_upload(f"uploads/lecture{i}_file{i}.pdf", size=100 + i, created=START + timedelta(hours=i))
+
+def ids(files):
+    return [file_info['id'] for file_info in files]
+
+def test_cursor_pages_cover_every_file_once(manifest):
+    seen = []
+    cursor = None
+    while True:
+        files, cursor = query_manifest(3, cursor=cursor)
+        seen.extend(ids(files))
+        if cursor is None:
+            break
+
+    assert seen == [f"file{i}" for i in reversed(range(10))]
+
+def test_last_full_page_has_no_cursor(manifest):
+    files, cursor = query_manifest(10)
+    assert len(files) == 10 and cursor is None
+
+def test_invalid_cursor_is_rejected(manifest):
+    with pytest.raises(ValueError):
+        query_manifest(3, cursor='not-a-cursor')
+
+def test_date_filters_are_compared_in_utc(manifest):
+    # 15:00 UTC, given in a UTC+2 offset
+    files, _ = query_manifest(10, created_after='2024-03-01T17:00:00+02:00')
+    assert ids(files) == [f"file{i}" for i in range(9, 2, -1)]
+
+    # Naive times are taken as UTC; created_before excludes the file created at it
+    files, _ = query_manifest(10, created_after='2024-03-01T13:00:00', created_before='2024-03-01T16:00:00')
+    assert ids(files) == ['file3', 'file2', 'file1']
+
+    files, _ = query_manifest(10, created_before='2024-03-01')
+    assert files == []
+
+def test_filters_combine_with_pagination(manifest):
+    record_upload('uploads/other_extra.pdf', created=START + timedelta(hours=5, minutes=30))
+
+    files, cursor = query_manifest(2, prefix='LECTURE', created_before='2024-03-01T18:00:00Z')
+    assert ids(files) == ['file5', 'file4']
+    files, cursor = query_manifest(2, cursor=cursor, prefix='lecture', created_before='2024-03-01T18:00:00Z')
+    assert ids(files) == ['file3', 'file2']
+
+def test_invalid_date_is_rejected(app, manifest):
+    with pytest.raises(ValueError):
+        query_manifest(10, created_after='yesterday')
+
+    response = app.test_client().get('/api/files?created_after=yesterday')
+    assert response.status_code == 400
+
+def test_internal_fields_are_not_returned(manifest):
+    assert 'recorded' not in lookup_file('file1')
+    files, _ = query_manifest(10)
+    assert all('recorded' not in file_info for file_info in files)
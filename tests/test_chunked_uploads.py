@@ -0,0 +1,74 @@
+import hashlib
+import io
+
+import pytest
+
+from app.utils import chunked_uploads
+from app.utils.chunked_uploads import (UploadOffsetMismatch, append_chunk, create_upload_session,
+                                       finish_upload, get_upload_session)
+from app.utils.document_store import get_document_store
+from app.utils.ingestion_jobs import iter_finished_jobs
+
+def test_chunks_must_start_at_the_current_offset(app):
+    session = create_upload_session('notes.pdf', 10)
+
+    assert append_chunk(session, 0, io.BytesIO(b'abcd')) == 4
+    with pytest.raises(UploadOffsetMismatch) as excinfo:
+        append_chunk(session, 0, io.BytesIO(b'abcd'))
+    assert excinfo.value.expected == 4
+    assert get_upload_session(session['upload_id'])['offset'] == 4
+
+def test_oversized_chunk_is_rolled_back(app):
+    session = create_upload_session('notes.pdf', 6)
+    append_chunk(session, 0, io.BytesIO(b'abcd'))
+
+    with pytest.raises(ValueError):
+        append_chunk(session, 4, io.BytesIO(b'efgh'))
+    assert get_upload_session(session['upload_id'])['offset'] == 4
+
+    assert append_chunk(session, 4, io.BytesIO(b'ef')) == 6
+
+def test_resume_in_another_worker_hashes_whole_file(app, tmp_path):
+    data = bytes(range(256)) * 1000
+    session = create_upload_session('notes.pdf', len(data))
+    append_chunk(session, 0, io.BytesIO(data[:100000]))
+
+    # A worker that did not receive the first chunk has no running hash for it
+    chunked_uploads._hashers.clear()
+    session = get_upload_session(session['upload_id'])
+    assert append_chunk(session, session['offset'], io.BytesIO(data[100000:])) == len(data)
+
+    dest_path = tmp_path / 'done.pdf'
+    assert finish_upload(session, str(dest_path)) == hashlib.sha256(data).hexdigest()
+    assert dest_path.read_bytes() == data
+    assert get_upload_session(session['upload_id']) is None
+
+def test_chunked_upload_routes(app, make_pdf, tmp_path):
+    data = open(make_pdf(tmp_path / 'lecture.pdf', ['Only page']), 'rb').read()
+    client = app.test_client()
+
+    response = client.post('/api/uploads', json={'filename': 'lecture.pdf', 'size': len(data)})
+    assert response.status_code == 201
+    upload_id = response.get_json()['upload_id']
+    url = f"/api/uploads/{upload_id}"
+
+    response = client.patch(url, data=data[:100], headers={'Upload-Offset': '0'})
+    assert response.status_code == 200
+    assert response.headers['Upload-Offset'] == '100'
+
+    # A retried chunk is refused with the offset to resume from
+    response = client.patch(url, data=data[:100], headers={'Upload-Offset': '0'})
+    assert response.status_code == 409
+    assert response.get_json()['offset'] == 100
+
+    response = client.head(url)
+    assert response.headers['Upload-Offset'] == '100'
+    assert response.headers['Upload-Length'] == str(len(data))
+
+    response = client.patch(url, data=data[100:], headers={'Upload-Offset': '100'})
+    assert response.status_code == 202
+    assert client.get(url).status_code == 404
+
+    (job,) = iter_finished_jobs([response.get_json()['job_id']], poll_interval=0.05, timeout=30)
+    assert job['status'] == 'completed'
+    assert get_document_store().load(job['file_id'])['pages'][0]['text'].strip() == 'Only page'
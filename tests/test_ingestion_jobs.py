@@ -0,0 +1,80 @@
+import json
+import os
+import time
+
+from app.utils import ingestion_jobs
+from app.utils.document_store import get_document_store
+
+def write_interrupted_job(app, make_pdf, file_id, stages_done, status='running'):
+    """Journal a job as a worker that died part way through would have left it"""
+    file_path = make_pdf(os.path.join(app.config['UPLOAD_FOLDER'], f"{file_id}.pdf"),
+                         ['First page', 'Second page'])
+    now = time.time()
+    job = {
+        'job_id': f"job-{file_id}",
+        'file_id': file_id,
+        'filename': 'lecture.pdf',
+        'file_path': file_path,
+        'status': status,
+        'stages': [{'name': name, 'status': 'completed' if i < stages_done else 'pending'}
+                   for i, name in enumerate(ingestion_jobs.JOB_STAGES)],
+        'pages_done': 0,
+        'pages_total': None,
+        'file_url': None,
+        'copy_from': None,
+        'content_hash': None,
+        'summaries_copied': False,
+        'error': None,
+        'created': now,
+        'updated': now
+    }
+    if status == 'running' and stages_done < len(job['stages']):
+        job['stages'][stages_done]['status'] = 'running'
+    ingestion_jobs._write_job(job)
+    return job
+
+def wait_for(job_id):
+    (job,) = ingestion_jobs.iter_finished_jobs([job_id], poll_interval=0.05, timeout=30)
+    return job
+
+def test_recover_resumes_interrupted_extraction(app, make_pdf):
+    job = write_interrupted_job(app, make_pdf, 'doc1', stages_done=2)
+
+    assert ingestion_jobs.recover_jobs() == 1
+    finished = wait_for(job['job_id'])
+
+    assert finished['status'] == 'completed'
+    assert [stage['status'] for stage in finished['stages']] == ['completed'] * 4
+    data = get_document_store().load('doc1')
+    assert [page['text'].strip() for page in data['pages']] == ['First page', 'Second page']
+    assert not os.path.exists(ingestion_jobs._result_path(job['job_id']))
+
+def test_recover_stores_journaled_result_without_extracting_again(app, make_pdf):
+    job = write_interrupted_job(app, make_pdf, 'doc2', stages_done=3)
+    with open(ingestion_jobs._result_path(job['job_id']), 'w') as f:
+        json.dump({'pages': [{'page_number': 1, 'text': 'from the journal', 'notes': ''}]}, f)
+
+    assert ingestion_jobs.recover_jobs() == 1
+    assert wait_for(job['job_id'])['status'] == 'completed'
+
+    data = get_document_store().load('doc2')
+    assert [page['text'] for page in data['pages']] == ['from the journal']
+
+def test_recover_skips_jobs_locked_by_a_live_worker(app, make_pdf):
+    job = write_interrupted_job(app, make_pdf, 'doc3', stages_done=2)
+
+    lock_file = ingestion_jobs._acquire_job_lock(job['job_id'])
+    try:
+        assert ingestion_jobs.recover_jobs() == 0
+    finally:
+        ingestion_jobs._release_job_lock(job['job_id'], lock_file)
+
+    assert ingestion_jobs.recover_jobs() == 1
+    assert wait_for(job['job_id'])['status'] == 'completed'
+
+def test_recover_ignores_finished_jobs(app, make_pdf):
+    write_interrupted_job(app, make_pdf, 'doc4', stages_done=4, status='completed')
+    failed = write_interrupted_job(app, make_pdf, 'doc5', stages_done=1, status='failed')
+
+    assert ingestion_jobs.recover_jobs() == 0
+    assert ingestion_jobs.get_job(failed['job_id'])['status'] == 'failed'
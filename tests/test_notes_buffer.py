@@ -0,0 +1,46 @@
+import pytest
+
+from app.utils import notes_buffer
+from app.utils.document_store import get_document_store
+
+@pytest.fixture
+def document(app):
+    store = get_document_store()
+    pages = [{'page_number': n, 'text': f"page {n}", 'notes': ''} for n in range(1, 6)]
+    assert store.save('doc1', {'file_id': 'doc1', 'pages': pages})
+    yield store
+    notes_buffer.discard_notes('doc1')
+
+def test_renumber_moves_notes_past_later_removals():
+    pending = {(0, 1): 'one', (0, 2): 'two', (0, 4): 'four', (1, 4): 'five'}
+
+    # Page 2 was removed, then page 3 (which was page 4 when the first notes were saved)
+    assert notes_buffer._renumber(pending, [2, 3]) == {1: 'one', 3: 'five'}
+
+def test_renumber_last_save_wins_on_the_same_page():
+    pending = {(0, 3): 'old', (1, 2): 'new'}
+    assert notes_buffer._renumber(pending, [1]) == {2: 'new'}
+
+def test_pending_notes_follow_removed_pages(document):
+    notes_buffer.buffer_notes('doc1', 2, 'on two')
+    notes_buffer.buffer_notes('doc1', 4, 'on four')
+    assert notes_buffer.get_pending_notes('doc1') == {2: 'on two', 4: 'on four'}
+
+    assert document.remove_page('doc1', 2)
+    removed_pages = document.load('doc1', include_text=False)['removed_pages']
+    assert notes_buffer.get_pending_notes('doc1', removed_pages) == {3: 'on four'}
+
+def test_flush_saves_notes_on_renumbered_pages(document):
+    notes_buffer.buffer_notes('doc1', 1, 'on one')
+    notes_buffer.buffer_notes('doc1', 3, 'removed with its page')
+    notes_buffer.buffer_notes('doc1', 5, 'on five')
+    assert document.remove_page('doc1', 3)
+    # Saved after the removal, so already numbered for it
+    notes_buffer.buffer_notes('doc1', 2, 'on two', removals=1)
+
+    assert notes_buffer.flush_notes('doc1') == 3
+
+    pages = document.load('doc1')['pages']
+    assert [(page['text'], page['notes']) for page in pages] == [
+        ('page 1', 'on one'), ('page 2', 'on two'), ('page 4', ''), ('page 5', 'on five')]
+    assert notes_buffer.get_pending_notes('doc1') == {}
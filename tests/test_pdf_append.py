@@ -0,0 +1,97 @@
+import os
+import re
+
+import pytest
+from PyPDF2 import PdfReader
+
+from app.api.routes import _discard_pdf_add, _prepare_pdf_add
+from app.utils.local_files import local_upload_path, register_local_file
+from app.utils.pdf_append import IncrementalAppendUnsupported, append_update, write_incremental_append
+
+def page_texts(path):
+    return [page.extract_text().strip() for page in PdfReader(str(path)).pages]
+
+def use_xref_stream(path):
+    """Rewrite a PDF written by make_pdf to end in a cross-reference stream"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    body = data[:data.rindex(b'xref')]
+    offsets = [match.start() for match in re.finditer(rb'(?m)^\d+ 0 obj', body)]
+
+    number = len(offsets) + 1
+    rows = b'\x00\x00\x00\xff' + b''.join(b'\x01' + offset.to_bytes(2, 'big') + b'\x00'
+                                          for offset in offsets + [len(body)])
+    xref = (b"%d 0 obj\n<< /Type /XRef /Size %d /Root 1 0 R /W [1 2 1] /Length %d >>\nstream\n"
+            % (number, number + 1, len(rows)) + rows + b"\nendstream\nendobj\n")
+    with open(path, 'wb') as f:
+        f.write(body + xref + b"startxref\n%d\n%%%%EOF\n" % len(body))
+
+def test_incremental_append_keeps_original_bytes(make_pdf, tmp_path):
+    original = make_pdf(tmp_path / 'original.pdf', ['Page one', 'Page two'])
+    new = make_pdf(tmp_path / 'new.pdf', ['Page three'])
+    original_bytes = open(original, 'rb').read()
+
+    update = str(tmp_path / 'update.bin')
+    assert write_incremental_append(original, new, update) == 1
+    append_update(original, update)
+
+    appended = open(original, 'rb').read()
+    assert appended.startswith(original_bytes)
+    assert len(appended) == len(original_bytes) + os.path.getsize(update)
+    assert page_texts(original) == ['Page one', 'Page two', 'Page three']
+
+def test_incremental_append_twice(make_pdf, tmp_path):
+    original = make_pdf(tmp_path / 'original.pdf', ['Page one'])
+    for i, text in enumerate(['Page two', 'Page three']):
+        new = make_pdf(tmp_path / f"new{i}.pdf", [text])
+        update = str(tmp_path / f"update{i}.bin")
+        write_incremental_append(original, new, update)
+        append_update(original, update)
+
+    assert page_texts(original) == ['Page one', 'Page two', 'Page three']
+
+def test_xref_stream_original_is_unsupported(make_pdf, tmp_path):
+    original = make_pdf(tmp_path / 'original.pdf', ['Page one'])
+    use_xref_stream(original)
+    assert page_texts(original) == ['Page one']
+
+    new = make_pdf(tmp_path / 'new.pdf', ['Page two'])
+    with pytest.raises(IncrementalAppendUnsupported):
+        write_incremental_append(original, new, str(tmp_path / 'update.bin'))
+
+def test_failed_append_truncates_original(make_pdf, tmp_path, monkeypatch):
+    original = make_pdf(tmp_path / 'original.pdf', ['Page one'])
+    new = make_pdf(tmp_path / 'new.pdf', ['Page two'])
+    original_bytes = open(original, 'rb').read()
+    update = str(tmp_path / 'update.bin')
+    write_incremental_append(original, new, update)
+
+    def fail_fsync(fd):
+        raise OSError("disk full")
+    monkeypatch.setattr(os, 'fsync', fail_fsync)
+
+    with pytest.raises(OSError):
+        append_update(original, update)
+    assert open(original, 'rb').read() == original_bytes
+
+@pytest.mark.parametrize('xref_stream', [False, True])
+def test_adding_pages_falls_back_to_merging(app, make_pdf, tmp_path, xref_stream):
+    document_path = make_pdf(local_upload_path('doc1', 'pdf'), ['Page one'])
+    if xref_stream:
+        use_xref_stream(document_path)
+    register_local_file('doc1', document_path)
+    original_bytes = open(document_path, 'rb').read()
+    new = make_pdf(tmp_path / 'new.pdf', ['Page two'])
+
+    plan = _prepare_pdf_add('doc1', {'file_type': 'pdf'}, new)
+    try:
+        if xref_stream:
+            assert plan['update_path'] is None
+            assert page_texts(plan['merged_temp_path']) == ['Page one', 'Page two']
+        else:
+            assert plan['merged_temp_path'] is None
+            assert os.path.exists(plan['update_path'])
+        # Nothing the document uses changes until the plan is applied
+        assert open(document_path, 'rb').read() == original_bytes
+    finally:
+        _discard_pdf_add(plan)
@@ -0,0 +1,31 @@
+from app.utils.document_store import DocumentStore
+from app.utils.sqlite_document_store import SqliteDocumentStore, migrate_json_documents
+
+def test_migration_imports_sharded_page_text(tmp_path):
+    json_dir = str(tmp_path / 'json')
+    json_store = DocumentStore(json_dir)
+    pages = [{'page_number': 1, 'text': 'hello world ' * 10, 'summary': 'Greeting', 'notes': 'n1'},
+             {'page_number': 2, 'text': '', 'notes': ''}]
+    assert json_store.save('doc1', {'file_id': 'doc1', 'filename': 'a.pdf', 'pages': pages})
+
+    store = SqliteDocumentStore(str(tmp_path / 'documents.sqlite3'))
+    assert migrate_json_documents(json_dir, store) == (1, 0, 0)
+
+    data = store.load('doc1')
+    assert data['filename'] == 'a.pdf'
+    assert [page['text'] for page in data['pages']] == ['hello world ' * 10, '']
+    assert data['pages'][0]['summary'] == 'Greeting'
+    assert data['pages'][0]['notes'] == 'n1'
+    for page in data['pages']:
+        assert 'text_ref' not in page and 'text_preview' not in page
+
+def test_migration_reads_inline_text_and_skips_other_json(tmp_path):
+    json_dir = tmp_path / 'json'
+    json_dir.mkdir()
+    (json_dir / 'legacy.json').write_text('{"pages": [{"page_number": 1, "text": "inline"}]}')
+    (json_dir / 'job.json').write_text('{"status": "completed"}')
+
+    store = SqliteDocumentStore(str(tmp_path / 'documents.sqlite3'))
+    assert migrate_json_documents(str(json_dir), store) == (1, 1, 0)
+    assert store.load('legacy')['pages'][0]['text'] == 'inline'
+    assert migrate_json_documents(str(json_dir), store) == (0, 2, 0)
@@ -0,0 +1,85 @@
+import os
+import time
+
+import pytest
+
+from app.utils import upload_queue
+from app.utils.document_store import get_document_store
+from app.utils.local_files import local_upload_path, register_local_file
+from app.utils.storage_gc import collect_garbage
+
+CLOUD_URL = 'https://storage.googleapis.com/bucket/uploads/lecture.pdf'
+
+def add_document(file_id, **fields):
+    """Store a document with a local copy of its PDF, returning the copy's path"""
+    path = local_upload_path(file_id, 'pdf')
+    with open(path, 'wb') as f:
+        f.write(b'%PDF-1.4\n' + b'x' * 1000)
+    register_local_file(file_id, path)
+    assert get_document_store().save(file_id, dict({'file_id': file_id, 'file_type': 'pdf', 'pages': []}, **fields))
+    return path
+
+def queue_failed_upload(file_id, path):
+    """Record an upload that failed and is not due again during the test"""
+    now = time.time()
+    upload_queue._write_entry({
+        'file_id': file_id, 'version': 'v1', 'file_path': os.path.abspath(path), 'file_extension': 'pdf',
+        'original_filename': None, 'update_path': None, 'base_size': None, 'status': 'failed',
+        'attempts': 5, 'next_attempt': now + 3600, 'error': 'Service unavailable', 'queued': now
+    })
+
+@pytest.fixture
+def over_budget(app):
+    app.config.update(STORAGE_MAX_BYTES=1, STORAGE_TTL=7 * 24 * 60 * 60)
+
+def test_evicts_copies_of_documents_in_the_cloud(over_budget):
+    path = add_document('cloud', file_url=CLOUD_URL)
+
+    report = collect_garbage()
+    assert not os.path.exists(path)
+    assert report['removed']['evicted_copies']['files'] == 1
+
+def test_keeps_copies_only_stored_locally(over_budget):
+    path = add_document('local', file_url='/static/uploads/lo/local.pdf')
+
+    report = collect_garbage()
+    assert os.path.exists(path)
+    assert report['over_budget']
+
+def test_keeps_copies_with_a_pending_upload(over_budget):
+    # The stored copy is older than the local one, which still has to be uploaded
+    path = add_document('pending', file_url=CLOUD_URL)
+    queue_failed_upload('pending', path)
+    try:
+        collect_garbage()
+        assert os.path.exists(path)
+    finally:
+        upload_queue.cancel_upload('pending')
+
+def test_keeps_source_of_lazy_document(over_budget):
+    path = add_document('lazy', file_url=CLOUD_URL, lazy=True, total_pages=500)
+    assert get_document_store().update_document('lazy', {'source_path': path})
+
+    collect_garbage()
+    assert os.path.exists(path)
+
+    # Once every page is extracted the copy is no longer read
+    assert get_document_store().update_document('lazy', {'lazy': False})
+    collect_garbage()
+    assert not os.path.exists(path)
+
+def test_expired_copies_go_regardless_of_budget(app):
+    app.config.update(STORAGE_MAX_BYTES=0, STORAGE_TTL=3600)
+    expired = add_document('expired', file_url=CLOUD_URL)
+    kept = add_document('queued', file_url=CLOUD_URL)
+    queue_failed_upload('queued', kept)
+    last_used = time.time() - 7200
+    for path in (expired, kept):
+        os.utime(path, (last_used, last_used))
+    try:
+        report = collect_garbage()
+        assert not os.path.exists(expired)
+        assert os.path.exists(kept)
+        assert report['removed']['expired_copies']['files'] == 1
+    finally:
+        upload_queue.cancel_upload('queued')